@@ -0,0 +1,321 @@
+import argparse
+import contextlib
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from bot_loader import load_bot
+
+SCAN_CHUNK = 1 << 16  # 每次向量化扫描的价格数量
+SIDE_PARAMS = ("enabled", "position", "trigger_price", "grid_percentage", "grid_size", "max_position",
+               "ladder_levels")  # 单个方向的网格参数，不带前缀时多空两个方向都覆盖
+RUN_PARAMS = ("inst_id", "tick_size", "ct_val", "amend", "fee_rate")  # 合约规格和回测参数
+
+
+def candles_to_ticks(timestamps, opens, highs, lows, closes):
+    """K 线展开为价格路径: 阳线 开->低->高->收，阴线 开->高->低->收"""
+    rising = closes >= opens
+    second = np.where(rising, lows, highs)
+    third = np.where(rising, highs, lows)
+    prices = np.stack([opens, second, third, closes], axis=1).reshape(-1)
+    return np.repeat(timestamps, 4), prices
+
+
+@lru_cache(maxsize=4)
+def load_prices(path, data_format="trades"):
+    """读取历史数据，返回 (时间戳毫秒, 价格)
+    trades: 每行 时间戳,价格[,数量...]
+    candles: 每行 时间戳,开,高,低,收[,...]
+    """
+    with open(path) as f:
+        has_header = not f.readline().split(",")[0].strip().lstrip("-").isdigit()
+    columns = (0, 1) if data_format == "trades" else (0, 1, 2, 3, 4)
+    data = np.loadtxt(path, delimiter=",", skiprows=int(has_header), usecols=columns, ndmin=2)
+    order = np.argsort(data[:, 0], kind="stable")
+    data = data[order]
+    timestamps = data[:, 0].astype(np.int64)
+    if data_format == "trades":
+        return timestamps, np.ascontiguousarray(data[:, 1])
+    return candles_to_ticks(timestamps, data[:, 1], data[:, 2], data[:, 3], data[:, 4])
+
+
+@lru_cache(maxsize=4)
+def synthetic_prices(count, start_price, volatility, seed):
+    """生成随机游走价格，用于快速验证参数"""
+    rng = np.random.default_rng(seed)
+    prices = start_price * np.exp(np.cumsum(rng.normal(0, volatility, count)))
+    timestamps = np.arange(count, dtype=np.int64) * 100 + 1_700_000_000_000
+    return timestamps, prices
+
+
+class NullLog:
+    """回测不落盘的订单日志"""
+    line_count = 0
+
+    def append(self, record):
+        pass
+
+    def compact(self, snapshot):
+        pass
+
+    def close(self):
+        pass
+
+
+class Ledger:
+    """单个方向的持仓、均价和盈亏"""
+
+    def __init__(self, pos_side, position, entry_price):
+        self.pos_side = pos_side
+        self.position = position
+        self.avg_price = entry_price
+        self.realized = 0.0
+        self.fees = 0.0
+        self.fills = 0
+        self.max_position = position
+
+    def fill(self, side, price, size, fee_rate):
+        self.fills += 1
+        self.fees += price * size * fee_rate
+        opening = (side == "buy") == (self.pos_side == "long")
+        if opening:
+            self.avg_price = (self.avg_price * self.position + price * size) / (self.position + size)
+            self.position += size
+            self.max_position = max(self.max_position, self.position)
+        else:
+            size = min(size, self.position)
+            direction = 1 if self.pos_side == "long" else -1
+            self.realized += (price - self.avg_price) * size * direction
+            self.position -= size
+
+    def unrealized(self, price):
+        direction = 1 if self.pos_side == "long" else -1
+        return (price - self.avg_price) * self.position * direction
+
+
+class SimExchange:
+    """模拟撮合引擎
+    挂单保存在机器人的本地挂单簿中，网格逻辑与实盘相同；价格穿越挂单价时按挂单价成交
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.ord_ids = itertools.count(1)
+
+    def execute(self, batch):
+        """执行 OrderBatch，代替实盘的 flush"""
+        book = self.bot.open_order_book
+        for ord_id, _ in batch.cancels:
+            self.close_order(ord_id)
+        for order, order_data in batch.amends:
+            book.apply_amend(order["ordId"], order_data)
+        for order_data in batch.places:
+            ord_id = str(next(self.ord_ids))
+            self.bot.record_placed_order(order_data, ord_id)
+        batch.cancels, batch.amends, batch.places = [], [], []
+
+    def close_order(self, ord_id):
+        self.bot.open_order_book.orders.pop(ord_id, None)
+        self.bot.order_registry.orders.pop(ord_id, None)
+
+    def next_fill(self, prices, start):
+        """从 start 开始向量化查找第一个被穿越的挂单，返回 (价格下标, 挂单) 或 None"""
+        orders = self.bot.open_order_book.orders.values()
+        buys = [order for order in orders if order["side"] == "buy"]
+        sells = [order for order in orders if order["side"] == "sell"]
+        best_buy = max(buys, key=lambda order: float(order["px"])) if buys else None
+        best_sell = min(sells, key=lambda order: float(order["px"])) if sells else None
+        if best_buy is None and best_sell is None:
+            return None
+        buy_price = float(best_buy["px"]) if best_buy else -np.inf
+        sell_price = float(best_sell["px"]) if best_sell else np.inf
+        for offset in range(start, len(prices), SCAN_CHUNK):
+            segment = prices[offset:offset + SCAN_CHUNK]
+            crossed = (segment <= buy_price) | (segment >= sell_price)
+            index = int(np.argmax(crossed))
+            if crossed[index]:
+                price = segment[index]
+                return offset + index, best_buy if price <= buy_price else best_sell
+        return None
+
+
+def normalize_key(key):
+    """参数名统一为 name 或 long.name / short.name，也接受机器人配置中的写法(如 long_grid_percentage)
+    未知参数报错，避免拼错的参数被静默忽略、跑出与默认参数相同的结果
+    """
+    pos_side, _, name = key.rpartition(".")
+    if not pos_side:
+        for side in ("long", "short"):
+            if key.startswith(side + "_") and key[len(side) + 1:] in SIDE_PARAMS:
+                pos_side, name = side, key[len(side) + 1:]
+    if pos_side in ("long", "short") and name in SIDE_PARAMS:
+        return f"{pos_side}.{name}"
+    if not pos_side and name in SIDE_PARAMS + RUN_PARAMS:
+        return name
+    raise ValueError(f"未知参数: {key}，可用参数: {', '.join(RUN_PARAMS + SIDE_PARAMS)}"
+                     f"(网格参数可加 long. / short. 前缀只覆盖一个方向)")
+
+
+def build_grid_config(bot, params):
+    """以机器人当前配置为基础，按参数覆盖生成网格配置，参数名不存在时报 ValueError"""
+    config = {
+        "inst_id": params.get("inst_id", bot.DEFAULT_INST_ID),
+        "tick_size": params.get("tick_size", bot.DEFAULT_TICK_SIZE),
+        "ct_val": params.get("ct_val", bot.DEFAULT_CT_VAL),
+        "long": {"enabled": bot.enable_long_grid, "position": bot.long_position,
+                 "trigger_price": bot.long_trigger_price, "grid_percentage": bot.long_grid_percentage,
+                 "grid_size": bot.long_grid_size, "max_position": bot.long_max_position,
+                 "ladder_levels": bot.long_ladder_levels},
+        "short": {"enabled": bot.enable_short_grid, "position": bot.short_position,
+                  "trigger_price": bot.short_trigger_price, "grid_percentage": bot.short_grid_percentage,
+                  "grid_size": bot.short_grid_size, "max_position": bot.short_max_position,
+                  "ladder_levels": bot.short_ladder_levels},
+    }
+    for key, value in params.items():
+        pos_side, _, name = normalize_key(key).rpartition(".")
+        if name in RUN_PARAMS:
+            continue
+        for side in ([pos_side] if pos_side else ["long", "short"]):
+            config[side][name] = value
+    return config
+
+
+def run_backtest(params, data):
+    """运行一次回测，返回统计结果
+    params: 网格参数覆盖，如 {"grid_percentage": 0.006, "long.grid_size": 0.002}
+    data: ("file", 路径, 格式) 或 ("synthetic", 数量, 起始价, 波动率, 种子)
+    """
+    bot = load_bot()
+    timestamps, prices = load_prices(*data[1:]) if data[0] == "file" else synthetic_prices(*data[1:])
+
+    # 每次回测重置机器人的全部状态，网格逻辑直接复用实盘代码
+    bot.enable_amend_mode = params.get("amend", False)
+    config = build_grid_config(bot, {"long.trigger_price": float(prices[0]), "short.trigger_price": float(prices[0]),
+                                     **params})
+    grid = bot.GridState.from_config(config)
+    bot.grids = {grid.inst_id: grid}
+    bot.account_state = bot.AccountState()
+    bot.order_registry = bot.OrderRegistry()
+    bot.order_registry.store = NullLog()
+    # 回测只统计结果，成交日志不写出
+    bot.log = bot.EventLog(path="", level="error", console=False)
+    bot.open_order_book = bot.OpenOrderBook(bot.order_registry)
+    fee_rate = params.get("fee_rate", 0.0002)
+    ledgers = {}
+    for pos_side, grid_side in grid.sides.items():
+        bot.account_state.set_position(grid.inst_id, pos_side, grid_side.position)
+        ledgers[pos_side] = Ledger(pos_side, grid_side.position, grid_side.trigger_price)
+
+    exchange = SimExchange(bot)
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        batch = bot.OrderBatch()
+        bot.plan_initial_orders(batch, grid)
+        exchange.execute(batch)
+        cursor = 0
+        while True:
+            hit = exchange.next_fill(prices, cursor)
+            if hit is None:
+                break
+            cursor, order = hit
+            exchange.close_order(order["ordId"])
+            price = float(order["px"])
+            size = float(order["sz"]) * grid.ct_val
+            ledgers[order["posSide"]].fill(order["side"], price, size, fee_rate)
+            batch, _ = bot.plan_grid_step(grid, order["posSide"], order["side"], price, size, int(timestamps[cursor]))
+            if batch is not None:
+                exchange.execute(batch)
+    elapsed = time.perf_counter() - started
+
+    last_price = float(prices[-1])
+    realized = sum(ledger.realized for ledger in ledgers.values())
+    unrealized = sum(ledger.unrealized(last_price) for ledger in ledgers.values())
+    fees = sum(ledger.fees for ledger in ledgers.values())
+    return {
+        "params": params,
+        "ticks": len(prices),
+        "elapsed": elapsed,
+        "fills": sum(ledger.fills for ledger in ledgers.values()),
+        "realized": realized,
+        "unrealized": unrealized,
+        "fees": fees,
+        "pnl": realized + unrealized - fees,
+        "take_profit": {pos_side: grid_side.take_profit_count for pos_side, grid_side in grid.sides.items()},
+        "max_position": {pos_side: ledger.max_position for pos_side, ledger in ledgers.items()},
+        "final_position": {pos_side: ledger.position for pos_side, ledger in ledgers.items()},
+    }
+
+
+def parse_value(value):
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def build_sweep(base, sweeps):
+    """--sweep key=v1,v2 的笛卡尔积"""
+    keys = [normalize_key(sweep.split("=", 1)[0]) for sweep in sweeps]
+    values = [[parse_value(v) for v in sweep.split("=", 1)[1].split(",")] for sweep in sweeps]
+    return [{**base, **dict(zip(keys, combo))} for combo in itertools.product(*values)]
+
+
+def print_result(result):
+    params = " ".join(f"{k}={v}" for k, v in result["params"].items()) or "默认参数"
+    print(f"📊 {params}")
+    print(f"  • 总盈亏: {result['pnl']:.2f} USDT (已实现 {result['realized']:.2f} / 未实现 "
+          f"{result['unrealized']:.2f} / 手续费 {result['fees']:.2f})")
+    print(f"  • 成交次数: {result['fills']}  止盈次数: 多 {result['take_profit']['long']} / 空 "
+          f"{result['take_profit']['short']}")
+    print(f"  • 最大持仓: 多 {result['max_position']['long']:.4f} / 空 {result['max_position']['short']:.4f}  "
+          f"期末持仓: 多 {result['final_position']['long']:.4f} / 空 {result['final_position']['short']:.4f}")
+    print(f"  • 回放 {result['ticks']} 个价格，耗时 {result['elapsed']:.2f}s "
+          f"({result['ticks'] / max(result['elapsed'], 1e-9):,.0f} 个/秒)\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网格策略离线回测，复用机器人的网格逻辑")
+    parser.add_argument("data", nargs="?", help="历史成交或 K 线 CSV 文件")
+    parser.add_argument("--format", choices=["trades", "candles"], default="trades")
+    parser.add_argument("--synthetic", type=int, default=0, help="不读文件，生成指定数量的随机游走价格")
+    parser.add_argument("--start-price", type=float, default=85000)
+    parser.add_argument("--volatility", type=float, default=0.0002, help="随机游走每步波动率")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖网格参数，如 grid_percentage=0.006、long.max_position=0.02(或 long_max_position=0.02)、"
+                             "amend=true")
+    parser.add_argument("--sweep", action="append", default=[], metavar="KEY=V1,V2",
+                        help="参数扫描，多个 --sweep 取笛卡尔积")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="参数扫描的进程数")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data = ("synthetic", args.synthetic, args.start_price, args.volatility, args.seed)
+    elif args.data:
+        data = ("file", args.data, args.format)
+    else:
+        parser.error("需要指定数据文件或 --synthetic")
+
+    try:
+        base = {normalize_key(key): parse_value(value) for key, value in (item.split("=", 1) for item in args.set)}
+        runs = build_sweep(base, args.sweep) if args.sweep else [base]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(runs) == 1:
+        print_result(run_backtest(runs[0], data))
+        return
+    print(f"🔍 参数扫描: {len(runs)} 组参数，{args.workers} 个进程\n")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(run_backtest, runs, itertools.repeat(data)))
+    for result in sorted(results, key=lambda result: result["pnl"], reverse=True):
+        print_result(result)
+
+
+if __name__ == "__main__":
+    main()
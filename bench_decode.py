@@ -0,0 +1,124 @@
+import argparse
+import json
+import random
+import time
+
+from bot_loader import load_bot
+
+bot = load_bot()
+
+GRID_INST_IDS = ["BTC-USDT-SWAP", "ETH-USDT-SWAP"]
+OTHER_INST_IDS = ["SOL-USDT-SWAP", "DOGE-USDT-SWAP", "XRP-USDT-SWAP"]
+
+
+def build_order(inst_id, rng, state):
+    """与 OKX orders 频道字段一致的订单推送"""
+    px = f"{rng.uniform(80000, 90000):.1f}"
+    filled = state == "filled"
+    u_time = str(1700000000000 + rng.randrange(10 ** 9))
+    return {
+        "instType": "SWAP", "instId": inst_id, "tgtCcy": "", "ccy": "", "ordId": str(rng.randrange(10 ** 18)),
+        "clOrdId": f"bench{rng.randrange(10 ** 6)}", "tag": "", "px": px, "pxUsd": "", "pxVol": "", "pxType": "",
+        "sz": "0.2", "notionalUsd": "17000", "ordType": "limit", "side": rng.choice(["buy", "sell"]),
+        "posSide": rng.choice(["long", "short"]), "tdMode": "cross", "accFillSz": "0.2" if filled else "0",
+        "fillNotionalUsd": "", "avgPx": px if filled else "0", "state": state, "lever": "10", "attachAlgoClOrdId": "",
+        "tpTriggerPx": "", "tpTriggerPxType": "", "tpOrdPx": "", "slTriggerPx": "", "slTriggerPxType": "",
+        "slOrdPx": "", "feeCcy": "USDT", "fee": "-0.0034" if filled else "0", "rebateCcy": "USDT", "rebate": "0",
+        "pnl": "0", "source": "", "cancelSource": "", "amendSource": "", "category": "normal",
+        "uTime": u_time, "cTime": u_time, "reqId": "", "amendResult": "", "reduceOnly": "false", "code": "0",
+        "msg": "", "fillPx": px if filled else "", "tradeId": str(rng.randrange(10 ** 9)) if filled else "",
+        "fillSz": "0.2" if filled else "0", "fillTime": u_time if filled else "", "execType": "M" if filled else "",
+    }
+
+
+def build_corpus(count, seed=1):
+    """生成推送样本: pong、订阅回报、行情、账户、持仓，以及网格合约和其他合约的订单推送"""
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.15:
+            frames.append("pong")
+        elif kind < 0.2:
+            frames.append(json.dumps({"arg": {"channel": "tickers", "instId": "BTC-USDT-SWAP"},
+                                      "data": [{"instId": "BTC-USDT-SWAP", "last": "85000.1"}]}))
+        elif kind < 0.3:
+            frames.append(json.dumps({"arg": {"channel": "account"},
+                                      "data": [{"totalEq": "10000", "uTime": "1700000000000"}]}))
+        elif kind < 0.4:
+            frames.append(json.dumps({"arg": {"channel": "positions", "instType": "SWAP"},
+                                      "data": [{"instId": "BTC-USDT-SWAP", "posSide": "long", "pos": "0.4",
+                                                "liqPx": "60000", "uTime": "1700000000000"}]}))
+        else:
+            inst_id = rng.choice(GRID_INST_IDS if kind < 0.75 else OTHER_INST_IDS)
+            state = rng.choice(["live", "canceled", "filled"])
+            frames.append(json.dumps({"arg": {"channel": "orders", "instType": "SWAP", "uid": "1"},
+                                      "data": [build_order(inst_id, rng, state)]}, separators=(',', ':')))
+    return frames
+
+
+def decode_baseline(frames, inst_ids):
+    """原有方式: 每帧都用标准库完整解析，再在 Python 中过滤和转换数值"""
+    results = 0
+    for frame in frames:
+        if frame == "pong":
+            continue
+        message = json.loads(frame)
+        channel = message.get("arg", {}).get("channel")
+        if "data" in message and channel == "orders":
+            for order_info in message["data"]:
+                if order_info.get("instId") not in inst_ids:
+                    continue
+                float(order_info.get("accFillSz") or "0")
+                float(order_info.get("px") or "0")
+                order_info.get("fillTime") or order_info.get("uTime")
+                results += 1
+        elif "data" in message and channel in ("account", "positions"):
+            results += 1
+    return results
+
+
+def decode_with(decoder):
+    def run(frames, inst_ids):
+        decoder.inst_ids = inst_ids
+        results = 0
+        for frame in frames:
+            decoded = decoder.decode(frame)
+            if decoded is not None:
+                results += 1
+        return results
+    return run
+
+
+def bench(name, func, frames, inst_ids, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(frames, inst_ids)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<24} {best / len(frames) * 1e6:7.2f}µs/帧  {len(frames) / best:12,.0f} 帧/秒")
+
+
+def main(args):
+    if args.corpus:
+        # 录制的推送，每行一帧
+        with open(args.corpus) as f:
+            frames = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        frames = build_corpus(args.count)
+    inst_ids = set(GRID_INST_IDS)
+    print(f"🧪 {len(frames)} 帧，网格合约 {sorted(inst_ids)}\n")
+    bench("json 完整解析(原有)", decode_baseline, frames, inst_ids, args.repeat)
+    bench("FrameDecoder(json)", decode_with(bot.FrameDecoder("json")), frames, inst_ids, args.repeat)
+    if bot.orjson is not None:
+        bench("FrameDecoder(orjson)", decode_with(bot.FrameDecoder("orjson")), frames, inst_ids, args.repeat)
+    else:
+        print("  未安装 orjson，跳过")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推送解码压测: 原有 json 解析 vs FrameDecoder")
+    parser.add_argument("--corpus", help="录制的推送文件，每行一帧；不指定时生成样本")
+    parser.add_argument("--count", type=int, default=50000, help="生成的样本帧数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最快一次")
+    main(parser.parse_args())
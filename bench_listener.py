@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import os
+import tempfile
+
+from bench_rest import percentile
+from bot_loader import load_bot
+from mock_okx import LoadGenerator, MockOKX, start_mock_server
+
+bot = load_bot()
+
+
+def build_bench_grids(count, price):
+    """压测用的多合约网格，每个合约多空两个方向"""
+    result = {}
+    for i in range(count):
+        config = {"inst_id": f"BENCH{i}-USDT-SWAP", "tick_size": 0.1, "ct_val": 0.01}
+        for pos_side in ("long", "short"):
+            config[pos_side] = {"enabled": True, "position": 0.004, "trigger_price": price,
+                                "grid_percentage": 0.006, "grid_size": 0.002, "max_position": 0.01}
+        grid = bot.GridState.from_config(config)
+        result[grid.inst_id] = grid
+    return result
+
+
+async def wait_for(condition, timeout=10):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError("等待机器人就绪超时")
+
+
+async def main(args):
+    bot.REST_RATE_LIMITS.clear()
+    bot.enable_amend_mode = args.amend
+    bot.enable_ws_order_entry = not args.rest
+    # 订单记录写到临时目录，不污染实盘文件
+    tmp_dir = tempfile.mkdtemp()
+    bot.order_registry.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "order_records.json"),
+                                                 os.path.join(tmp_dir, "order_records.log"))
+    bot.grid_journal.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "grid_state.json"),
+                                                os.path.join(tmp_dir, "grid_state.log"))
+    mock = MockOKX(latency=args.latency / 1000)
+    runner, base_url = await start_mock_server(mock)
+    ws_url = base_url.replace("http", "ws") + "/ws/v5/private"
+    bot.rest_client.base_url = base_url
+    bot.WS_PRIVATE_URL = ws_url
+    bot.ws_order_gateway = bot.WsOrderGateway(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE, url=ws_url)
+    bot.grids = build_bench_grids(args.instruments, args.price)
+    bot.event_dispatcher = bot.EventDispatcher(workers=args.workers)
+    for grid in bot.grids.values():
+        mock.prices[grid.inst_id] = args.price
+        for pos_side, grid_side in grid.sides.items():
+            mock.positions[(grid.inst_id, pos_side)] = grid_side.position / grid.ct_val
+
+    tasks = []
+    # 日志照常由后台线程格式化(计入压测开销)，但不写文件，默认也不输出到控制台
+    bot.log = bot.EventLog(path="", console=args.verbose)
+    bot.log.start()
+    if args.record:
+        bot.frame_recorder = bot.FrameRecorder(args.record)
+        bot.frame_recorder.open()
+    try:
+        await bot.account_state.bootstrap()
+        if bot.enable_ws_order_entry:
+            tasks.append(asyncio.create_task(bot.ws_order_gateway.run()))
+            await wait_for(lambda: bot.ws_order_gateway.available)
+        tasks.append(asyncio.create_task(bot.connect_websocket()))
+        # 每个方向一笔开仓单和一笔平仓单
+        await wait_for(lambda: len(bot.open_order_book.orders) >= args.instruments * 4 and mock.subscribers)
+        generator = LoadGenerator(mock, args.rate, args.duration)
+        mock.request_counts.clear()
+        bot.metrics = bot.Metrics()
+        tasks.append(asyncio.create_task(bot.metrics.monitor_loop_lag(0.01)))
+        await generator.run()
+        await settle(mock)
+        await stop(tasks)
+        report(generator, mock, args)
+    finally:
+        await stop(tasks)
+        await bot.rest_client.close()
+        await runner.cleanup()
+        bot.frame_recorder.close()
+        bot.log.stop()
+
+
+async def settle(mock, quiet=0.5):
+    """等待机器人处理完积压的推送(一段时间内没有新请求)，再断开连接"""
+    count = -1
+    while count != sum(mock.request_counts.values()):
+        count = sum(mock.request_counts.values())
+        await asyncio.sleep(quiet)
+
+
+async def stop(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await bot.event_dispatcher.stop()
+
+
+def report(generator, mock, args):
+    samples = generator.samples
+    print(f"🧪 {args.instruments} 个合约，目标 {args.rate} 笔成交/秒，持续 {args.duration}s，"
+          f"{'REST' if args.rest else 'websocket'} 下单{'，改单模式' if args.amend else ''}，"
+          f"{args.workers} 个处理协程，服务端延迟 {args.latency}ms\n")
+    print(f"  • 成交 {generator.fills} 笔，吞吐 {len(samples) / generator.elapsed:,.0f} 笔/秒，"
+          f"跳过 {generator.skipped}，超时 {generator.timeouts}")
+    if samples:
+        print(f"  • 成交到新委托延迟 p50 {percentile(samples, 50) * 1000:.2f}ms  p99 "
+              f"{percentile(samples, 99) * 1000:.2f}ms  最大 {max(samples) * 1000:.2f}ms")
+    print(f"  • 请求统计: {dict(mock.request_counts)}\n")
+    print(bot.metrics.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="成交处理压测: 模拟交易所持续成交机器人的挂单，统计成交到新委托的延迟")
+    parser.add_argument("--instruments", type=int, default=50, help="合约数量")
+    parser.add_argument("--rate", type=float, default=2000, help="目标成交速率(笔/秒)")
+    parser.add_argument("--duration", type=float, default=5, help="持续时间(秒)")
+    parser.add_argument("--price", type=float, default=85000, help="初始价格")
+    parser.add_argument("--latency", type=float, default=1, help="模拟服务端处理延迟(毫秒)")
+    parser.add_argument("--workers", type=int, default=bot.EVENT_WORKERS, help="订单事件处理协程数")
+    parser.add_argument("--amend", action="store_true", help="使用改单模式")
+    parser.add_argument("--rest", action="store_true", help="只用 REST 下单")
+    parser.add_argument("--record", default="", help="把收到的推送录制到文件，供 replay.py 回放")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的日志")
+    asyncio.run(main(parser.parse_args()))
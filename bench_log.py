@@ -0,0 +1,63 @@
+import argparse
+import os
+import sys
+import time
+
+from bot_loader import load_bot
+
+bot = load_bot()
+
+
+def print_fill(i):
+    """原有实现: 成交时连续打印三行"""
+    print("\n✅ BTC-USDT-SWAP 开多单成交")
+    print(f"💰 当前多单持仓: {0.002 * i}")
+    print(f"🎯 多单触发价格: {85000 + i * 0.1}")
+
+
+def log_fill(i):
+    bot.log.info("grid_fill", "\n✅ {inst_id} 开{name}成交\n💰 当前{name}单持仓: {position}\n"
+                 "🎯 {name}单触发价格: {trigger_price}", inst_id="BTC-USDT-SWAP", pos_side="long", name="多",
+                 action="open", position=0.002 * i, trigger_price=85000 + i * 0.1)
+
+
+def bench(record, count):
+    """返回 (每条调用耗时, 事件循环所在线程的 CPU 时间)"""
+    start, cpu = time.perf_counter(), time.thread_time()
+    for i in range(count):
+        record(i)
+    return (time.perf_counter() - start) / count, (time.thread_time() - cpu) / count
+
+
+def main(args):
+    # 控制台输出到 /dev/null 或管道读端不读时的情况由 --stdout 指定
+    sys.stdout = open(args.stdout, "w", buffering=1 if args.line_buffered else -1)
+    try:
+        printed = bench(print_fill, args.count)
+        log_path = os.path.join(os.path.dirname(os.path.abspath(args.stdout)), "bench-log.log") \
+            if args.file else ""
+        bot.log = bot.EventLog(path=log_path, size=args.count + 1)
+        bot.log.start()
+        logged = bench(log_fill, args.count)
+        drain_start = time.perf_counter()
+        bot.log.stop()
+        drained = time.perf_counter() - drain_start
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    if args.file:
+        os.remove(log_path)
+    print(f"🧪 {args.count} 次成交日志，控制台输出到 {args.stdout}"
+          f"{'(行缓冲)' if args.line_buffered else ''}{'，同时写日志文件' if args.file else ''}\n")
+    print(f"  • print        每次 {printed[0] * 1e6:6.2f}µs  (CPU {printed[1] * 1e6:6.2f}µs)")
+    print(f"  • log.info     每次 {logged[0] * 1e6:6.2f}µs  (CPU {logged[1] * 1e6:6.2f}µs)  "
+          f"后台写出剩余记录 {drained * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="日志压测: 成交时直接 print 与写入结构化日志缓冲区的调用开销")
+    parser.add_argument("--count", type=int, default=50000, help="日志条数")
+    parser.add_argument("--stdout", default=os.devnull, help="控制台输出位置")
+    parser.add_argument("--line-buffered", action="store_true", help="控制台行缓冲(终端的默认方式)")
+    parser.add_argument("--file", action="store_true", help="同时写日志文件(写到 --stdout 所在目录)")
+    main(parser.parse_args())
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bench_rest import percentile
+from bot_loader import load_bot
+from mock_okx import MockOKX, start_mock_server
+
+bot = load_bot()
+
+
+def seed_resting_orders(mock, count):
+    """在模拟交易所和本地挂单簿中放入待撤的旧平多单"""
+    for i in range(count):
+        order_data = bot.build_order_data("sell", 86000 + i, bot.long_grid_size, "long", is_close=True)
+        ord_id = mock.create_order(order_data)
+        bot.record_placed_order(order_data, ord_id)
+
+
+async def rearm_serial(buy_price, close_price):
+    """原有方式: 逐笔撤单，再分别委托买单和卖单"""
+    for order in bot.open_order_book.find('sell', 'long'):
+        await bot.cancel_order_rest_api(order['ordId'], order['instId'])
+    await bot.place_order("buy", buy_price, bot.long_grid_size, "long")
+    await bot.place_order("sell", close_price, bot.long_grid_size, "long", is_close=True)
+
+
+async def rearm_batch(buy_price, close_price):
+    """批量方式: 一个网格步骤的撤单和下单合并为批量请求"""
+    batch = bot.OrderBatch()
+    for order in bot.open_order_book.find('sell', 'long'):
+        batch.cancel(order['ordId'], order['instId'])
+    batch.place("buy", buy_price, bot.long_grid_size, "long")
+    batch.place("sell", close_price, bot.long_grid_size, "long", is_close=True)
+    await batch.flush()
+
+
+async def rearm_amend(buy_price, close_price):
+    """改单方式: 复用一笔旧平多单改价，其余撤销，再委托买单
+    改单和下单没有合并的接口，请求数不会少于批量撤单+下单(有多余旧单要撤时还多一个撤单请求)；
+    省下的是被移动挂单的一次撤单(按订单数计的限频)，以及只移动一笔挂单时改单与下单同时发送的延迟
+    """
+    bot.enable_amend_mode = True
+    batch = bot.OrderBatch()
+    batch.replace(bot.open_order_book.find('sell', 'long'), "sell", close_price, bot.long_grid_size, "long",
+                  is_close=True)
+    batch.place("buy", buy_price, bot.long_grid_size, "long")
+    await batch.flush()
+
+
+async def run(mock, rearm, steps, resting):
+    """返回 (每步延迟样本, 每步请求数, 每步订单操作数)"""
+    mock.request_counts.clear()
+    mock.item_counts.clear()
+    samples = []
+    for _ in range(steps):
+        seed_resting_orders(mock, resting)
+        count_before = sum(mock.request_counts.values())
+        t0 = time.perf_counter()
+        await rearm(85000.0, 86000.0)
+        samples.append(time.perf_counter() - t0)
+        assert sum(mock.request_counts.values()) > count_before
+        # 清理本步骤下的新单，下一步骤重新开始
+        mock.orders.clear()
+        bot.open_order_book.orders.clear()
+    return samples, sum(mock.request_counts.values()) / steps, sum(mock.item_counts.values()) / steps
+
+
+async def main(args):
+    bot.REST_RATE_LIMITS.clear()
+    # 订单记录写到临时目录，不污染实盘文件
+    tmp_dir = tempfile.mkdtemp()
+    bot.order_registry.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "order_records.json"),
+                                                 os.path.join(tmp_dir, "order_records.log"))
+    mock = MockOKX(latency=args.latency / 1000)
+    runner, base_url = await start_mock_server(mock)
+    bot.rest_client.base_url = base_url
+    try:
+        print(f"🧪 模拟 OKX: {base_url}，每步待撤旧单 {args.resting} 笔，服务端延迟 {args.latency}ms\n")
+        modes = [("逐笔撤单+下单", rearm_serial), ("批量撤单+下单", rearm_batch), ("批量改单+下单", rearm_amend)]
+        for name, rearm in modes:
+            await report(name, mock, rearm, args)
+
+        # websocket 交易通道: 同样的批量撤单/改单+下单，不再走 HTTP
+        gateway = bot.WsOrderGateway(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE,
+                                     url=base_url.replace("http", "ws") + "/ws/v5/private")
+        bot.ws_order_gateway = gateway
+        gateway_task = asyncio.create_task(gateway.run())
+        while not gateway.available:
+            await asyncio.sleep(0.01)
+        for name, rearm in modes[1:]:
+            await report("websocket " + name, mock, rearm, args)
+        gateway_task.cancel()
+    finally:
+        await bot.rest_client.close()
+        await runner.cleanup()
+
+
+async def report(name, mock, rearm, args):
+    bot.enable_amend_mode = False
+    samples, requests_per_step, items_per_step = await run(mock, rearm, args.steps, args.resting)
+    print(f"  {name:<24} 每步请求数 {requests_per_step:5.1f}  订单操作数 {items_per_step:5.1f}  重新挂单延迟 p50 "
+          f"{percentile(samples, 50) * 1000:7.2f}ms  p99 {percentile(samples, 99) * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="网格重新挂单压测: 统计每步请求数、订单操作数(按订单数计的限频)和端到端延迟")
+    parser.add_argument("--steps", type=int, default=200, help="模拟网格步骤数")
+    parser.add_argument("--resting", type=int, default=3, help="每步需要撤销的旧挂单数")
+    parser.add_argument("--latency", type=float, default=2, help="模拟服务端处理延迟(毫秒)")
+    asyncio.run(main(parser.parse_args()))
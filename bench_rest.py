@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import requests
+
+from bot_loader import load_bot
+from mock_okx import MockOKX, run_mock_in_thread
+
+bot = load_bot()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, samples, total):
+    print(f"  {name:<22} 平均 {statistics.mean(samples) * 1000:7.2f}ms  p50 {percentile(samples, 50) * 1000:7.2f}ms  "
+          f"p99 {percentile(samples, 99) * 1000:7.2f}ms  总耗时 {total * 1000:8.1f}ms")
+
+
+def build_order(i):
+    return {"instId": "BTC-USDT-SWAP", "tdMode": "cross", "clOrdId": f"bench{i}", "side": "buy",
+            "ordType": "limit", "px": "85000.0", "sz": "0.2", "posSide": "long", "reduceOnly": "false"}
+
+
+def requests_place_order(base_url, order_data):
+    """原有实现: 每次调用 requests.post，新建连接并阻塞事件循环"""
+    endpoint = "/api/v5/trade/order"
+    timestamp = bot.get_iso_timestamp()
+    order_json = json.dumps(order_data, separators=(',', ':'))
+    headers = {
+        "OK-ACCESS-KEY": bot.API_KEY,
+        "OK-ACCESS-SIGN": bot.generate_signature(timestamp, "POST", endpoint, order_json),
+        "OK-ACCESS-TIMESTAMP": timestamp,
+        "OK-ACCESS-PASSPHRASE": bot.PASSPHRASE,
+        "Content-Type": "application/json",
+    }
+    return requests.post(base_url + endpoint, data=order_json, headers=headers).json()
+
+
+async def measure_loop_lag(stop, interval=0.001):
+    """测量事件循环最大卡顿(秒)，即 websocket 在此期间无法读取消息的时间"""
+    max_lag = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def bench_requests(base_url, count):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0)
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        requests_place_order(base_url, build_order(i))
+        samples.append(time.perf_counter() - t0)
+        await asyncio.sleep(0)
+    total = time.perf_counter() - start
+    stop.set()
+    return samples, total, await lag_task
+
+
+async def bench_client(base_url, count, burst):
+    client = bot.OKXRestClient(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE, base_url=base_url)
+    await client.post("/api/v5/trade/order", build_order(-1))  # 预热连接池
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0)
+
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        await client.post("/api/v5/trade/order", build_order(i))
+        samples.append(time.perf_counter() - t0)
+    serial_total = time.perf_counter() - start
+
+    async def timed(i):
+        t0 = time.perf_counter()
+        await client.post("/api/v5/trade/order", build_order(i))
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    burst_samples = []
+    for offset in range(0, count, burst):
+        burst_samples += await asyncio.gather(*(timed(i) for i in range(offset, min(count, offset + burst))))
+    burst_total = time.perf_counter() - start
+    stop.set()
+    max_lag = await lag_task
+    await client.close()
+    return samples, serial_total, burst_samples, burst_total, max_lag
+
+
+async def main(args):
+    # 压测期间放开限频，只比较连接与调度开销
+    bot.REST_RATE_LIMITS.clear()
+    mock = MockOKX(latency=args.latency / 1000)
+    base_url, stop = run_mock_in_thread(mock)
+    try:
+        print(f"🧪 模拟 OKX: {base_url}，请求数 {args.count}，服务端延迟 {args.latency}ms\n")
+        samples, total, lag = await bench_requests(base_url, args.count)
+        report("requests 逐次调用", samples, total)
+        print(f"  {'':<22} 事件循环最大卡顿 {lag * 1000:.2f}ms\n")
+
+        samples, serial_total, burst_samples, burst_total, lag = await bench_client(base_url, args.count, args.burst)
+        report("异步客户端 串行", samples, serial_total)
+        report(f"异步客户端 并发x{args.burst}", burst_samples, burst_total)
+        print(f"  {'':<22} 事件循环最大卡顿 {lag * 1000:.2f}ms")
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="REST 下单延迟压测: requests 逐次调用 vs 异步连接池客户端")
+    parser.add_argument("--count", type=int, default=500, help="每种方式的下单次数")
+    parser.add_argument("--burst", type=int, default=10, help="并发下单数(模拟成交爆发)")
+    parser.add_argument("--latency", type=float, default=1, help="模拟服务端处理延迟(毫秒)")
+    asyncio.run(main(parser.parse_args()))
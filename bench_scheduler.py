@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import time
+
+from bench_rest import build_order, percentile
+from bot_loader import load_bot
+from mock_okx import MockOKX, start_mock_server
+
+bot = load_bot()
+
+LANE_ENDPOINTS = {
+    "cancel": "/api/v5/trade/cancel-order",
+    "trade": "/api/v5/trade/order",
+    "query": "/api/v5/trade/orders-pending",
+}
+
+
+async def burst(client, counts):
+    """同时发出各通道的请求(模拟重连后的补单和校准)，返回 (通道 -> 延迟列表, 限频拒绝次数, 总耗时)"""
+    samples = {lane: [] for lane in counts}
+    rejected = 0
+
+    async def send(lane, i):
+        nonlocal rejected
+        endpoint = LANE_ENDPOINTS[lane]
+        t0 = time.perf_counter()
+        if lane == "query":
+            response = await client.get(endpoint)
+        elif lane == "cancel":
+            response = await client.post(endpoint, {"instId": "BTC-USDT-SWAP", "ordId": str(i)})
+        else:
+            response = await client.post(endpoint, build_order(i))
+        samples[lane].append(time.perf_counter() - t0)
+        if response.get("code") == "50011":
+            rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(lane, i) for lane, count in counts.items() for i in range(count)))
+    return samples, rejected, time.perf_counter() - start
+
+
+async def run(base_url, mock, counts, scheduled):
+    # 不排队时直接发出，交易所的限频拒绝不重试，统计被拒次数
+    bot.request_scheduler = bot.RequestScheduler(bot.REST_RATE_LIMITS if scheduled else {})
+    bot.REST_MAX_RETRIES = 2 if scheduled else 0
+    bot.metrics = bot.Metrics()
+    mock.request_times.clear()
+    mock.request_counts.clear()
+    client = bot.OKXRestClient(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE, base_url=base_url)
+    try:
+        samples, rejected, total = await burst(client, counts)
+    finally:
+        await client.close()
+    print(f"📊 {'限频调度' if scheduled else '不排队'}: 总耗时 {total:.2f}s，被拒 {rejected} 笔，"
+          f"实际请求 {dict(mock.request_counts)}")
+    for lane, values in samples.items():
+        print(f"  • {lane:<7} {len(values):>4} 笔  p50 {percentile(values, 50) * 1000:8.1f}ms  "
+              f"p99 {percentile(values, 99) * 1000:8.1f}ms")
+    if scheduled:
+        print(f"  • 合并查询 {bot.metrics.counters['rest_coalesced']} 次，交易所限频 "
+              f"{bot.metrics.counters['rate_limited']} 次")
+    print()
+
+
+async def main(args):
+    limits = {key: limit for key, limit in bot.REST_RATE_LIMITS.items() if " /" in key}
+    mock = MockOKX(latency=args.latency / 1000, rate_limits=limits)
+    runner, base_url = await start_mock_server(mock)
+    counts = {"cancel": args.cancels, "trade": args.places, "query": args.queries}
+    print(f"🧪 同时发出 撤单 {args.cancels} / 下单 {args.places} / 查询 {args.queries} 笔，"
+          f"模拟交易所按 REST_RATE_LIMITS 限频\n")
+    try:
+        await run(base_url, mock, counts, scheduled=False)
+        await asyncio.sleep(2)  # 等模拟交易所的限频窗口过去
+        await run(base_url, mock, counts, scheduled=True)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="限频调度压测: 突发请求在客户端排队 vs 直接发出被交易所拒绝")
+    parser.add_argument("--cancels", type=int, default=150, help="撤单数量")
+    parser.add_argument("--places", type=int, default=150, help="下单数量")
+    parser.add_argument("--queries", type=int, default=100, help="查询挂单次数")
+    parser.add_argument("--latency", type=float, default=1, help="模拟服务端处理延迟(毫秒)")
+    asyncio.run(main(parser.parse_args()))
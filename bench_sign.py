@@ -0,0 +1,75 @@
+import argparse
+import json
+import time
+
+from bot_loader import load_bot
+
+bot = load_bot()
+
+ENDPOINT = "/api/v5/trade/order"
+
+
+def build_orders(count):
+    return [bot.build_order_data("buy" if i % 2 else "sell", 85000 + i * 0.1, 0.002, "long", i % 2 == 0)
+            for i in range(count)]
+
+
+def sign_baseline(order_data):
+    """原有实现: 每次序列化请求体、重新写入密钥计算 HMAC、格式化时间戳并生成完整请求头"""
+    body = json.dumps(order_data, separators=(',', ':'))
+    timestamp = bot.get_iso_timestamp()
+    return body, {
+        "OK-ACCESS-KEY": bot.API_KEY,
+        "OK-ACCESS-SIGN": bot.generate_signature(timestamp, "POST", ENDPOINT, body, bot.SECRET_KEY),
+        "OK-ACCESS-TIMESTAMP": timestamp,
+        "OK-ACCESS-PASSPHRASE": bot.PASSPHRASE,
+        "Content-Type": "application/json",
+    }
+
+
+def sign_with(signer):
+    def sign(order_data):
+        body = bot.encode_body(order_data)
+        return body, signer.headers("POST", ENDPOINT, body)
+    return sign
+
+
+def check(signer, orders):
+    """两种实现的请求体和签名必须一致"""
+    for order_data in orders[:100]:
+        body, headers = sign_with(signer)(order_data)
+        assert body == json.dumps(order_data, separators=(',', ':')), body
+        timestamp = headers["OK-ACCESS-TIMESTAMP"]
+        assert headers["OK-ACCESS-SIGN"] == bot.generate_signature(timestamp, "POST", ENDPOINT, body, bot.SECRET_KEY)
+        assert len(timestamp) == len(bot.get_iso_timestamp()) and timestamp.endswith("Z"), timestamp
+    batch = orders[:20]
+    assert bot.encode_body(batch) == json.dumps(batch, separators=(',', ':'))
+
+
+def bench(sign, orders, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.process_time()
+        for order_data in orders:
+            sign(order_data)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(orders)
+
+
+def main(args):
+    orders = build_orders(args.count)
+    signer = bot.Signer(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE)
+    check(signer, orders)
+    baseline = bench(sign_baseline, orders, args.rounds)
+    signed = bench(sign_with(signer), orders, args.rounds)
+    print(f"🧪 {args.count} 笔下单请求，取 {args.rounds} 轮中最快的一轮 (CPU 时间)\n")
+    print(f"  • 原有实现   每笔 {baseline * 1e6:6.2f}µs")
+    print(f"  • Signer     每笔 {signed * 1e6:6.2f}µs  ({baseline / signed:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="签名压测: 每笔下单请求的序列化、签名和请求头构造 CPU 开销")
+    parser.add_argument("--count", type=int, default=20000, help="每轮请求数")
+    parser.add_argument("--rounds", type=int, default=5, help="轮数")
+    main(parser.parse_args())
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bot_loader import load_bot
+from mock_okx import MockOKX, start_mock_server
+
+bot = load_bot()
+
+
+def isolate(tmp_dir, verbose):
+    """本地文件写到临时目录，不污染实盘文件；关闭对账、监控接口和日志文件"""
+    bot.order_registry.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "order_records.json"),
+                                                 os.path.join(tmp_dir, "order_records.log"))
+    bot.grid_journal.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "grid_state.json"),
+                                                os.path.join(tmp_dir, "grid_state.log"))
+    bot.cl_ord_id_sequence.path = os.path.join(tmp_dir, "clordid_seq.json")
+    bot.instrument_specs.cache_file = os.path.join(tmp_dir, "instruments.json")
+    bot.log = bot.EventLog(path="", console=verbose)
+    bot.RECONCILE_INTERVAL = 0
+    bot.METRICS_PORT = 0
+    bot.METRICS_SUMMARY_INTERVAL = 0
+
+
+async def main(args):
+    isolate(tempfile.mkdtemp(), args.verbose)
+    mock = MockOKX(latency=args.latency / 1000)
+    runner, base_url = await start_mock_server(mock)
+    ws_url = base_url.replace("http", "ws") + "/ws/v5/private"
+    bot.rest_client.base_url = base_url
+    bot.WS_PRIVATE_URL = ws_url
+    bot.ws_order_gateway = bot.WsOrderGateway(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE, url=ws_url)
+    order_times = []
+    mock.order_hook = lambda inst_id, pos_side: order_times.append(time.perf_counter())
+
+    started = time.perf_counter()
+    task = asyncio.create_task(bot.main())
+    try:
+        while not order_times and time.perf_counter() - started < 10:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(args.settle)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await runner.cleanup()
+    if not order_times:
+        print("❌ 10秒内没有收到委托")
+        return
+    print(f"🧪 启动到首批委托，模拟服务端延迟 {args.latency}ms\n")
+    print(f"  • 首笔委托 {(order_times[0] - started) * 1000:.0f}ms，全部 {len(order_times)} 笔委托 "
+          f"{(order_times[-1] - started) * 1000:.0f}ms")
+    print(f"  • 启动期间的请求: {dict(mock.request_counts)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动压测: 从启动到首批网格委托到达模拟交易所的耗时")
+    parser.add_argument("--latency", type=float, default=50, help="模拟服务端处理延迟(毫秒)，近似网络往返")
+    parser.add_argument("--settle", type=float, default=0.5, help="首笔委托后继续等待的时间(秒)")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的日志")
+    asyncio.run(main(parser.parse_args()))
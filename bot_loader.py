@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "okx-bot.py")
+
+
+def load_bot(name="okx_bot", config=None):
+    """加载 okx-bot.py 模块
+    文件名含连字符，不能直接 import，供压测、回测等脚本复用机器人的代码；
+    name 不同时各自加载一份(互不共享全局状态)，config 为该份模块的参数覆盖，代替配置文件
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    if config is not None:
+        module.BOT_CONFIG = config
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    return module
@@ -0,0 +1,497 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+def now_ms():
+    return str(int(time.time() * 1000))
+
+
+class MockOKX:
+    """本地模拟 OKX 交易所
+    提供机器人用到的 REST 接口和私有 websocket(登录、交易操作、orders / account / positions 频道)，
+    返回与 OKX 相同格式的响应；最新价变化时撮合被穿越的挂单并推送成交，用于延迟压测，无需真实账户和网络
+    latency: 每个请求的模拟处理延迟(秒)
+    rate_limits: "请求方法 接口" -> (次数, 窗口秒数)，窗口内超出次数的 REST 请求返回 429 / 50011
+    """
+
+    def __init__(self, latency=0.0, rate_limits=None):
+        self.latency = latency
+        self.rate_limits = rate_limits or {}
+        self.request_times = {}  # "请求方法 接口" -> 窗口内的 (请求时间, 次数)
+        self.rejected_counts = Counter()  # "请求方法 接口" -> 限频拒绝次数
+        self.orders = {}  # ordId -> 订单
+        self.request_counts = Counter()  # 接口 -> 请求次数
+        self.item_counts = Counter()  # 交易接口 -> 处理的订单数(批量请求按订单数计，与交易所按订单数限频一致)
+        self.ord_ids = itertools.count(100000000)
+        self.trade_ids = itertools.count(1)
+        self.total_eq = 10000.0
+        self.positions = {}  # (instId, posSide) -> 持仓张数
+        self.prices = {}  # instId -> 最新价
+        self.fill_count = 0
+        self.feishu_messages = []  # 收到的飞书卡片
+        self.subscribers = {}  # websocket -> (订阅的频道, 推送队列)
+        self.order_hook = None  # 收到下单/改单请求时回调 (instId, posSide)，供压测统计响应延迟
+        self.finished = {}  # ordId -> 已成交或已撤销的订单，供订单查询接口使用
+        self.mute_pushes = False  # 为 True 时不推送，模拟断线期间漏掉的推送
+        self.lost_responses = 0  # 大于 0 时交易请求照常处理但不回报(REST 断开连接)，模拟结果未知的超时
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post("/api/v5/trade/order", self.handle_place_order)
+        app.router.add_post("/api/v5/trade/cancel-order", self.handle_cancel_order)
+        app.router.add_post("/api/v5/trade/batch-orders", self.handle_batch_orders)
+        app.router.add_post("/api/v5/trade/cancel-batch-orders", self.handle_cancel_batch_orders)
+        app.router.add_post("/api/v5/trade/amend-order", self.handle_amend_order)
+        app.router.add_post("/api/v5/trade/amend-batch-orders", self.handle_amend_batch_orders)
+        app.router.add_get("/api/v5/trade/orders-pending", self.handle_orders_pending)
+        app.router.add_get("/api/v5/trade/order", self.handle_get_order)
+        app.router.add_get("/api/v5/account/balance", self.handle_balance)
+        app.router.add_get("/api/v5/account/positions", self.handle_positions)
+        app.router.add_get("/api/v5/public/time", self.handle_public_time)
+        app.router.add_get("/api/v5/public/instruments", self.handle_instruments)
+        app.router.add_post("/open-apis/bot/v2/hook/{token}", self.handle_feishu)
+        app.router.add_get("/ws/v5/private", self.handle_ws_private)
+        return app
+
+    async def respond(self, request, data, code="0", msg=""):
+        """统计请求次数并按模拟延迟返回"""
+        self.request_counts[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"code": code, "msg": msg, "data": data})
+
+    def rate_limited(self, request, weight=1):
+        """按滑动窗口检查限频，未超限时计入本次请求"""
+        key = f"{request.method} {request.path}"
+        limit = self.rate_limits.get(key)
+        if limit is None:
+            return False
+        count, window = limit
+        times = self.request_times.setdefault(key, [])
+        now = time.monotonic()
+        times[:] = [(t, w) for t, w in times if now - t < window]
+        if sum(w for _, w in times) + weight > count:
+            self.rejected_counts[key] += 1
+            return True
+        times.append((now, weight))
+        return False
+
+    def reject(self, request):
+        self.request_counts[request.path] += 1
+        return web.json_response({"code": "50011", "msg": "Too Many Requests", "data": []}, status=429)
+
+    def create_order(self, args):
+        """登记一笔挂单，返回 ordId"""
+        ord_id = str(next(self.ord_ids))
+        self.orders[ord_id] = {
+            "instId": args.get("instId"),
+            "ordId": ord_id,
+            "clOrdId": args.get("clOrdId", ""),
+            "side": args.get("side"),
+            "posSide": args.get("posSide"),
+            "px": args.get("px"),
+            "sz": args.get("sz"),
+            "accFillSz": "0",
+            "fillSz": "0",
+            "state": "live",
+            "reduceOnly": args.get("reduceOnly", "false"),
+            "uTime": now_ms(),
+        }
+        return ord_id
+
+    def place_item(self, args):
+        """下单，返回结果项；价格已被穿越时立即成交"""
+        cl_ord_id = args.get("clOrdId")
+        if cl_ord_id and any(order["clOrdId"] == cl_ord_id for order in self.orders.values()):
+            return {"ordId": "", "clOrdId": cl_ord_id, "sCode": "51016", "sMsg": "Duplicated clOrdId"}
+        self.on_order(args.get("instId"), args.get("posSide"))
+        ord_id = self.create_order(args)
+        order = self.orders[ord_id]
+        self.publish("orders", [order])
+        price = self.prices.get(order["instId"])
+        if price is not None and crosses(order, price):
+            self.fill_order(ord_id)
+        return {"ordId": ord_id, "clOrdId": args.get("clOrdId", ""), "sCode": "0", "sMsg": ""}
+
+    def cancel_item(self, args):
+        """撤单，返回结果项"""
+        order = self.orders.pop(args.get("ordId"), None)
+        if order is None:
+            return {"ordId": args.get("ordId"), "sCode": "51400", "sMsg": "Order does not exist"}
+        order.update(state="canceled", uTime=now_ms())
+        self.finished[order["ordId"]] = order
+        self.publish("orders", [order])
+        return {"ordId": args.get("ordId"), "sCode": "0", "sMsg": ""}
+
+    def amend_item(self, args):
+        """改单，返回结果项"""
+        order = self.orders.get(args.get("ordId"))
+        if order is None:
+            return {"ordId": args.get("ordId"), "sCode": "51503", "sMsg": "Order does not exist"}
+        self.on_order(order["instId"], order["posSide"])
+        order["px"] = args.get("newPx") or order["px"]
+        order["sz"] = args.get("newSz") or order["sz"]
+        order["uTime"] = now_ms()
+        self.publish("orders", [order])
+        price = self.prices.get(order["instId"])
+        if price is not None and crosses(order, price):
+            self.fill_order(order["ordId"])
+        return {"ordId": order["ordId"], "sCode": "0", "sMsg": ""}
+
+    def on_order(self, inst_id, pos_side):
+        if self.order_hook is not None:
+            self.order_hook(inst_id, pos_side)
+
+    def set_price(self, inst_id, price):
+        """更新最新价，撮合被穿越的挂单(按挂单价成交)，返回成交的订单"""
+        self.prices[inst_id] = price
+        crossed = [order["ordId"] for order in self.orders.values()
+                   if order["instId"] == inst_id and crosses(order, price)]
+        return [self.fill_order(ord_id) for ord_id in crossed]
+
+    def fill_order(self, ord_id, size=None):
+        """成交一笔挂单(size 为成交张数，默认全部剩余数量)，推送订单、持仓和账户更新"""
+        order = self.orders[ord_id]
+        filled = float(order["accFillSz"])
+        size = round(min(size or float(order["sz"]) - filled, float(order["sz"]) - filled), 8)
+        timestamp = now_ms()
+        acc_fill_sz = round(filled + size, 8)
+        done = acc_fill_sz >= float(order["sz"])
+        order.update(state="filled" if done else "partially_filled", accFillSz=str(acc_fill_sz), fillSz=str(size),
+                     fillPx=order["px"], avgPx=order["px"], fillTime=timestamp, uTime=timestamp,
+                     tradeId=str(next(self.trade_ids)))
+        key = (order["instId"], order["posSide"])
+        opening = (order["side"] == "buy") == (order["posSide"] == "long")
+        self.positions[key] = round(max(self.positions.get(key, 0) + (size if opening else -size), 0), 8)
+        self.fill_count += 1
+        if done:
+            self.finished[ord_id] = self.orders.pop(ord_id)
+        order = dict(order)  # 推送当时的快照，之后的部分成交不影响已推送的消息
+        self.publish("orders", [order])
+        self.publish("positions", [self.position_item(key, timestamp)])
+        self.publish("account", [{"totalEq": str(self.total_eq), "uTime": timestamp}])
+        return order
+
+    def position_item(self, key, timestamp=None):
+        inst_id, pos_side = key
+        return {"instId": inst_id, "posSide": pos_side, "pos": str(self.positions[key]), "liqPx": "",
+                "uTime": timestamp or now_ms()}
+
+    def publish(self, channel, data):
+        """推送到订阅了该频道的连接，每个连接按顺序发送"""
+        if self.mute_pushes:
+            return
+        message = None
+        for channels, queue in self.subscribers.values():
+            if channel in channels:
+                message = message or json.dumps({"arg": {"channel": channel}, "data": data})
+                queue.put_nowait(message)
+
+    async def handle_trade(self, request, handler, batch=False):
+        """交易类 REST 接口: 单笔接口请求体为对象，批量接口为列表"""
+        args = await request.json()
+        if self.rate_limited(request, len(args) if batch else 1):
+            return self.reject(request)
+        data = [handler(item) for item in args] if batch else [handler(args)]
+        self.item_counts[request.path] += len(data)
+        if self.lose_response():
+            request.transport.close()
+            return web.Response()
+        return await self.respond(request, data, code=batch_code(data))
+
+    def lose_response(self):
+        if self.lost_responses <= 0:
+            return False
+        self.lost_responses -= 1
+        return True
+
+    async def handle_place_order(self, request):
+        return await self.handle_trade(request, self.place_item)
+
+    async def handle_cancel_order(self, request):
+        return await self.handle_trade(request, self.cancel_item)
+
+    async def handle_batch_orders(self, request):
+        return await self.handle_trade(request, self.place_item, batch=True)
+
+    async def handle_cancel_batch_orders(self, request):
+        return await self.handle_trade(request, self.cancel_item, batch=True)
+
+    async def handle_amend_order(self, request):
+        return await self.handle_trade(request, self.amend_item)
+
+    async def handle_amend_batch_orders(self, request):
+        return await self.handle_trade(request, self.amend_item, batch=True)
+
+    async def handle_orders_pending(self, request):
+        if self.rate_limited(request):
+            return self.reject(request)
+        return await self.respond(request, page_orders(self.orders.values(), request.query))
+
+    async def handle_get_order(self, request):
+        """按 ordId 或 clOrdId 查询订单(含已结束的订单)"""
+        ord_id, cl_ord_id = request.query.get("ordId"), request.query.get("clOrdId")
+        for order in (*self.orders.values(), *self.finished.values()):
+            if order["ordId"] == ord_id or (cl_ord_id and order["clOrdId"] == cl_ord_id):
+                return await self.respond(request, [order])
+        return await self.respond(request, [], code="51603", msg="Order does not exist")
+
+    async def handle_balance(self, request):
+        return await self.respond(request, [{"totalEq": str(self.total_eq)}])
+
+    async def handle_positions(self, request):
+        return await self.respond(request, [self.position_item(key) for key in self.positions])
+
+    async def handle_public_time(self, request):
+        return await self.respond(request, [{"ts": now_ms()}])
+
+    async def handle_instruments(self, request):
+        inst_id = request.query.get("instId")
+        return await self.respond(request, [{"instId": inst_id, "instType": "SWAP", "ctVal": "0.01", "tickSz": "0.1",
+                                             "lotSz": "0.01", "minSz": "0.01"}])
+
+    async def handle_feishu(self, request):
+        self.request_counts[request.path] += 1
+        self.feishu_messages.append(await request.json())
+        return web.json_response({"StatusCode": 0, "StatusMessage": "success"})
+
+    async def handle_ws_private(self, request):
+        """私有 websocket: 登录、频道订阅和交易操作"""
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        trade_handlers = {
+            "order": self.place_item,
+            "batch-orders": self.place_item,
+            "cancel-order": self.cancel_item,
+            "batch-cancel-orders": self.cancel_item,
+            "amend-order": self.amend_item,
+            "batch-amend-orders": self.amend_item,
+        }
+        writer = None
+        try:
+            async for message in websocket:
+                if message.data == "ping":
+                    await websocket.send_str("pong")
+                    continue
+                payload = json.loads(message.data)
+                op = payload.get("op")
+                if op == "login":
+                    await websocket.send_json({"event": "login", "code": "0", "msg": "", "connId": "mock"})
+                elif op == "subscribe":
+                    if writer is None:
+                        self.subscribers[websocket] = (set(), asyncio.Queue())
+                        writer = asyncio.create_task(self.ws_writer(websocket))
+                    await self.ws_subscribe(websocket, payload.get("args", []))
+                elif op in trade_handlers:
+                    # 各请求并发处理，回报可能乱序，由客户端按 id 匹配
+                    asyncio.create_task(self.ws_trade(websocket, payload, trade_handlers[op]))
+        finally:
+            self.subscribers.pop(websocket, None)
+            if writer is not None:
+                writer.cancel()
+        return websocket
+
+    async def ws_subscribe(self, websocket, args):
+        """订阅频道，账户和持仓频道订阅后先推送一次当前快照"""
+        channels, queue = self.subscribers[websocket]
+        for arg in args:
+            channels.add(arg.get("channel"))
+            queue.put_nowait(json.dumps({"event": "subscribe", "arg": arg, "connId": "mock"}))
+            if arg.get("channel") == "account":
+                queue.put_nowait(json.dumps({"arg": arg, "data": [{"totalEq": str(self.total_eq),
+                                                                   "uTime": now_ms()}]}))
+            elif arg.get("channel") == "positions" and self.positions:
+                queue.put_nowait(json.dumps({"arg": arg, "data": [self.position_item(key) for key in self.positions]}))
+
+    async def ws_writer(self, websocket):
+        _, queue = self.subscribers[websocket]
+        while True:
+            await websocket.send_str(await queue.get())
+
+    async def ws_trade(self, websocket, payload, handler):
+        self.request_counts["ws:" + payload["op"]] += 1
+        data = [handler(args) for args in payload.get("args", [])]
+        self.item_counts["ws:" + payload["op"]] += len(data)
+        if self.lose_response():
+            return
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await websocket.send_json({"id": payload.get("id"), "op": payload["op"], "code": batch_code(data),
+                                   "msg": "", "data": data})
+
+
+def crosses(order, price):
+    """最新价是否穿越挂单价: 买单价格不低于最新价、卖单价格不高于最新价"""
+    px = float(order["px"])
+    return px >= price if order["side"] == "buy" else px <= price
+
+
+def page_orders(orders, params):
+    """挂单查询的一页: 与交易所相同按 ordId 从新到旧排列，after 返回比该 ordId 更早的订单，每页最多 limit(100) 笔"""
+    orders = sorted(orders, key=lambda order: int(order["ordId"]), reverse=True)
+    if params.get("after"):
+        orders = [order for order in orders if int(order["ordId"]) < int(params["after"])]
+    return orders[:min(int(params.get("limit") or 100), 100)]
+
+
+def batch_code(items):
+    """批量接口返回码: 全部成功 0，全部失败 2，部分失败 1"""
+    failed = sum(item["sCode"] != "0" for item in items)
+    return "0" if failed == 0 else "2" if failed == len(items) else "1"
+
+
+class PriceFeed:
+    """可编排的行情: 按价格序列(列表或生成器)逐个推进最新价，每个价格触发一次撮合"""
+
+    def __init__(self, mock, inst_id, prices, interval=0.0):
+        self.mock = mock
+        self.inst_id = inst_id
+        self.prices = prices
+        self.interval = interval
+
+    @classmethod
+    def random_walk(cls, mock, inst_id, start_price, count=None, volatility=0.0005, interval=0.0, seed=None):
+        """随机游走行情，价格在推进时逐个生成；count 为 None 时不会结束"""
+        def prices():
+            rng = random.Random(seed)
+            price = start_price
+            for _ in itertools.repeat(None) if count is None else range(count):
+                price *= 1 + rng.gauss(0, volatility)
+                yield round(price, 1)
+
+        return cls(mock, inst_id, prices(), interval)
+
+    async def run(self):
+        for price in self.prices:
+            self.mock.set_price(self.inst_id, price)
+            await asyncio.sleep(self.interval)
+
+
+class LoadGenerator:
+    """成交压测: 按目标速率成交机器人的挂单，统计从推送成交到收到新委托(下单或改单)的延迟
+    每个 (instId, posSide) 同时只有一笔等待响应的成交，全部方向都在等待时本次成交跳过
+    """
+
+    def __init__(self, mock, rate, duration, timeout=2.0):
+        self.mock = mock
+        self.rate = rate
+        self.duration = duration
+        self.timeout = timeout
+        self.waiting = {}  # (instId, posSide) -> 推送成交的时间
+        self.samples = []  # 成交到新委托的延迟(秒)
+        self.fills = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.elapsed = 0.0
+
+    def on_order(self, inst_id, pos_side):
+        started = self.waiting.pop((inst_id, pos_side), None)
+        if started is not None:
+            self.samples.append(time.perf_counter() - started)
+
+    def pick_order(self):
+        """随机选一笔所在方向没有等待响应的挂单"""
+        orders = list(self.mock.orders.values())
+        random.shuffle(orders)
+        return next((order for order in orders if (order["instId"], order["posSide"]) not in self.waiting), None)
+
+    async def run(self):
+        self.mock.order_hook = self.on_order
+        interval = 1 / self.rate
+        start = time.perf_counter()
+        next_tick = start
+        try:
+            while next_tick - start < self.duration:
+                now = time.perf_counter()
+                for lane, started in list(self.waiting.items()):
+                    if now - started > self.timeout:
+                        del self.waiting[lane]
+                        self.timeouts += 1
+                order = self.pick_order()
+                if order is None:
+                    self.skipped += 1
+                else:
+                    # 最新价移到挂单价，由撮合成交(同价的其他挂单也会一起成交)
+                    self.waiting[(order["instId"], order["posSide"])] = time.perf_counter()
+                    self.fills += len(self.mock.set_price(order["instId"], float(order["px"])))
+                next_tick += interval
+                await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+            # 等待最后一批成交的响应
+            deadline = time.perf_counter() + self.timeout
+            while self.waiting and time.perf_counter() < deadline:
+                await asyncio.sleep(0.01)
+            self.timeouts += len(self.waiting)
+        finally:
+            self.mock.order_hook = None
+            self.elapsed = time.perf_counter() - start
+
+
+async def start_mock_server(mock, host="127.0.0.1", port=0):
+    """在当前事件循环中启动模拟服务器，返回 (runner, base_url)"""
+    runner = web.AppRunner(mock.build_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def run_mock_in_thread(mock, host="127.0.0.1", port=0):
+    """在后台线程中运行模拟服务器，供阻塞式客户端(requests)压测
+    返回 (base_url, stop)
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    result = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        result["runner"], result["base_url"] = loop.run_until_complete(start_mock_server(mock, host, port))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(result["runner"].cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return result["base_url"], stop
+
+
+async def serve_forever(args):
+    mock = MockOKX(latency=args.latency / 1000)
+    runner, base_url = await start_mock_server(mock, args.host, args.port)
+    print(f"🧪 模拟 OKX 已启动: {base_url}")
+    if args.feed:
+        # 随机游走行情，每秒 1/interval 个价格
+        feed = PriceFeed.random_walk(mock, args.feed, args.start_price, interval=args.interval)
+        asyncio.create_task(feed.run())
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"📊 {time.strftime('%H:%M:%S')} 请求统计: {dict(mock.request_counts)}，成交 {mock.fill_count} 笔")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟 OKX 交易所")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="模拟处理延迟(毫秒)")
+    parser.add_argument("--feed", help="为该合约生成随机游走行情，如 BTC-USDT-SWAP")
+    parser.add_argument("--start-price", type=float, default=85000, help="随机游走起始价格")
+    parser.add_argument("--interval", type=float, default=0.5, help="行情推进间隔(秒)")
+    asyncio.run(serve_forever(parser.parse_args()))
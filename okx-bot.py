@@ -1,516 +1,2910 @@
 import asyncio
 import websockets
+import websockets.exceptions
 import time
 import hmac
 import hashlib
 import base64
 import json
+import math
 import random
-import string
+import re
+import struct
+import functools
+import sys
+import threading
+import zlib
+from collections import Counter, deque
 from datetime import datetime, UTC
-import requests
+from decimal import Decimal, ROUND_DOWN
+from urllib.parse import urlencode
+import aiohttp
+import aiohttp.web
 import os
 
+try:
+    import orjson  # 可选依赖，安装后用于解析 websocket 推送
+except ImportError:
+    orjson = None
+
 # ✅ 网格开关参数
 enable_long_grid = True  # 是否启用多单网格
 enable_short_grid = True  # 是否启用空单网格
+enable_amend_mode = False  # 是否用改单代替撤单重挂(改单被拒时自动撤单重挂)，请求数不变，省去被复用挂单的那次撤单
+enable_ws_order_entry = True  # 是否通过 websocket 下单/撤单/改单(不可用时自动改用 REST)
+enable_partial_rearm = False  # 部分成交时是否按成交量立即补挂对侧挂单(完全成交后统一换成整格挂单)
 
 # ✅ API 配置
 API_KEY = ""
 SECRET_KEY = ""
 PASSPHRASE = ""
 feishu_token = ''  # 飞书TOKEN
+FEISHU_WEBHOOK_URL = "https://open.feishu.cn/open-apis/bot/v2/hook/"
 
 # ✅ 多单交易参数
-long_position = 0  # 当前多单持仓
+long_position = 0  # 当前多单持仓(无法从交易所获取时使用)
 long_trigger_price = 85802.6  # 多单触发价格
 long_grid_percentage = 0.6 / 100  # 多单网格间距
 long_grid_size = 0.002  # 多单每次买入量
 long_max_position = 0.01  # 多单最大持仓
 long_take_profit_count = 0  # 多单止盈次数
+long_ladder_levels = 1  # 多单每个方向同时挂出的网格层数，1 为只挂相邻一层
 
 # ✅ 空单交易参数
-short_position = 0.008  # 当前空单持仓
+short_position = 0.008  # 当前空单持仓(无法从交易所获取时使用)
 short_trigger_price = 87356.7  # 空单触发价格
 short_grid_percentage = 0.6 / 100  # 空单网格间距
 short_grid_size = 0.002  # 空单每次卖出量
 short_max_position = 0.01  # 空单最大持仓
 short_take_profit_count = 0  # 空单止盈次数
+short_ladder_levels = 1  # 空单每个方向同时挂出的网格层数，1 为只挂相邻一层
+
+# ✅ 多合约网格参数
+DEFAULT_INST_ID = "BTC-USDT-SWAP"  # 上面多空参数对应的合约
+DEFAULT_TICK_SIZE = 0.1  # 价格精度
+DEFAULT_CT_VAL = 0.01  # 合约面值(每张合约的币数量)
+DEFAULT_LOT_SIZE = 0.01  # 下单数量精度(张)
+DEFAULT_MIN_SIZE = 0.01  # 最小下单数量(张)
+# 以上合约规格只在无法从交易所获取时使用，启动时按 /api/v5/public/instruments 更新
+# 其他合约的网格，所有网格共用一条 websocket、一个 REST 连接池和一个事件循环，例如:
+# {"inst_id": "ETH-USDT-SWAP", "tick_size": 0.01, "ct_val": 0.1,
+#  "long": {"enabled": True, "position": 0, "trigger_price": 3000, "grid_percentage": 0.006,
+#           "grid_size": 0.1, "max_position": 1, "ladder_levels": 3},
+#  "short": {"enabled": True, "position": 0, "trigger_price": 3100, "grid_percentage": 0.006,
+#            "grid_size": 0.1, "max_position": 1}}
+EXTRA_GRIDS = []
 
-# ✅ 存储订单 ID
-buy_ordId = None
-close_long_ordId = None
-take_profit_count = 0
 BASE_URL = "https://www.okx.com"
+WS_PRIVATE_URL = "wss://ws.okx.com:8443/ws/v5/private"
+
+# ✅ REST 连接池参数
+REST_POOL_SIZE = 20  # 连接池最大连接数
+REST_KEEPALIVE_TIMEOUT = 60  # 空闲连接保活时间(秒)
+DEFAULT_REST_TIMEOUT = 5  # 默认请求超时(秒)
+# 以下按 "请求方法 接口" 区分: 同一路径的 GET(查询订单)和 POST(下单)是两个接口，限频和优先级各不相同
+REST_TIMEOUTS = {  # 各接口请求超时(秒)，交易类接口更短以免阻塞网格
+    "POST /api/v5/trade/order": 3,
+    "POST /api/v5/trade/cancel-order": 3,
+    "POST /api/v5/trade/batch-orders": 3,
+    "POST /api/v5/trade/cancel-batch-orders": 3,
+    "POST /api/v5/trade/amend-order": 3,
+    "POST /api/v5/trade/amend-batch-orders": 3,
+    "GET /api/v5/trade/order": 3,
+    "GET /api/v5/trade/orders-pending": 5,
+    "GET /api/v5/account/balance": 5,
+    "GET /api/v5/account/positions": 5,
+}
+REST_RATE_LIMITS = {  # 各接口限频 (次数, 窗口秒数)
+    "POST /api/v5/trade/order": (60, 2),
+    "POST /api/v5/trade/cancel-order": (60, 2),
+    "POST /api/v5/trade/batch-orders": (300, 2),  # 批量接口按订单数限频
+    "POST /api/v5/trade/cancel-batch-orders": (300, 2),
+    "POST /api/v5/trade/amend-order": (60, 2),
+    "POST /api/v5/trade/amend-batch-orders": (300, 2),
+    "GET /api/v5/trade/order": (60, 2),  # 按合约分别限频
+    "GET /api/v5/trade/orders-pending": (60, 2),
+    "GET /api/v5/account/balance": (10, 2),
+    "GET /api/v5/account/positions": (10, 2),
+    "account-orders": (1000, 2),  # 子账户维度新单和改单合计限频(按订单数)
+    "feishu-webhook": (5, 1),  # 飞书机器人限频
+}
+REST_RATE_LIMITS_PER_INSTRUMENT = ["GET /api/v5/trade/order"]  # 按请求中的 instId 各用一个令牌桶的限频
+REST_RATE_LIMIT_GROUPS = {  # 除接口自身外还需占用的共享限频
+    "POST /api/v5/trade/order": ["account-orders"],
+    "POST /api/v5/trade/batch-orders": ["account-orders"],
+    "POST /api/v5/trade/amend-order": ["account-orders"],
+    "POST /api/v5/trade/amend-batch-orders": ["account-orders"],
+}
+REST_LANES = {  # 请求优先级通道，限频排队时撤单最先，其次下单和改单，再次查询，通知最后
+    "POST /api/v5/trade/cancel-order": "cancel",
+    "POST /api/v5/trade/cancel-batch-orders": "cancel",
+    "POST /api/v5/trade/order": "trade",
+    "POST /api/v5/trade/batch-orders": "trade",
+    "POST /api/v5/trade/amend-order": "trade",
+    "POST /api/v5/trade/amend-batch-orders": "trade",
+    "feishu-webhook": "notify",
+}
+LANE_PRIORITY = {"cancel": 0, "trade": 1, "query": 2, "notify": 3}  # 未列出的接口(含全部 GET)走 query 通道
+REST_MAX_RETRIES = 2  # 触发限频后的最大重试次数
+REST_RATE_LIMIT_BACKOFF = 0.5  # 触发限频后的退避时间(秒)
+BATCH_ORDER_LIMIT = 20  # 批量下单/撤单接口单次最多订单数
+
+# ✅ 飞书通知参数
+FEISHU_QUEUE_SIZE = 200  # 通知队列长度，满了之后丢弃并在下一条通知中汇总
+FEISHU_COALESCE_WINDOW = 3  # 合并窗口(秒)，窗口内的多次成交合并为一条通知
+
+# ✅ websocket 交易通道参数
+WS_ORDER_TIMEOUT = 3  # 等待下单回报的超时(秒)
+WS_PING_INTERVAL = 20  # 无消息时发送 ping 的间隔(秒)，OKX 30秒无消息会断开
+WS_RECONNECT_DELAY = 5  # 断线重连间隔(秒)
+WS_WATCHDOG_TIMEOUT = 30  # 推送连接超过该时间(秒)没有收到任何消息(含 pong)视为已断开
+
+# ✅ 推送处理参数
+EVENT_WORKERS = 4  # 订单事件处理协程数，同一合约同一方向的事件始终由同一个协程按顺序处理
+EVENT_QUEUE_SIZE = 1000  # 每个处理协程的队列长度，满了之后读取协程等待队列腾出空间(背压)，不丢弃事件
+EVENT_LATE_THRESHOLD = 1.0  # 事件排队超过该时间(秒)记为延迟事件
+JSON_BACKEND = "auto"  # 推送解析: auto 安装了 orjson 时使用 orjson，否则用标准库 json；也可指定 "json"
+
+# ✅ 推送录制参数
+RECORD_FILE = ''  # 录制推送连接收到的全部消息，供 replay.py 离线回放压测；为空不录制，例如 'pushes.rec'
+RECORD_FLUSH_INTERVAL = 1  # 录制文件的写出间隔(秒)，其间的消息留在内存缓冲区
+RECORD_MAGIC = b"OKXREC1\n"  # 录制文件头
+
+# ✅ 对账参数
+RECONCILE_INTERVAL = 60  # 后台对账间隔(秒)，0 表示不对账
+RECONCILE_CONFIRM_DELAY = 5  # 发现差异后隔多久复查(秒)，两次快照都存在的差异才修正
+RECONCILE_MAX_ORDERS = 20  # 每轮最多修正的订单数(查询、撤单、改单和下单合计)，其余留到下一轮
+
+# ✅ 订单记录参数
+ORDER_RECORDS_FILE = 'order_records.json'  # 订单快照文件
+ORDER_LOG_FILE = 'order_records.log'  # 订单增量日志文件
+ORDER_LOG_COMPACT_LINES = 2000  # 增量日志达到该行数时压缩为快照
+ORDER_RETENTION_SECONDS = 24 * 3600  # 终态订单保留时间(秒)
+TERMINAL_ORDER_STATES = {"filled", "canceled", "mmp_canceled"}  # 订单终态
+LIVE_ORDER_STATES = {"live", "partially_filled"}  # 挂单中的状态
+CL_ORD_ID_SEQ_FILE = 'clordid_seq.json'  # clOrdId 序号文件，重启后从上次预留的序号之后继续
+CL_ORD_ID_BLOCK = 1000  # 每次预留并写入文件的序号数量
+ORDER_SUBMIT_RETRIES = 1  # 下单结果未知(超时/断线)时，按 clOrdId 确认未下单后用同一 clOrdId 重发的次数
+ORDER_NOT_FOUND_CODE = "51603"  # 查询订单: 订单不存在
+DUPLICATE_CL_ORD_ID_CODE = "51016"  # 下单: clOrdId 重复(同一委托已经下过)
+ORDERS_PENDING_PAGE_SIZE = 100  # 挂单查询每页最多返回的订单数(交易所上限)
+
+# ✅ 网格状态参数
+GRID_STATE_FILE = 'grid_state.json'  # 网格状态快照文件
+GRID_STATE_LOG_FILE = 'grid_state.log'  # 网格状态增量日志文件
+GRID_STATE_COMPACT_LINES = 1000  # 增量日志达到该行数时压缩为快照
+INSTRUMENTS_CACHE_FILE = 'instruments.json'  # 合约规格缓存，交易所查询失败时使用
+FILL_TRACKER_SIZE = 10000  # 记住最近多少笔已结束订单的累计成交，用于忽略重复推送
+
+# ✅ 监控参数
+METRICS_HOST = "127.0.0.1"  # 监控接口只监听本机
+METRICS_PORT = 9108  # 监控接口端口(GET /metrics 和 /metrics.json)，0 表示不启动
+METRICS_SUMMARY_INTERVAL = 300  # 定期打印监控摘要的间隔(秒)，0 表示不打印
+METRICS_LAG_INTERVAL = 0.5  # 事件循环卡顿采样间隔(秒)
+METRICS_SAMPLE_SIZE = 2048  # 每个直方图保留的最近样本数，用于计算分位数
+
+# ✅ 日志参数
+LOG_FILE = 'okx-bot.log'  # 日志文件(每行一条 JSON 记录)，按大小轮转；空字符串表示不写文件
+LOG_LEVEL = "info"  # 最低记录级别: debug / info / warning / error
+LOG_CONSOLE = True  # 是否同时输出到控制台
+LOG_BUFFER_SIZE = 10000  # 内存环形缓冲区的记录数，写出跟不上时丢弃最旧的记录
+LOG_FLUSH_INTERVAL = 0.2  # 后台线程写出间隔(秒)
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件大小上限
+LOG_BACKUP_COUNT = 5  # 保留的轮转文件数
+LOG_SAMPLE_RATES = {"order_push": 0.01}  # 按事件名采样的比例(0~1)，未列出的事件全部记录
+
+# ✅ 启动参数
+CONFIG_FILE = os.environ.get("OKX_BOT_CONFIG", "config.json")  # 覆盖本文件参数的 JSON 配置文件，不存在时使用本文件的参数
+CLOCK_SKEW_TOLERANCE = 5  # 启动时签名请求失败且本地时钟偏差超过该值(秒)时，按服务器时间校正后重试一次
+DATA_DIR = ''  # 订单记录、网格状态、日志等本地文件的目录，空字符串为当前目录；多账户运行时每个账户一个目录
+LOCAL_FILES = ("ORDER_RECORDS_FILE", "ORDER_LOG_FILE", "GRID_STATE_FILE", "GRID_STATE_LOG_FILE",
+               "INSTRUMENTS_CACHE_FILE", "CL_ORD_ID_SEQ_FILE", "LOG_FILE", "RECORD_FILE")  # 放在 DATA_DIR 下的文件
+
+
+def load_config(path=CONFIG_FILE):
+    """读取配置文件，文件不存在时返回 {}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def apply_config(config):
+    """用配置覆盖本文件中的参数，键为参数名，例如
+    {"API_KEY": "...", "long_trigger_price": 85000, "short_position": 0.008, "EXTRA_GRIDS": [...]}
+    参数名不存在时报错，避免拼错的参数被静默忽略；设置了 DATA_DIR 时本地文件的相对路径放到该目录下
+    """
+    module = globals()
+    unknown = [key for key in config
+               if not isinstance(module.get(key), (bool, int, float, str, list, dict, tuple))]
+    if unknown:
+        raise ValueError(f"配置中有未知参数: {', '.join(unknown)}")
+    module.update(config)
+    if DATA_DIR:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        for name in LOCAL_FILES:
+            if module[name] and not os.path.isabs(module[name]):
+                module[name] = os.path.join(DATA_DIR, module[name])
+    return config
+
+
+# supervisor.py 在一个进程中运行多个账户时，执行本文件前放入各账户的 BOT_CONFIG，否则读取配置文件；
+# 空的 BOT_CONFIG 表示不覆盖任何参数，同样不读取配置文件
+_bot_config = globals().get("BOT_CONFIG")
+loaded_config = apply_config(load_config() if _bot_config is None else _bot_config)
+
+
+class EventLog:
+    """结构化日志
+    调用处只把 (时间, 级别, 事件名, 消息模板, 字段) 放入内存环形缓冲区，不格式化、不做 IO；
+    后台线程定期取出，格式化后写入按大小轮转的日志文件并输出到控制台，
+    终端或管道阻塞只会拖慢后台线程，缓冲区满时丢弃最旧的记录并计数。
+    低于 LOG_LEVEL 的记录直接忽略，LOG_SAMPLE_RATES 中的事件按比例采样
+    """
+    LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+    LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+    def __init__(self, path=LOG_FILE, level=LOG_LEVEL, console=LOG_CONSOLE, size=LOG_BUFFER_SIZE):
+        self.path = path
+        self.level = self.LEVELS[level]
+        self.console = console
+        self.size = size
+        self.buffer = deque(maxlen=size)  # deque 的 append/popleft 线程安全
+        self.dropped = 0
+        self.thread = None
+        self.stopping = threading.Event()
+        self.file = None
+        self.file_size = 0
+
+    def log(self, level, event, msg="", **fields):
+        """记录一条事件，msg 为 str.format 模板，由后台线程按字段格式化"""
+        self.record(level, event, msg, fields)
+
+    def record(self, level, event, msg, fields):
+        if level < self.level:
+            return
+        rate = LOG_SAMPLE_RATES.get(event)
+        if rate is not None and random.random() >= rate:
+            return
+        if len(self.buffer) == self.size:
+            self.dropped += 1
+        self.buffer.append((time.time(), level, event, msg, fields))
+
+    def debug(self, event, msg="", **fields):
+        self.record(10, event, msg, fields)
+
+    def info(self, event, msg="", **fields):
+        self.record(20, event, msg, fields)
+
+    def warning(self, event, msg="", **fields):
+        self.record(30, event, msg, fields)
+
+    def error(self, event, msg="", **fields):
+        self.record(40, event, msg, fields)
+
+    def start(self):
+        """启动后台写出线程，已启动时忽略"""
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """写出剩余记录并停止后台线程"""
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def run(self):
+        while not self.stopping.wait(LOG_FLUSH_INTERVAL):
+            self.drain()
+        self.drain()
+
+    def drain(self):
+        """取出缓冲区的全部记录写出"""
+        lines, texts = [], []
+        while self.buffer:
+            timestamp, level, event, msg, fields = self.buffer.popleft()
+            try:
+                text = msg.format(**fields) if fields else msg
+            except Exception:
+                text = msg
+            record = {"ts": round(timestamp, 3), "level": self.LEVEL_NAMES[level], "event": event}
+            if text:
+                record["msg"] = text.strip()
+            record.update(fields)
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            if self.console and text:
+                texts.append(text)
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append(json.dumps({"ts": round(time.time(), 3), "level": "warning", "event": "log_dropped",
+                                     "count": dropped}))
+            texts.append(f"⚠️ 日志缓冲区已满，丢弃 {dropped} 条记录")
+        try:
+            if lines and self.path:
+                self.write("\n".join(lines) + "\n")
+            if texts:
+                sys.stdout.write("\n".join(texts) + "\n")
+                sys.stdout.flush()
+        except Exception as e:
+            sys.stderr.write(f"❌ 写日志失败: {e}\n")
+
+    def write(self, data):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.file_size = self.file.tell()
+        size = len(data.encode('utf-8'))
+        if self.file_size and self.file_size + size > LOG_MAX_BYTES:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.file_size += size
+
+    def rotate(self):
+        """okx-bot.log -> okx-bot.log.1 -> ... -> okx-bot.log.N，超出的删除"""
+        self.file.close()
+        for i in range(LOG_BACKUP_COUNT - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if LOG_BACKUP_COUNT:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.file_size = 0
 
 
-def save_order_info(order_type, order_id, price, pos_side=None):
-    """保存订单信息到 JSON 文件
-    order_type: 'buy' 或 'sell'
-    order_id: 订单ID
-    price: 委托价格
-    pos_side: 持仓方向 'long' 或 'short'
+log = EventLog()
+
+
+class Histogram:
+    """耗时直方图: 记录总次数、总耗时和最大值，分位数按最近的样本计算"""
+    __slots__ = ("samples", "count", "total", "max")
+
+    def __init__(self, size=METRICS_SAMPLE_SIZE):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def summary(self):
+        """返回 {count, avg, p50, p99, max}，单位毫秒"""
+        ordered = sorted(self.samples)
+
+        def percentile(pct):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000 if ordered else 0.0
+
+        return {"count": self.count, "avg": self.total / self.count * 1000 if self.count else 0.0,
+                "p50": percentile(50), "p99": percentile(99), "max": self.max * 1000}
+
+
+class Span:
+    """计时片段，with 结束时把耗时记入直方图"""
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    """运行指标: 成交处理各阶段耗时、订单计数和事件循环卡顿
+    记录时只做追加和计数，分位数在读取时计算，可常驻开启
+    """
+
+    def __init__(self):
+        self.histograms = {}  # 名称 -> Histogram
+        self.counters = Counter()  # 名称 -> 次数
+        self.gauges = {}  # 名称 -> 当前值
+        self.started = time.time()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def span(self, name):
+        """计时: with metrics.span("place"): ..."""
+        return Span(self.histogram(name))
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def incr(self, name, count=1):
+        self.counters[name] += count
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        return {
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+        }
+
+    def render(self, labels=None):
+        """Prometheus 文本格式，labels 为附加到每个指标的标签(多账户汇总时区分账户)"""
+        extra = ",".join(f'{key}="{value}"' for key, value in (labels or {}).items())
+        tag = f"{{{extra}}}" if extra else ""
+        lines = [f"okx_bot_uptime_seconds{tag} {time.time() - self.started:.0f}"]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"okx_bot_{name}_total{tag} {value}")
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"okx_bot_{name}{tag} {value}")
+        for name, histogram in sorted(self.histograms.items()):
+            summary = histogram.summary()
+            lines.append(f"okx_bot_{name}_seconds_count{tag} {summary['count']}")
+            lines.append(f"okx_bot_{name}_seconds_sum{tag} {histogram.total:.6f}")
+            for quantile in ("p50", "p99"):
+                lines.append(f'okx_bot_{name}_seconds{{{extra + "," if extra else ""}quantile="0.{quantile[1:]}"}} '
+                             f'{summary[quantile] / 1000:.6f}')
+            lines.append(f"okx_bot_{name}_seconds_max{tag} {histogram.max:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """监控摘要，用于定期打印"""
+        values = sorted(self.counters.items()) + sorted(self.gauges.items())
+        lines = ["📊 监控摘要: " + "  ".join(f"{name} {value}" for name, value in values)]
+        for name, histogram in sorted(self.histograms.items()):
+            summary = histogram.summary()
+            lines.append(f"  • {name:<10} 次数 {summary['count']:>7}  p50 {summary['p50']:8.2f}ms  "
+                         f"p99 {summary['p99']:8.2f}ms  最大 {summary['max']:8.2f}ms")
+        return "\n".join(lines)
+
+    async def monitor_loop_lag(self, interval=METRICS_LAG_INTERVAL):
+        """定期采样事件循环卡顿: 实际休眠时间超出预期的部分"""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.observe("loop_lag", max(0.0, time.perf_counter() - start - interval))
+
+    async def report(self, interval=METRICS_SUMMARY_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            log.info("metrics_summary", "{summary}", summary=self.summary())
+
+    async def serve(self, host=METRICS_HOST, port=METRICS_PORT):
+        """启动本地监控接口，返回 runner，退出时调用 runner.cleanup()"""
+        async def handle_metrics(request):
+            return aiohttp.web.Response(text=self.render())
+
+        async def handle_metrics_json(request):
+            return aiohttp.web.json_response(self.snapshot())
+
+        app = aiohttp.web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        app.router.add_get("/metrics.json", handle_metrics_json)
+        runner = aiohttp.web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await aiohttp.web.TCPSite(runner, host, port).start()
+        log.info("metrics_serve", "📊 监控接口: http://{host}:{port}/metrics", host=host, port=port)
+        return runner
+
+
+metrics = Metrics()
+
+
+def timed(name):
+    """记录异步函数耗时的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class AppendOnlyLog:
+    """追加写日志: 每行一条 JSON 记录，配合快照文件定期压缩
+    snapshot_file: 快照文件
+    log_file: 增量日志文件
+    """
+
+    def __init__(self, snapshot_file, log_file):
+        self.snapshot_file = snapshot_file
+        self.log_file = log_file
+        self.line_count = 0
+        self._fp = None
+
+    def load(self):
+        """读取快照和增量日志，返回 (snapshot, records)"""
+        snapshot = None
+        records = []
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'r') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半，跳过
+                        continue
+        self.line_count = len(records)
+        return snapshot, records
+
+    def append(self, record):
+        """追加一条记录"""
+        if self._fp is None:
+            self._fp = open(self.log_file, 'a')
+        self._fp.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._fp.flush()
+        self.line_count += 1
+
+    def compact(self, snapshot):
+        """写入新快照并清空增量日志"""
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_file, self.snapshot_file)
+        if self._fp is not None:
+            self._fp.close()
+        self._fp = open(self.log_file, 'w')
+        self.line_count = 0
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class OrderRegistry:
+    """程序订单的内存索引
+    按 ordId / clOrdId 查询，启动时加载一次；新增订单和状态变化追加写入日志，
+    日志达到一定行数时压缩为快照，终态订单超过保留时间后被清理
     """
-    filename = 'order_records.json'
-    try:
-        # 读取现有数据
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                data = json.load(f)
-        else:
-            data = {'orders': {}}
 
-        # 添加新订单信息
-        data['orders'][str(order_id)] = {
-            'side': order_type,
+    def __init__(self, snapshot_file=ORDER_RECORDS_FILE, log_file=ORDER_LOG_FILE,
+                 retention=ORDER_RETENTION_SECONDS):
+        self.store = AppendOnlyLog(snapshot_file, log_file)
+        self.retention = retention
+        self.orders = {}  # ordId -> 订单信息
+        self.cl_ord_ids = {}  # clOrdId -> ordId
+
+    def load(self):
+        """从快照和增量日志恢复订单索引"""
+        try:
+            snapshot, records = self.store.load()
+        except Exception as e:
+            log.error("registry_load_failed", "❌ 读取订单信息失败: {error}", error=e)
+            return
+        for ord_id, info in (snapshot or {}).get('orders', {}).items():
+            self._index(ord_id, info)
+        for record in records:
+            self._apply(record)
+        # 旧版本的订单记录只有 side/price/pos_side，无法确认是否仍在挂单中，视为已结束，保留时间过后清理；
+        # 否则重连校准时会逐笔查询，把早已处理过的成交再推进一次网格
+        legacy = [info for info in self.orders.values() if 'state' not in info]
+        for info in legacy:
+            info.update(state=None, closed_at=time.time())
+        if legacy:
+            log.info("registry_legacy", "♻️ 旧版本订单记录 {count} 条视为已结束", count=len(legacy))
+            self.compact()
+        self.evict_expired()
+        log.info("registry_loaded", "✅ 已加载订单记录: {count} 条", count=len(self.orders))
+
+    def _index(self, ord_id, info):
+        self.orders[ord_id] = info
+        if info.get('cl_ord_id'):
+            self.cl_ord_ids[info['cl_ord_id']] = ord_id
+
+    def _apply(self, record):
+        """回放一条日志记录"""
+        ord_id = record['ordId']
+        if record['op'] == 'add':
+            self._index(ord_id, record['info'])
+        elif record['op'] == 'state' and ord_id in self.orders:
+            self.orders[ord_id]['state'] = record['state']
+            self.orders[ord_id]['closed_at'] = record.get('closed_at')
+        elif record['op'] == 'amend' and ord_id in self.orders:
+            self.orders[ord_id]['price'] = record['price']
+
+    def _write(self, record):
+        try:
+            self.store.append(record)
+            if self.store.line_count >= ORDER_LOG_COMPACT_LINES:
+                self.compact()
+        except Exception as e:
+            log.error("registry_write_failed", "❌ 保存订单信息失败: {error}", error=e)
+
+    def add(self, ord_id, side, price, pos_side=None, cl_ord_id=None, inst_id=None):
+        """登记新订单"""
+        ord_id = str(ord_id)
+        info = {
+            'side': side,
             'price': float(price),
-            'pos_side': pos_side
+            'pos_side': pos_side,
+            'cl_ord_id': cl_ord_id,
+            'inst_id': inst_id,
+            'state': 'live',
+            'closed_at': None,
         }
+        self._index(ord_id, info)
+        self._write({'op': 'add', 'ordId': ord_id, 'info': info})
+
+    def get(self, ord_id):
+        """按 ordId 查询订单信息，不存在返回 None"""
+        return self.orders.get(str(ord_id))
+
+    def as_order(self, ord_id):
+        """按订单记录构造挂单数据(本地挂单簿中没有该订单时使用)"""
+        info = self.orders[ord_id]
+        return {"ordId": ord_id, "instId": info['inst_id'], "clOrdId": info.get('cl_ord_id'),
+                "side": info['side'], "posSide": info['pos_side'], "px": str(info['price']), "state": "live",
+                "uTime": "0"}
+
+    def get_by_cl_ord_id(self, cl_ord_id):
+        """按 clOrdId 查询订单信息，不存在返回 None"""
+        ord_id = self.cl_ord_ids.get(cl_ord_id)
+        return self.orders.get(ord_id) if ord_id else None
+
+    def update_state(self, ord_id, state):
+        """记录订单状态变化，非程序订单或状态未变化时忽略"""
+        info = self.orders.get(str(ord_id))
+        if info is None or not state or info.get('state') == state:
+            return
+        info['state'] = state
+        info['closed_at'] = time.time() if state in TERMINAL_ORDER_STATES else None
+        self._write({'op': 'state', 'ordId': str(ord_id), 'state': state, 'closed_at': info['closed_at']})
+
+    def update_price(self, ord_id, price):
+        """记录改单后的新价格"""
+        info = self.orders.get(str(ord_id))
+        if info is None:
+            return
+        info['price'] = float(price)
+        self._write({'op': 'amend', 'ordId': str(ord_id), 'price': info['price']})
 
-        # 保存到文件
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+    def evict_expired(self, now=None):
+        """清理超过保留时间的终态订单"""
+        now = now or time.time()
+        expired = [ord_id for ord_id, info in self.orders.items()
+                   if info.get('closed_at') and now - info['closed_at'] > self.retention]
+        for ord_id in expired:
+            info = self.orders.pop(ord_id)
+            self.cl_ord_ids.pop(info.get('cl_ord_id'), None)
+        return len(expired)
 
-        # print(f"✅ 已保存订单信息: ID={order_id}, 方向={order_type}, 持仓方向={pos_side}, 价格={price}")
-    except Exception as e:
-        print(f"❌ 保存订单信息失败: {e}")
+    def compact(self):
+        """清理过期订单并把当前索引压缩为快照"""
+        self.evict_expired()
+        self.store.compact({'orders': self.orders})
+
+
+order_registry = OrderRegistry()
+
+
+def save_order_info(order_type, order_id, price, pos_side=None, cl_ord_id=None, inst_id=None):
+    """保存订单信息到订单索引
+    order_type: 'buy' 或 'sell'
+    order_id: 订单ID
+    price: 委托价格
+    pos_side: 持仓方向 'long' 或 'short'
+    cl_ord_id: 客户自定义订单ID
+    inst_id: 合约，重连后查询订单最终状态时需要
+    """
+    order_registry.add(order_id, order_type, price, pos_side, cl_ord_id, inst_id)
 
 
 def get_order_info(order_id):
-    """从 JSON 文件中读取订单信息
+    """从订单索引中读取订单信息
     返回: (order_type, price, pos_side) 或 (None, None, None)
     """
-    filename = 'order_records.json'
-    try:
-        if not os.path.exists(filename):
-            return None, None, None
+    info = order_registry.get(order_id)
+    if info is None:
+        return None, None, None
+    return info['side'], info['price'], info['pos_side']
 
-        with open(filename, 'r') as f:
-            data = json.load(f)
 
-        # 查找订单
-        order_id = str(order_id)
-        if order_id in data.get('orders', {}):
-            order_info = data['orders'][order_id]
-            return order_info['side'], order_info['price'], order_info['pos_side']
+class ClOrdIdSequence:
+    """clOrdId 序号
+    序号按 CL_ORD_ID_BLOCK 个一块预留并写入文件，重启后从上次预留的末尾继续，
+    不会复用已经发出的 clOrdId，每用完一块才写一次文件；
+    未调用 load 时(回测、压测)只在内存中计数，不写文件
+    """
 
-        return None, None, None
-    except Exception as e:
-        print(f"❌ 读取订单信息失败: {e}")
-        return None, None, None
+    def __init__(self, path=CL_ORD_ID_SEQ_FILE, block=CL_ORD_ID_BLOCK):
+        self.path = path
+        self.block = block
+        self.next = 0
+        self.limit = None  # 已预留到的序号，None 表示不持久化
+
+    def load(self):
+        """从文件恢复序号，文件不存在时从 0 开始"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.next = max(self.next, json.load(f)['next'])
+        except Exception as e:
+            log.error("clordid_seq_load_failed", "❌ 读取 clOrdId 序号失败: {error}", error=e)
+        self.limit = self.next
+
+    def take(self):
+        """取下一个序号，当前块用完时先预留下一块"""
+        if self.limit is not None and self.next >= self.limit:
+            self.reserve()
+        value = self.next
+        self.next += 1
+        return value
+
+    def reserve(self):
+        self.limit = self.next + self.block
+        try:
+            tmp_file = self.path + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump({'next': self.limit}, f)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            log.error("clordid_seq_write_failed", "❌ 保存 clOrdId 序号失败: {error}", error=e)
+
+
+cl_ord_id_sequence = ClOrdIdSequence()
+
+
+def generate_clOrdId(side, pos_side="long", price=0, inst_id=DEFAULT_INST_ID):
+    """生成 clOrdId: 币种 + 买卖方向 + 持仓方向 + 价格档位(价格 / 价格精度) + n + 序号，只含字母和数字
+    同一笔委托重发时沿用原 clOrdId，交易所按 clOrdId 去重，不会重复下单
+    """
+    grid = grids.get(inst_id)
+    level = round(float(price) / (grid.tick_size if grid is not None else DEFAULT_TICK_SIZE))
+    return f"{inst_id.split('-')[0][:6]}{side[0]}{pos_side[0]}{level}n{cl_ord_id_sequence.take()}"
 
 
-def generate_clOrdId(side):
-    """生成唯一 clOrdId"""
-    timestamp = str(int(time.time() * 1000))
-    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"{side}{random_str}{timestamp[-6:]}"[:32]
+def round_price(price, tick_size):
+    """按价格精度取整"""
+    decimals = max(0, -Decimal(str(tick_size)).as_tuple().exponent)
+    return round(round(price / tick_size) * tick_size, decimals)
 
 
-def calculate_grid_prices(trigger_price, pos_side="long"):
-    """计算网格价格"""
-    if pos_side == "long":
-        buy_price = round(trigger_price * (1 - long_grid_percentage), 2)
-        close_long_price = round(trigger_price * (1 + long_grid_percentage), 2)
-    else:  # short
-        buy_price = round(trigger_price * (1 - short_grid_percentage), 2)
-        close_long_price = round(trigger_price * (1 + short_grid_percentage), 2)
+def calculate_grid_prices(trigger_price, grid_percentage, tick_size=DEFAULT_TICK_SIZE):
+    """计算网格价格
+    返回: (下方价格, 上方价格)
+    """
+    buy_price = round_price(trigger_price * (1 - grid_percentage), tick_size)
+    close_long_price = round_price(trigger_price * (1 + grid_percentage), tick_size)
     return buy_price, close_long_price
 
 
-def generate_signature(timestamp, method, request_path, body=""):
+class GridLadder:
+    """多层网格价格
+    网格价格固定在 anchor * (1 + grid_percentage) ^ i 上(按价格精度取整)，层级 i 到价格的换算会缓存；
+    成交后以成交层为中心移动挂单窗口，只对进入和离开窗口的层级下单/撤单
+    """
+
+    def __init__(self, anchor_price, grid_percentage, tick_size):
+        self.anchor_price = anchor_price
+        self.log_step = math.log1p(grid_percentage)
+        self.tick_size = tick_size
+        self.prices = {}  # 层级 -> 价格
+
+    def price(self, level):
+        price = self.prices.get(level)
+        if price is None:
+            price = self.prices[level] = round_price(self.anchor_price * math.exp(level * self.log_step),
+                                                      self.tick_size)
+        return price
+
+    def level_of(self, price):
+        """价格所在的层级(取最近的一层)"""
+        return round(math.log(price / self.anchor_price) / self.log_step)
+
+    def window(self, grid_side, center, position):
+        """以 center 层为中心的目标挂单: 层级 -> (方向, 数量, 是否平仓)
+        开仓层数受剩余可开仓量限制，平仓层数受当前持仓限制
+        """
+        levels = grid_side.ladder_levels
+        step = -1 if grid_side.pos_side == "long" else 1  # 多单向下开仓、向上平仓，空单相反
+        desired = {}
+        open_room = grid_side.max_position - position
+        for i in range(1, levels + 1):
+            if open_room < grid_side.grid_size - 1e-12:
+                break
+            desired[center + step * i] = (grid_side.open_side, grid_side.grid_size, False)
+            open_room -= grid_side.grid_size
+        remaining = position
+        for i in range(1, levels + 1):
+            if remaining <= 1e-12:
+                break
+            size = min(remaining, grid_side.grid_size)
+            desired[center - step * i] = (grid_side.close_side, size, True)
+            remaining -= size
+        return desired
+
+
+class GridSide:
+    """单个合约单个方向(多/空)的网格参数和状态"""
+
+    def __init__(self, pos_side, enabled, trigger_price, grid_percentage, grid_size, max_position, position=0,
+                 take_profit_count=0, ladder_levels=1):
+        self.pos_side = pos_side
+        self.open_side = "buy" if pos_side == "long" else "sell"  # 开仓方向
+        self.close_side = "sell" if pos_side == "long" else "buy"  # 平仓方向
+        self.name = "多" if pos_side == "long" else "空"
+        self.enabled = enabled
+        self.trigger_price = trigger_price
+        self.anchor_price = trigger_price  # 多层网格的基准价格，固定为首次运行时配置的触发价格
+        self.grid_percentage = grid_percentage
+        self.grid_size = grid_size
+        self.max_position = max_position
+        self.position = position  # 配置的持仓，仅在无法从交易所获取时使用
+        self.take_profit_count = take_profit_count
+        self.ladder_levels = int(ladder_levels)
+        self.ladder = None  # 多层网格，ladder_levels > 1 时由 GridState 按价格精度创建
+
+    def grid_prices(self, trigger_price, tick_size):
+        """返回 (开仓价格, 平仓价格): 多单低买高平，空单高卖低平"""
+        lower_price, upper_price = calculate_grid_prices(trigger_price, self.grid_percentage, tick_size)
+        return (lower_price, upper_price) if self.pos_side == "long" else (upper_price, lower_price)
+
+
+class GridState:
+    """单个合约的网格
+    张数和币数量的换算用 Decimal 按合约面值和数量精度精确计算
+    """
+
+    def __init__(self, inst_id, long, short, tick_size=DEFAULT_TICK_SIZE, ct_val=DEFAULT_CT_VAL,
+                 lot_size=DEFAULT_LOT_SIZE, min_size=DEFAULT_MIN_SIZE):
+        self.inst_id = inst_id
+        self.sides = {"long": long, "short": short}
+        self.set_spec(tick_size, ct_val, lot_size, min_size)
+
+    def set_spec(self, tick_size, ct_val, lot_size, min_size):
+        """设置合约规格(价格精度、面值、数量精度、最小数量)"""
+        self.tick_size = float(tick_size)
+        self.ct_val = float(ct_val)
+        self.ct_val_decimal = Decimal(str(ct_val))
+        self.lot_size = Decimal(str(lot_size))
+        self.min_size = Decimal(str(min_size))
+        self.build_ladders()
+
+    def build_ladders(self):
+        """按基准价格和价格精度创建多层网格(ladder_levels > 1 的方向)
+        以基准价格而不是当前触发价格创建，重启后网格仍是同一组价格，恢复的触发价格落在其中一层上
+        """
+        for grid_side in self.sides.values():
+            if grid_side.ladder_levels > 1:
+                grid_side.ladder = GridLadder(grid_side.anchor_price, grid_side.grid_percentage, self.tick_size)
+
+    def to_contracts(self, size):
+        """币数量换算为张数(Decimal)，按数量精度向下取整"""
+        return (Decimal(str(size)) / self.ct_val_decimal).quantize(self.lot_size, rounding=ROUND_DOWN)
+
+    def to_coins(self, contracts):
+        """张数(字符串或 Decimal)换算为币数量"""
+        return float(Decimal(contracts) * self.ct_val_decimal)
+
+    @classmethod
+    def from_config(cls, config):
+        sides = {}
+        for pos_side in ("long", "short"):
+            side_config = dict(config.get(pos_side) or {"enabled": False, "trigger_price": 0, "grid_percentage": 0,
+                                                        "grid_size": 0, "max_position": 0})
+            sides[pos_side] = GridSide(pos_side, side_config.pop("enabled", True), **side_config)
+        return cls(config["inst_id"], sides["long"], sides["short"], config.get("tick_size", DEFAULT_TICK_SIZE),
+                   config.get("ct_val", DEFAULT_CT_VAL), config.get("lot_size", DEFAULT_LOT_SIZE),
+                   config.get("min_size", DEFAULT_MIN_SIZE))
+
+
+def build_grids():
+    """根据配置生成全部网格: inst_id -> GridState"""
+    default_grid = GridState(
+        DEFAULT_INST_ID,
+        GridSide("long", enable_long_grid, long_trigger_price, long_grid_percentage, long_grid_size,
+                 long_max_position, long_position, long_take_profit_count, long_ladder_levels),
+        GridSide("short", enable_short_grid, short_trigger_price, short_grid_percentage, short_grid_size,
+                 short_max_position, short_position, short_take_profit_count, short_ladder_levels),
+    )
+    result = {default_grid.inst_id: default_grid}
+    for config in EXTRA_GRIDS:
+        grid = GridState.from_config(config)
+        result[grid.inst_id] = grid
+    return result
+
+
+grids = build_grids()
+
+
+class GridJournal:
+    """网格状态日志
+    每次成交推进网格后追加一条记录(触发价格、多层网格的基准价格、止盈次数、持仓)，日志达到一定行数时压缩为快照；
+    启动时回放恢复上次运行的网格状态，配置中的数值只在首次运行时使用
+    """
+
+    def __init__(self, snapshot_file=GRID_STATE_FILE, log_file=GRID_STATE_LOG_FILE):
+        self.store = AppendOnlyLog(snapshot_file, log_file)
+        self.states = {}  # "instId:posSide" -> {"trigger_price", "anchor_price", "take_profit_count", "position", "time"}
+
+    def load(self):
+        """从快照和增量日志恢复网格状态"""
+        try:
+            snapshot, records = self.store.load()
+        except Exception as e:
+            log.error("journal_load_failed", "❌ 读取网格状态失败: {error}", error=e)
+            return
+        self.states = (snapshot or {}).get('grids', {})
+        for record in records:
+            self.states[record['key']] = record['state']
+        log.info("journal_loaded", "✅ 已加载网格状态: {count} 个方向", count=len(self.states))
+
+    def restore(self, grids):
+        """把恢复的状态应用到网格"""
+        for grid in grids.values():
+            for pos_side, grid_side in grid.sides.items():
+                state = self.states.get(f"{grid.inst_id}:{pos_side}")
+                if state is None:
+                    continue
+                grid_side.trigger_price = state['trigger_price']
+                # 旧记录没有基准价格，沿用配置的触发价格
+                grid_side.anchor_price = state.get('anchor_price', grid_side.anchor_price)
+                grid_side.take_profit_count = state['take_profit_count']
+                grid_side.position = state['position']
+                log.info("grid_restored", "♻️ {inst_id} {name}单恢复: 触发价格 {trigger_price} / 止盈次数 "
+                         "{take_profit_count} / 持仓 {position}", inst_id=grid.inst_id, name=grid_side.name,
+                         trigger_price=grid_side.trigger_price, take_profit_count=grid_side.take_profit_count,
+                         position=grid_side.position)
+            grid.build_ladders()
+
+    def record(self, inst_id, grid_side, position):
+        """记录一个方向的最新状态，未变化时不写"""
+        key = f"{inst_id}:{grid_side.pos_side}"
+        state = {'trigger_price': grid_side.trigger_price, 'anchor_price': grid_side.anchor_price,
+                 'take_profit_count': grid_side.take_profit_count, 'position': position}
+        current = self.states.get(key)
+        if current is not None and all(current.get(name) == value for name, value in state.items()):
+            return
+        state['time'] = time.time()
+        self.states[key] = state
+        try:
+            self.store.append({'key': key, 'state': state})
+            if self.store.line_count >= GRID_STATE_COMPACT_LINES:
+                self.compact()
+        except Exception as e:
+            log.error("journal_write_failed", "❌ 保存网格状态失败: {error}", error=e)
+
+    def compact(self):
+        self.store.compact({'grids': self.states})
+
+
+grid_journal = GridJournal()
+
+
+def to_contracts(inst_id, size):
+    """币数量换算为张数(Decimal)，未配置网格的合约按默认规格"""
+    grid = grids.get(inst_id)
+    if grid is not None:
+        return grid.to_contracts(size)
+    return (Decimal(str(size)) / Decimal(str(DEFAULT_CT_VAL))).quantize(Decimal(str(DEFAULT_LOT_SIZE)),
+                                                                       rounding=ROUND_DOWN)
+
+
+def to_coins(inst_id, contracts):
+    """张数(字符串或 Decimal)换算为币数量"""
+    grid = grids.get(inst_id)
+    ct_val = grid.ct_val_decimal if grid is not None else Decimal(str(DEFAULT_CT_VAL))
+    return float(Decimal(contracts or 0) * ct_val)
+
+
+class InstrumentSpecs:
+    """合约规格
+    启动时从 /api/v5/public/instruments 获取一次网格合约的面值、价格精度、数量精度和最小数量，
+    写入缓存文件；查询失败时使用缓存，缓存也没有时使用配置
+    """
+
+    def __init__(self, cache_file=INSTRUMENTS_CACHE_FILE):
+        self.cache_file = cache_file
+        self.specs = {}  # instId -> {"tickSz", "ctVal", "lotSz", "minSz"}
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                self.specs = json.load(f)
+        except FileNotFoundError:
+            self.specs = {}
+        except Exception as e:
+            log.error("instruments_cache_failed", "❌ 读取合约规格缓存失败: {error}", error=e)
+            self.specs = {}
+
+    async def fetch(self, inst_id):
+        try:
+            response_data = await rest_client.get("/api/v5/public/instruments", {"instType": "SWAP", "instId": inst_id})
+        except Exception as e:
+            log.error("instruments_failed", "❌ 获取合约规格失败: {inst_id} {error}", inst_id=inst_id, error=e)
+            return None
+        if response_data.get("code") != "0" or not response_data.get("data"):
+            log.error("instruments_failed", "❌ 获取合约规格失败: {inst_id} {error}", inst_id=inst_id,
+                      error=response_data.get('msg'))
+            return None
+        item = response_data["data"][0]
+        return {key: item[key] for key in ("tickSz", "ctVal", "lotSz", "minSz")}
+
+    async def load(self, grids):
+        """获取并应用全部网格合约的规格"""
+        self.apply(grids, await self.fetch_all(list(grids)))
+
+    async def fetch_all(self, inst_ids):
+        """同时获取多个合约的规格，返回 instId -> 规格(失败的合约不在其中)"""
+        fetched = await asyncio.gather(*(self.fetch(inst_id) for inst_id in inst_ids))
+        return {inst_id: spec for inst_id, spec in zip(inst_ids, fetched) if spec is not None}
+
+    def apply(self, grids, updated):
+        """合并获取到的规格和缓存，写入缓存文件并应用到网格"""
+        self.load_cache()
+        if updated:
+            self.specs.update(updated)
+            try:
+                with open(self.cache_file, 'w') as f:
+                    json.dump(self.specs, f)
+            except Exception as e:
+                log.error("instruments_cache_failed", "❌ 保存合约规格缓存失败: {error}", error=e)
+        for inst_id, grid in grids.items():
+            spec = self.specs.get(inst_id)
+            if spec is None:
+                log.warning("instruments_missing", "⚠️ {inst_id} 没有合约规格，使用配置的面值 {ct_val}",
+                            inst_id=inst_id, ct_val=grid.ct_val)
+                continue
+            grid.set_spec(spec["tickSz"], spec["ctVal"], spec["lotSz"], spec["minSz"])
+            log.info("instrument_spec", "✅ {inst_id} 合约规格: 面值 {ctVal} / 价格精度 {tickSz} / 数量精度 {lotSz} / "
+                     "最小数量 {minSz}", inst_id=inst_id, **spec)
+
+
+instrument_specs = InstrumentSpecs()
+
+
+def generate_signature(timestamp, method, request_path, body="", secret_key=None):
     """生成签名"""
     message = timestamp + method + request_path + body
-    mac = hmac.new(SECRET_KEY.encode("utf-8"), message.encode("utf-8"), hashlib.sha256)
+    mac = hmac.new((secret_key or SECRET_KEY).encode("utf-8"), message.encode("utf-8"), hashlib.sha256)
     return base64.b64encode(mac.digest()).decode("utf-8")
 
 
-def query_orders():
-    """查询现有委托单"""
-    endpoint = "/api/v5/trade/orders-pending"
-    url = BASE_URL + endpoint
-
-    timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
-    sign = generate_signature(timestamp, "GET", endpoint)
-
-    headers = {
-        "OK-ACCESS-KEY": API_KEY,
-        "OK-ACCESS-SIGN": sign,
-        "OK-ACCESS-TIMESTAMP": timestamp,
-        "OK-ACCESS-PASSPHRASE": PASSPHRASE,
-        "Content-Type": "application/json",
-    }
+def get_iso_timestamp():
+    """生成 REST 签名所需的 ISO 时间戳"""
+    return datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
+
+
+class Signer:
+    """请求签名
+    保存已写入密钥的 HMAC 状态(每次签名只复制，不重新计算密钥)和固定的请求头，
+    ISO 时间戳按秒缓存前缀，只拼接毫秒；时间按与交易所服务器的时钟偏差校正
+    """
+
+    def __init__(self, api_key, secret_key, passphrase):
+        self.api_key = api_key
+        self.passphrase = passphrase
+        self._mac = hmac.new(secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+        self.static_headers = {
+            "OK-ACCESS-KEY": api_key,
+            "OK-ACCESS-PASSPHRASE": passphrase,
+            "Content-Type": "application/json",
+        }
+        self.clock_offset = 0.0  # 交易所时间 - 本地时间(秒)
+        self._second = None
+        self._prefix = ""
+
+    def sign(self, message):
+        mac = self._mac.copy()
+        mac.update(message.encode("utf-8"))
+        return base64.b64encode(mac.digest()).decode("ascii")
+
+    def now(self):
+        """按时钟偏差校正后的当前时间(秒)"""
+        return time.time() + self.clock_offset
+
+    def iso_timestamp(self):
+        """ISO 时间戳(毫秒精度)，同一秒内复用格式化好的前缀"""
+        now = self.now()
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime("%Y-%m-%dT%H:%M:%S.", time.gmtime(second))
+        return f"{self._prefix}{int((now - second) * 1000):03d}Z"
+
+    def headers(self, method, request_path, body=""):
+        """生成带签名的请求头"""
+        timestamp = self.iso_timestamp()
+        headers = self.static_headers.copy()
+        headers["OK-ACCESS-SIGN"] = self.sign(timestamp + method + request_path + body)
+        headers["OK-ACCESS-TIMESTAMP"] = timestamp
+        return headers
+
+    def ws_login(self):
+        """生成 websocket 登录消息"""
+        timestamp = str(int(self.now()))
+        return {
+            "op": "login",
+            "args": [
+                {
+                    "apiKey": self.api_key,
+                    "passphrase": self.passphrase,
+                    "timestamp": timestamp,
+                    "sign": self.sign(timestamp + "GET/users/self/verify")
+                }
+            ]
+        }
+
+    def set_server_time(self, server_ms, sent, received):
+        """根据交易所服务器时间(毫秒)和请求往返时间计算时钟偏差"""
+        self.clock_offset = server_ms / 1000 - (sent + received) / 2
+
+
+signer = Signer(API_KEY, SECRET_KEY, PASSPHRASE)
+
+
+def body_template(keys):
+    """字段固定、取值都是字符串的请求体的预编码模板"""
+    return "{" + ",".join(f'"{key}":"%s"' for key in keys) + "}"
+
+
+# 网格固定格式的请求体(下单、撤单、改单)按字段顺序直接填入模板，其余请求体用 json 序列化
+BODY_TEMPLATES = {
+    keys: body_template(keys) for keys in (
+        ("instId", "tdMode", "clOrdId", "side", "ordType", "px", "sz", "posSide", "reduceOnly"),
+        ("ordId", "instId"),
+        ("instId", "ordId", "newPx", "newSz"),
+    )
+}
+
+
+def encode_body(body):
+    """序列化请求体，结果与 json.dumps(body, separators=(',', ':')) 相同"""
+    if isinstance(body, list):
+        return "[" + ",".join(map(encode_body, body)) + "]"
+    template = BODY_TEMPLATES.get(tuple(body))
+    if template is not None:
+        return template % tuple(body.values())
+    return json.dumps(body, separators=(',', ':'))
 
+
+class TokenBucket:
+    """限频令牌桶: 容量为窗口内的次数，令牌在请求完成 window 秒后归还
+    按完成时间计时，请求在连接池中排队也不会使交易所在一个窗口内收到超过限频的请求
+    """
+    __slots__ = ("capacity", "window", "tokens", "used")
+
+    def __init__(self, count, window):
+        self.capacity = count
+        self.window = window
+        self.tokens = count
+        self.used = deque()  # [完成时间(进行中为 inf), 数量]
+
+    def refill(self, now):
+        while self.used and now - self.used[0][0] >= self.window:
+            self.tokens += self.used.popleft()[1]
+
+    def delay(self, weight, now):
+        """还需等待多久才有 weight 个令牌(超过容量的请求等桶满后放行)，取决于进行中的请求时为 inf"""
+        need = min(weight, self.capacity) - self.tokens
+        returned_at = 0.0
+        for used_at, count in self.used:
+            if need <= 0:
+                break
+            returned_at = max(returned_at, used_at + self.window)  # 按先后顺序归还
+            need -= count
+        return max(0.0, returned_at - now) if need <= 0 else math.inf
+
+    def take(self, weight):
+        entry = [math.inf, weight]
+        self.tokens -= weight
+        self.used.append(entry)
+        return entry
+
+
+class RequestScheduler:
+    """客户端限频调度
+    每个接口(及共享限频)一个令牌桶；令牌不足时请求排队而不是发出后被交易所拒绝，
+    排队的请求按通道优先级放行: 撤单 > 下单/改单 > 查询 > 通知，
+    高优先级请求等待中的令牌桶不会被低优先级请求抢占；各通道的排队时间记录在 wait_<通道> 监控中
+    """
+
+    def __init__(self, limits=REST_RATE_LIMITS):
+        self.limits = limits
+        self.buckets = {}  # 限频键 -> TokenBucket
+        self.waiters = []  # (优先级, 序号, 令牌桶列表, 权重, future)
+        self.next_seq = 0
+        self.timer = None
+
+    def buckets_for(self, endpoint, inst_id=None):
+        """endpoint 为 "请求方法 接口" 或共享限频名，按合约限频的接口每个 inst_id 一个令牌桶"""
+        result = []
+        for key in [endpoint, *REST_RATE_LIMIT_GROUPS.get(endpoint, ())]:
+            if key not in self.limits:
+                continue
+            bucket_key = (key, inst_id) if key in REST_RATE_LIMITS_PER_INSTRUMENT else key
+            bucket = self.buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self.buckets[bucket_key] = TokenBucket(*self.limits[key])
+            result.append(bucket)
+        return result
+
+    @staticmethod
+    def try_take(buckets, weight, now):
+        """令牌足够时取走，返回占用记录，否则返回 None"""
+        for bucket in buckets:
+            bucket.refill(now)
+        if any(bucket.delay(weight, now) > 0 for bucket in buckets):
+            return None
+        return [bucket.take(weight) for bucket in buckets]
+
+    async def acquire(self, endpoint, weight=1, inst_id=None):
+        """等待令牌，weight 为本次请求占用的次数(批量接口按订单数计)，inst_id 用于按合约限频的接口
+        返回占用记录，请求完成后交给 release 开始计时
+        """
+        buckets = self.buckets_for(endpoint, inst_id)
+        if not buckets:
+            return None
+        lane = REST_LANES.get(endpoint, "query")
+        started = time.monotonic()
+        if not self.waiters:
+            ticket = self.try_take(buckets, weight, started)
+            if ticket is not None:
+                metrics.observe(f"wait_{lane}", 0.0)
+                return ticket
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((LANE_PRIORITY[lane], self.next_seq, buckets, weight, future))
+        self.next_seq += 1
+        self.pump()
+        ticket = await future
+        metrics.observe(f"wait_{lane}", time.monotonic() - started)
+        return ticket
+
+    def release(self, ticket):
+        """请求完成: 占用的令牌从现在起 window 秒后归还"""
+        if not ticket:
+            return
+        now = time.monotonic()
+        for entry in ticket:
+            entry[0] = now
+        if self.waiters:
+            self.pump()
+
+    def pump(self):
+        """按优先级放行排队的请求，并在最早可放行的时间再次检查"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        blocked = set()  # 被更高优先级请求占着的令牌桶
+        remaining = []
+        delay = math.inf
+        for entry in sorted(self.waiters, key=lambda entry: entry[:2]):
+            _, _, buckets, weight, future = entry
+            if future.done():  # 等待的协程已取消
+                continue
+            if blocked.isdisjoint(buckets):
+                ticket = self.try_take(buckets, weight, now)
+                if ticket is not None:
+                    future.set_result(ticket)
+                    continue
+                delay = min(delay, max(bucket.delay(weight, now) for bucket in buckets))
+            blocked.update(buckets)
+            remaining.append(entry)
+        self.waiters = remaining
+        metrics.set_gauge("rate_limit_waiting", len(remaining))
+        # 等待进行中的请求完成时由 release 再次检查
+        if remaining and delay != math.inf:
+            self.timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self.pump)
+
+    def penalize(self, endpoint, inst_id=None):
+        """交易所仍然返回限频时清空对应令牌桶，后续请求排队等待补充"""
+        now = time.monotonic()
+        for bucket in self.buckets_for(endpoint, inst_id):
+            bucket.refill(now)
+            if bucket.tokens > 0:
+                bucket.take(bucket.tokens)[0] = now
+
+
+request_scheduler = RequestScheduler()
+
+
+class OKXRestClient:
+    """异步 REST 客户端
+    所有请求共用一个 aiohttp 连接池(keep-alive)，统一签名，按接口设置超时，经 request_scheduler 限频排队，
+    同时进行的相同 GET 请求合并为一次，不会阻塞事件循环
+    """
+
+    def __init__(self, api_key, secret_key, passphrase, base_url=BASE_URL, pool_size=REST_POOL_SIZE, signer=None):
+        self.signer = signer or Signer(api_key, secret_key, passphrase)
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self._session = None
+        self._inflight = {}  # 请求路径 -> 进行中的 GET 请求
+
+    async def get_session(self):
+        """获取共享会话，首次调用时创建连接池"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=REST_KEEPALIVE_TIMEOUT,
+                                             ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def request(self, method, endpoint, params=None, body=None, weight=1):
+        """发送签名请求并返回 JSON 响应
+        params: GET 查询参数
+        body: POST 请求体
+        weight: 限频计数权重
+        """
+        request_path = endpoint + ("?" + urlencode(params) if params else "")
+        body_json = encode_body(body) if body is not None else ""
+        key = f"{method} {endpoint}"  # 超时、限频和优先级按请求方法和接口区分
+        inst_id = (params or {}).get("instId")
+        timeout = aiohttp.ClientTimeout(total=REST_TIMEOUTS.get(key, DEFAULT_REST_TIMEOUT))
+        session = await self.get_session()
+
+        response_data = {}
+        for attempt in range(REST_MAX_RETRIES + 1):
+            ticket = await request_scheduler.acquire(key, weight, inst_id)
+            try:
+                headers = self.signer.headers(method, request_path, body_json)
+                async with session.request(method, self.base_url + request_path, data=body_json or None,
+                                           headers=headers, timeout=timeout) as response:
+                    response_data = await response.json(content_type=None)
+            finally:
+                request_scheduler.release(ticket)
+            metrics.incr("rest_requests")
+            # 429 或 50011 表示触发交易所限频，退避后重试
+            if response.status == 429 or response_data.get("code") == "50011":
+                metrics.incr("rate_limited")
+                request_scheduler.penalize(key, inst_id)
+                log.warning("rate_limited", "⚠️ 触发限频: {endpoint}，{delay}秒后重试", endpoint=endpoint,
+                            delay=REST_RATE_LIMIT_BACKOFF * (attempt + 1))
+                await asyncio.sleep(REST_RATE_LIMIT_BACKOFF * (attempt + 1))
+                continue
+            return response_data
+        return response_data
+
+    async def get(self, endpoint, params=None):
+        """GET 请求，相同路径和参数的请求进行中时复用其结果"""
+        request_path = endpoint + ("?" + urlencode(params) if params else "")
+        task = self._inflight.get(request_path)
+        if task is None:
+            task = self._inflight[request_path] = asyncio.ensure_future(self.request("GET", endpoint, params=params))
+            task.add_done_callback(lambda _: self._inflight.pop(request_path, None))
+        else:
+            metrics.incr("rest_coalesced")
+        # shield: 其中一个调用方被取消时不影响其他等待同一请求的调用方
+        return await asyncio.shield(task)
+
+    async def post(self, endpoint, body, weight=1):
+        return await self.request("POST", endpoint, body=body, weight=weight)
+
+    async def sync_clock(self):
+        """查询交易所服务器时间，校正签名时间戳的时钟偏差"""
+        sent = time.time()
+        try:
+            response_data = await self.get("/api/v5/public/time")
+        except Exception as e:
+            log.error("clock_sync_failed", "❌ 查询服务器时间失败: {error}", error=e)
+            return
+        received = time.time()
+        if response_data.get("code") != "0":
+            log.error("clock_sync_failed", "❌ 查询服务器时间失败: {error}", error=response_data.get('msg'))
+            return
+        self.signer.set_server_time(int(response_data["data"][0]["ts"]), sent, received)
+        log.info("clock_offset", "🕒 本地时钟偏差: {offset_ms:+.0f}ms", offset_ms=self.signer.clock_offset * 1000)
+
+    async def post_webhook(self, url, data):
+        """发送不需要签名的 POST 请求(飞书等)，同样复用连接池"""
+        ticket = await request_scheduler.acquire("feishu-webhook")
+        try:
+            session = await self.get_session()
+            timeout = aiohttp.ClientTimeout(total=DEFAULT_REST_TIMEOUT)
+            async with session.post(url, json=data, timeout=timeout) as response:
+                return await response.json(content_type=None)
+        finally:
+            request_scheduler.release(ticket)
+
+
+rest_client = OKXRestClient(API_KEY, SECRET_KEY, PASSPHRASE, signer=signer)
+
+
+class ConnectionWatchdog:
+    """websocket 保活，与读取协程分开运行
+    空闲超过 WS_PING_INTERVAL 时发送应用层 ping，超过 WS_WATCHDOG_TIMEOUT 没有任何消息(含 pong)时
+    关闭连接，读取协程随之收到 ConnectionClosed 并重连；读取协程每收到一条消息调用 touch()
+    """
+
+    def __init__(self, websocket, name):
+        self.websocket = websocket
+        self.name = name
+        self.last_message = time.monotonic()
+
+    def touch(self):
+        self.last_message = time.monotonic()
+
+    async def run(self):
+        last_ping = 0
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            idle = now - self.last_message
+            if idle > WS_WATCHDOG_TIMEOUT:
+                log.error("watchdog_timeout", "\n❌ {name} {timeout}秒未收到任何消息，断开重连...", name=self.name,
+                          timeout=WS_WATCHDOG_TIMEOUT)
+                metrics.incr("watchdog_timeouts")
+                await self.websocket.close()
+                return
+            if idle >= WS_PING_INTERVAL and now - last_ping >= WS_PING_INTERVAL:
+                await self.websocket.send("ping")
+                last_ping = now
+
+
+class WsOrderGateway:
+    """websocket 交易通道
+    单独维持一条已登录的私有 websocket，发送 order / batch-orders / cancel-order / amend-order 等操作，
+    按请求 id 匹配回报；连接不可用时由调用方改用 REST
+    """
+
+    def __init__(self, api_key, secret_key, passphrase, url=WS_PRIVATE_URL, signer=None):
+        self.signer = signer or Signer(api_key, secret_key, passphrase)
+        self.url = url
+        self.websocket = None
+        self.pending = {}  # 请求 id -> 等待回报的 Future
+        self.next_id = 0
+
+    @property
+    def available(self):
+        return self.websocket is not None
+
+    async def run(self):
+        """维持连接，断线后自动重连"""
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    await websocket.send(json.dumps(self.signer.ws_login()))
+                    response = json.loads(await websocket.recv())
+                    if response.get("event") != "login" or response.get("code") != "0":
+                        raise ConnectionError(f"登录失败: {response}")
+                    log.info("ws_gateway_connected", "✅ websocket 交易通道已连接")
+                    self.websocket = websocket
+                    await self.read_loop(websocket)
+            except Exception as e:
+                log.warning("ws_gateway_closed", "⚠️ websocket 交易通道断开: {error}，{delay}秒后重连，期间使用 REST",
+                            error=e, delay=WS_RECONNECT_DELAY)
+                metrics.incr("reconnects")
+            finally:
+                self.websocket = None
+                self.fail_pending(ConnectionError("websocket 交易通道断开"))
+            await asyncio.sleep(WS_RECONNECT_DELAY)
+
+    async def read_loop(self, websocket):
+        """读取回报并按 id 交给等待的请求，由 ConnectionWatchdog 保活"""
+        watchdog = ConnectionWatchdog(websocket, "交易通道")
+        watchdog_task = asyncio.create_task(watchdog.run())
+        try:
+            while True:
+                message = await websocket.recv()
+                watchdog.touch()
+                if message == "pong":
+                    continue
+                response = json.loads(message)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            watchdog_task.cancel()
+
+    def fail_pending(self, error):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def request(self, op, args, timeout=WS_ORDER_TIMEOUT):
+        """发送交易操作并等待回报，返回与 REST 相同格式的响应"""
+        websocket = self.websocket
+        if websocket is None:
+            raise ConnectionError("websocket 交易通道未连接")
+        self.next_id += 1
+        request_id = str(self.next_id)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await websocket.send(f'{{"id":"{request_id}","op":"{op}","args":{encode_body(args)}}}')
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+
+ws_order_gateway = WsOrderGateway(API_KEY, SECRET_KEY, PASSPHRASE, signer=signer)
+
+# REST 交易接口对应的 websocket 操作
+TRADE_WS_OPS = {
+    "/api/v5/trade/order": "order",
+    "/api/v5/trade/batch-orders": "batch-orders",
+    "/api/v5/trade/cancel-order": "cancel-order",
+    "/api/v5/trade/cancel-batch-orders": "batch-cancel-orders",
+    "/api/v5/trade/amend-order": "amend-order",
+    "/api/v5/trade/amend-batch-orders": "batch-amend-orders",
+}
+PLACE_ENDPOINTS = {"/api/v5/trade/order", "/api/v5/trade/batch-orders"}
+
+
+async def send_trade_request(endpoint, body, weight=1):
+    """发送交易请求: websocket 交易通道可用时走 websocket，否则或失败时改用 REST
+    两种方式共用交易所限频，回报格式相同；
+    下单超时或断线时委托可能已经成交，clOrdId 只在挂单中查重，原样重发会重复下单，
+    因此不改用 REST 而是抛出异常，由调用方按 clOrdId 查询确认；撤单、改单重发没有副作用，直接改用 REST
+    """
+    if enable_ws_order_entry and ws_order_gateway.available:
+        ticket = await request_scheduler.acquire("POST " + endpoint, weight)
+        try:
+            return await ws_order_gateway.request(TRADE_WS_OPS[endpoint], body if isinstance(body, list) else [body])
+        except (ConnectionError, asyncio.TimeoutError, websockets.exceptions.ConnectionClosed) as e:
+            if endpoint in PLACE_ENDPOINTS:
+                raise
+            log.warning("ws_fallback", "⚠️ websocket 交易请求失败({error})，改用 REST", error=str(e) or '超时')
+            metrics.incr("ws_fallbacks")
+        finally:
+            request_scheduler.release(ticket)
+    return await rest_client.post(endpoint, body, weight=weight)
+
+
+async def fetch_pending_orders():
+    """分页查询全部挂单: 按 after 游标(上一页最后一笔的 ordId)翻页，直到返回不满一页
+    返回与单页查询相同格式的响应，data 为全部挂单；任一页失败时返回该页的响应
+    """
+    orders = []
+    params = {"limit": str(ORDERS_PENDING_PAGE_SIZE)}
+    while True:
+        response_data = await rest_client.get("/api/v5/trade/orders-pending", params)
+        if response_data.get("code") != "0":
+            return response_data
+        page = response_data.get("data") or []
+        orders.extend(page)
+        if len(page) < ORDERS_PENDING_PAGE_SIZE:
+            return {**response_data, "data": orders}
+        params = {**params, "after": page[-1]["ordId"]}
+
+
+async def query_orders():
+    """查询现有委托单"""
     try:
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
-        print(response_data)
+        response_data = await fetch_pending_orders()
+        log.debug("orders_pending_raw", response=response_data)
         if response_data.get("code") == "0":
             orders = response_data.get("data", [])
             if orders:
-                print("\n📋 当前委托单:")
+                log.info("orders_pending", "\n📋 当前委托单: {count} 笔", count=len(orders))
                 for order in orders:
                     side = order.get("side", "")
                     pos_side = order.get("posSide", "")
                     price = float(order.get("px", "0"))
-                    size = float(order.get("sz", "0")) / 100
+                    size = to_coins(order.get("instId"), order.get("sz", "0"))
                     ord_id = order.get("ordId", "")
                     state = order.get("state", "")
-                    print(
-                        f"  {side.upper()} {pos_side.upper()}: 价格 {price:.2f} / 数量 {size:.4f} / 状态 {state} / ID {ord_id}")
+                    log.info("order_pending", "  {side} {pos_side}: 价格 {price:.2f} / 数量 {size:.4f} / 状态 {state} / "
+                             "ID {ord_id}", side=side.upper(), pos_side=pos_side.upper(), price=price, size=size,
+                             state=state, ord_id=ord_id)
             return orders
         else:
-            print(f"❌ 查询订单失败: {response_data.get('msg')}")
+            log.error("orders_pending_failed", "❌ 查询订单失败: {error}", error=response_data.get('msg'))
             return []
 
     except Exception as e:
-        print(f"❌ 查询订单发生错误: {str(e)}")
+        log.error("orders_pending_failed", "❌ 查询订单发生错误: {error}", error=e)
         return []
 
 
-def cancel_order_rest_api(ord_id, inst_id):
-    """使用 REST API 撤单"""
-    endpoint = "/api/v5/trade/cancel-order"
-    url = BASE_URL + endpoint
-    timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
+class OpenOrderBook:
+    """本地挂单簿
+    由 websocket orders 频道推送实时维护，仅在启动和重连后用 REST 校准一次，
+    查询"程序自己的某方向挂单"时无需网络请求
+    """
 
+    def __init__(self, registry):
+        self.registry = registry
+        self.orders = {}  # ordId -> 挂单
+        self.closed_ids = deque(maxlen=1000)  # 最近结束的订单，防止下单回包晚于推送时把订单重新加回
+
+    def apply(self, order_info):
+        """应用一条订单推送"""
+        ord_id = order_info.get("ordId")
+        if not ord_id:
+            return
+        current = self.orders.get(ord_id)
+        # 丢弃比本地更旧的推送(重连校准后可能收到积压的消息)
+        if current and int(order_info.get("uTime") or 0) < int(current.get("uTime") or 0):
+            return
+        if order_info.get("state") in LIVE_ORDER_STATES:
+            self.orders[ord_id] = order_info
+        else:
+            self.discard(ord_id)
+
+    def apply_amend(self, ord_id, order_data):
+        """改单成功后更新本地挂单的价格和数量"""
+        order = self.orders.get(ord_id)
+        if order is not None:
+            self.orders[ord_id] = {**order, "px": order_data["px"], "sz": order_data["sz"]}
+
+    def discard(self, ord_id):
+        """移除已结束的订单"""
+        self.orders.pop(ord_id, None)
+        self.closed_ids.append(ord_id)
+
+    def add_placed(self, order_info):
+        """下单成功后立即登记，websocket 推送到达后会被覆盖"""
+        if order_info["ordId"] not in self.closed_ids and order_info["ordId"] not in self.orders:
+            self.orders[order_info["ordId"]] = order_info
+
+    def sync(self, orders):
+        """用 REST 查询到的挂单列表整体替换本地挂单簿
+        返回记录为挂单中、但已不在交易所挂单列表中的程序订单: 断线期间可能已成交或已撤销，
+        由调用方查询最终状态(settle_orders)，这里不修改订单记录；
+        没有 instId 的记录(早期版本登记)无法查询，不返回，由对账按挂单簿处理
+        """
+        previous = self.orders
+        self.orders = {order["ordId"]: order for order in orders if order.get("ordId")}
+        return [previous.get(ord_id) or self.registry.as_order(ord_id)
+                for ord_id, info in self.registry.orders.items()
+                if info.get("state") in LIVE_ORDER_STATES and info.get("inst_id") and ord_id not in self.orders]
+
+    async def resync(self):
+        """启动和重连后用 REST 校准挂单簿，返回已不在交易所挂单列表中的程序订单，查询失败时保留本地数据并返回 None"""
+        try:
+            response_data = await fetch_pending_orders()
+        except Exception as e:
+            log.error("order_book_resync_failed", "❌ 校准挂单簿失败: {error}", error=e)
+            return None
+        if response_data.get("code") != "0":
+            log.error("order_book_resync_failed", "❌ 校准挂单簿失败: {error}", error=response_data.get('msg'))
+            return None
+        vanished = self.sync(response_data.get("data", []))
+        log.info("order_book_resynced", "✅ 挂单簿已校准: {count} 笔挂单，{vanished} 笔程序订单待确认",
+                 count=len(self.orders), vanished=len(vanished))
+        return vanished
+
+    def find(self, side, pos_side, inst_id=DEFAULT_INST_ID):
+        """返回程序创建的指定方向挂单"""
+        return [order for order in self.orders.values()
+                if order.get("side") == side and order.get("posSide") == pos_side
+                and order.get("instId") == inst_id and self.registry.get(order["ordId"]) is not None]
+
+
+open_order_book = OpenOrderBook(order_registry)
+
+
+async def cancel_order_rest_api(ord_id, inst_id):
+    """使用 REST API 撤单"""
     cancel_data = {
         "ordId": ord_id,
         "instId": inst_id
     }
-    cancel_json = json.dumps(cancel_data, separators=(',', ':'))
-
-    sign = generate_signature(timestamp, "POST", endpoint, cancel_json)
-    headers = {
-        "OK-ACCESS-KEY": API_KEY,
-        "OK-ACCESS-SIGN": sign,
-        "OK-ACCESS-TIMESTAMP": timestamp,
-        "OK-ACCESS-PASSPHRASE": PASSPHRASE,
-        "Content-Type": "application/json",
-    }
-
-    response = requests.post(url, data=cancel_json, headers=headers)
-    return response.json()
+    try:
+        response_data = await send_trade_request("/api/v5/trade/cancel-order", cancel_data)
+    except Exception as e:
+        log.error("cancel_failed", "❌ 撤单发生错误: {error}", ord_id=ord_id, error=e)
+        return {}
+    if response_data.get("code") == "0":
+        open_order_book.discard(ord_id)
+        metrics.incr("orders_canceled")
+    else:
+        metrics.incr("cancel_rejects")
+    return response_data
 
 
 async def cancel_all_orders():
     """取消所有未完成的委托单"""
-    orders = query_orders()
-    for order in orders:
-        ord_id = order.get('ordId')
-        inst_id = order.get('instId')
-        if ord_id and inst_id:
-            cancel_response = cancel_order_rest_api(ord_id, inst_id)
-            if cancel_response.get('code') == '0':
-                print(f"✅ 撤单成功: {ord_id}")
+    batch = OrderBatch()
+    for order in await query_orders():
+        if order.get('ordId') and order.get('instId'):
+            batch.cancel(order['ordId'], order['instId'])
+    await batch.flush()
 
 
-def place_order(side, price, size, pos_side="long", is_close=False):
-    """使用REST API下单"""
-    endpoint = "/api/v5/trade/order"
-    url = BASE_URL + endpoint
-    timestamp = datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
+def format_contracts(contracts):
+    """张数格式化为下单参数(不带多余的 0，不用科学计数法)"""
+    return f"{contracts.normalize():f}"
+
 
-    order_data = {
-        "instId": "BTC-USDT-SWAP",
+def build_order_data(side, price, size, pos_side="long", is_close=False, inst_id=DEFAULT_INST_ID):
+    """生成下单参数，size 为币数量，按合约面值换算为张数"""
+    return {
+        "instId": inst_id,
         "tdMode": "cross",
-        "clOrdId": generate_clOrdId(side),
+        "clOrdId": generate_clOrdId(side, pos_side, price, inst_id),
         "side": side,
         "ordType": "limit",
         "px": str(price),
-        "sz": str(size * 100),
+        "sz": format_contracts(to_contracts(inst_id, size)),
         "posSide": pos_side,
         "reduceOnly": "true" if is_close else "false"
     }
 
-    order_json = json.dumps(order_data, separators=(',', ':'))
-    sign = generate_signature(timestamp, "POST", endpoint, order_json)
 
-    headers = {
-        "OK-ACCESS-KEY": API_KEY,
-        "OK-ACCESS-SIGN": sign,
-        "OK-ACCESS-TIMESTAMP": timestamp,
-        "OK-ACCESS-PASSPHRASE": PASSPHRASE,
-        "Content-Type": "application/json",
-    }
+def record_placed_order(order_data, order_id):
+    """登记下单成功的订单"""
+    save_order_info(order_data["side"], order_id, order_data["px"], order_data["posSide"], order_data["clOrdId"],
+                    order_data["instId"])
+    open_order_book.add_placed({**order_data, "ordId": order_id, "state": "live", "uTime": "0"})
+    metrics.incr("orders_placed")
+
 
-    response = requests.post(url, data=order_json, headers=headers)
-    response_data = response.json()
-    if response_data.get("code") == "0" and "data" in response_data and len(response_data["data"]) > 0:
-        order_info = response_data["data"][0]
-        order_id = order_info.get("ordId")
-        if order_id:
-            # 保存订单信息
-            save_order_info(side, order_id, price, pos_side)
-            return order_id
-    print(f"❌ 下单失败：{response_data}")
+async def place_order(side, price, size, pos_side="long", is_close=False, inst_id=DEFAULT_INST_ID):
+    """使用REST API下单"""
+    return await submit_order(build_order_data(side, price, size, pos_side, is_close, inst_id))
+
+
+async def submit_order(order_data, retries=ORDER_SUBMIT_RETRIES):
+    """提交单笔订单，返回 ordId，失败返回 None
+    结果未知(超时、断线)或 clOrdId 重复时按 clOrdId 确认，不重复下单
+    """
+    try:
+        response_data = await send_trade_request("/api/v5/trade/order", order_data)
+    except Exception as e:
+        log.warning("order_unknown", "⚠️ 下单结果未知({error})，按 clOrdId 确认", cl_ord_id=order_data["clOrdId"],
+                    error=str(e) or '超时')
+        return await resolve_order(order_data, retries)
+    item = (response_data.get("data") or [{}])[0]
+    if response_data.get("code") == "0" and item.get("ordId"):
+        # 保存订单信息
+        record_placed_order(order_data, item["ordId"])
+        return item["ordId"]
+    if item.get("sCode") == DUPLICATE_CL_ORD_ID_CODE:
+        return await resolve_order(order_data, retries)
+    log.error("order_rejected", "❌ 下单失败：{response}", response=response_data)
+    metrics.incr("order_rejects")
     return None
 
 
-async def order_listener(websocket):
-    """监听订单更新"""
-    global long_position, short_position, buy_ordId, close_long_ordId, long_trigger_price, short_trigger_price, long_take_profit_count, short_take_profit_count
+async def fetch_order(inst_id, ord_id=None, cl_ord_id=None):
+    """按 ordId 或 clOrdId 查询订单(含已结束的订单)
+    返回订单数据，确认不存在返回 {}，查询失败返回 None
+    """
+    params = {"instId": inst_id, "ordId": ord_id} if ord_id else {"instId": inst_id, "clOrdId": cl_ord_id}
+    try:
+        response_data = await rest_client.get("/api/v5/trade/order", params)
+    except Exception as e:
+        log.error("order_query_failed", "❌ 查询订单失败: {error}", ord_id=ord_id, cl_ord_id=cl_ord_id, error=e)
+        return None
+    if response_data.get("code") == "0" and response_data.get("data"):
+        return response_data["data"][0]
+    if response_data.get("code") == ORDER_NOT_FOUND_CODE:
+        return {}
+    log.error("order_query_failed", "❌ 查询订单失败: {error}", ord_id=ord_id, cl_ord_id=cl_ord_id,
+              error=response_data.get('msg'))
+    return None
 
-    subscribe_msg = {"op": "subscribe", "args": [{"channel": "orders", "instType": "SWAP"}]}
-    await websocket.send(json.dumps(subscribe_msg))
-    print("📡 已订阅订单更新")
 
-    while True:
+def apply_order_result(order):
+    """按查询到的订单状态补处理漏掉的推送，返回是否有成交需要处理
+    有成交的(含部分成交后撤销)按订单事件分发，推进网格并记录状态；没有成交的只记录交易所返回的状态
+    """
+    open_order_book.apply(order)
+    if float(order.get("accFillSz") or 0) and order.get("instId") in grids:
+        event_dispatcher.dispatch(OrderEvent(order))
+        return True
+    order_registry.update_state(order["ordId"], order.get("state"))
+    return False
+
+
+async def settle_orders(orders):
+    """查询已不在交易所挂单列表中的程序订单的最终状态并补处理，按更新时间顺序分发成交
+    交易所只保留一段时间内撤销且没有成交的订单，有成交的订单都能查到，查不到(51603)的按未成交撤销处理；
+    查询失败的订单留在挂单簿中，由对账继续处理；返回 (补处理的成交笔数, 查询失败笔数)
+    """
+    results = await asyncio.gather(*(fetch_order(order["instId"], ord_id=order["ordId"]) for order in orders))
+    finals, failed = [], 0
+    for order, final in zip(orders, results):
+        if final is None:
+            open_order_book.orders.setdefault(order["ordId"], order)
+            failed += 1
+        elif final:
+            finals.append(final)
+        else:
+            open_order_book.discard(order["ordId"])
+            order_registry.update_state(order["ordId"], "canceled")
+    finals.sort(key=lambda order: int(order.get("uTime") or 0))
+    return sum(apply_order_result(order) for order in finals), failed
+
+
+async def resolve_order(order_data, retries):
+    """确认结果未知的委托: 已在交易所时按查询结果登记，确认不存在时用同一 clOrdId 重发
+    返回 ordId，无法确认或重发失败返回 None
+    """
+    order = await fetch_order(order_data["instId"], cl_ord_id=order_data["clOrdId"])
+    if order:
+        log.info("order_resolved", "♻️ 委托已在交易所: {cl_ord_id} -> {ord_id}", cl_ord_id=order_data["clOrdId"],
+                 ord_id=order["ordId"])
+        metrics.incr("orders_resolved")
+        record_placed_order(order_data, order["ordId"])
+        # 确认前可能已经成交或撤销，推送已被当作非程序订单忽略，按查询结果补处理
+        apply_order_result(order)
+        return order["ordId"]
+    if order is not None and retries > 0:
+        metrics.incr("order_retries")
+        return await submit_order(order_data, retries - 1)
+    log.error("order_failed", "❌ 下单失败：{cl_ord_id} {reason}", cl_ord_id=order_data["clOrdId"],
+              reason="无法确认委托状态" if order is None else "重发次数已用完")
+    metrics.incr("order_rejects")
+    return None
+
+
+def chunked(items, size):
+    """按批量接口上限切分"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+@timed("place")
+async def place_orders(orders_data):
+    """批量下单，每批最多 BATCH_ORDER_LIMIT 笔，各批并发发送
+    返回与 orders_data 一一对应的 ordId 列表，失败的为 None
+    """
+    if len(orders_data) == 1:
+        return [await submit_order(orders_data[0])]
+
+    async def send(chunk):
         try:
-            response = await websocket.recv()
-            response_data = json.loads(response)
+            response_data = await send_trade_request("/api/v5/trade/batch-orders", chunk, weight=len(chunk))
+        except Exception as e:
+            log.warning("order_unknown", "⚠️ 批量下单结果未知({error})，按 clOrdId 确认", count=len(chunk),
+                        error=str(e) or '超时')
+            return await asyncio.gather(*(resolve_order(order_data, ORDER_SUBMIT_RETRIES) for order_data in chunk))
+        results = {item.get("clOrdId"): item for item in response_data.get("data", [])}
+        ord_ids, duplicates = [], {}
+        for i, order_data in enumerate(chunk):
+            item = results.get(order_data["clOrdId"], {})
+            if item.get("sCode") == "0" and item.get("ordId"):
+                record_placed_order(order_data, item["ordId"])
+                ord_ids.append(item["ordId"])
+            elif item.get("sCode") == DUPLICATE_CL_ORD_ID_CODE:
+                duplicates[i] = order_data
+                ord_ids.append(None)
+            else:
+                log.error("order_rejected", "❌ 下单失败：{response}", response=item or response_data)
+                metrics.incr("order_rejects")
+                ord_ids.append(None)
+        resolved = await asyncio.gather(*(resolve_order(order_data, ORDER_SUBMIT_RETRIES)
+                                          for order_data in duplicates.values()))
+        for i, ord_id in zip(duplicates, resolved):
+            ord_ids[i] = ord_id
+        return ord_ids
+
+    chunks = await asyncio.gather(*(send(chunk) for chunk in chunked(orders_data, BATCH_ORDER_LIMIT)))
+    return [ord_id for chunk in chunks for ord_id in chunk]
+
+
+@timed("cancel")
+async def cancel_orders(orders):
+    """批量撤单，orders 为 (ordId, instId) 列表
+    返回撤单成功的 ordId 列表
+    """
+    if len(orders) == 1:
+        ord_id, inst_id = orders[0]
+        response_data = await cancel_order_rest_api(ord_id, inst_id)
+        return [ord_id] if response_data.get("code") == "0" else []
 
-            if "data" in response_data and response_data.get("arg", {}).get("channel") == "orders":
-                for order_info in response_data["data"]:
-                    # 检查是否为BTC-USDT-SWAP的订单
-                    if order_info.get("instId") != "BTC-USDT-SWAP":
-                        continue
+    async def send(chunk):
+        body = [{"ordId": ord_id, "instId": inst_id} for ord_id, inst_id in chunk]
+        try:
+            response_data = await send_trade_request("/api/v5/trade/cancel-batch-orders", body,
+                                                     weight=len(chunk))
+        except Exception as e:
+            log.error("cancel_failed", "❌ 批量撤单发生错误: {error}", count=len(chunk), error=e)
+            metrics.incr("cancel_rejects", len(chunk))
+            return []
+        canceled = []
+        for item in response_data.get("data", []):
+            if item.get("sCode") == "0":
+                open_order_book.discard(item["ordId"])
+                canceled.append(item["ordId"])
+                metrics.incr("orders_canceled")
+            else:
+                log.error("cancel_rejected", "❌ 撤单失败: {response}", response=item)
+                metrics.incr("cancel_rejects")
+        return canceled
 
-                    state = order_info.get("state")
-                    side = order_info.get("side")
-                    pos_side = order_info.get("posSide")
-                    # 安全地获取和转换数值
-                    try:
-                        filled_size = float(order_info.get("accFillSz") or "0") / 100
-                        order_price = float(order_info.get("px") or "0")
-                        ordId = order_info.get("ordId")
-                        if not ordId or filled_size == 0 or order_price == 0:
-                            continue
-                    except (ValueError, TypeError) as e:
-                        print(f"⚠️ 订单数据格式错误: {e}")
-                        continue
+    chunks = await asyncio.gather(*(send(chunk) for chunk in chunked(orders, BATCH_ORDER_LIMIT)))
+    return [ord_id for chunk in chunks for ord_id in chunk]
 
-                    # 验证订单是否由程序创建
-                    order_type, _, _ = get_order_info(ordId)
-                    if order_type is None:  # 如果订单不在记录中，说明不是程序创建的
-                        continue
 
-                    if state == "filled" and filled_size > 0:
-                        buy_price, close_price = calculate_grid_prices(order_price, pos_side)
-
-                        # 处理多单
-                        if pos_side == "long" and enable_long_grid:
-                            if side == "buy":
-                                long_position += filled_size
-                                if long_position < long_max_position:
-                                    long_trigger_price = order_price
-                                    print(f"\n✅ 开多成交")
-                                    print(f"💰 当前多单持仓: {long_position}")
-                                    print(f"🎯 多单触发价格: {long_trigger_price}")
-                                    # 取消旧的平多单
-                                    orders = query_orders()
-                                    for order in orders:
-                                        if order.get('side') == 'sell' and order.get('posSide') == 'long':
-                                            # 验证订单是否由程序创建
-                                            order_type, _, _ = get_order_info(order.get('ordId'))
-                                            if order_type is not None:  # 只取消程序创建的订单
-                                                cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                    # 重新委托买单和卖单
-                                    place_order("buy", buy_price, long_grid_size, "long")
-                                    place_order("sell", close_price, long_grid_size, "long", is_close=True)
-                                    trigger_price = long_trigger_price
-                                    grid_size = long_grid_size
-                                    send_to_feishu(grid_size, grid_size, long_position, long_max_position,
-                                                   trigger_price, 0,
-                                                   buy_price, close_price, take_profit_count, 0, "多")
-                                else:
-                                    print('\n⚠️ 持仓已达到最大，停止买入')
-                                    orders = query_orders()
-                                    for order in orders:
-                                        if order.get('side') == 'sell' and order.get('posSide') == 'long':
-                                            # 验证订单是否由程序创建
-                                            order_type, _, _ = get_order_info(order.get('ordId'))
-                                            if order_type is not None:  # 只取消程序创建的订单
-                                                cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                    place_order("sell", close_price, long_grid_size, "long", is_close=True)
-                                    trigger_price = long_trigger_price
-                                    grid_size = long_grid_size
-                                    send_to_feishu(grid_size, grid_size, long_position, long_max_position,
-                                                   trigger_price, 0,
-                                                   buy_price, close_price, take_profit_count, 0, "多")
-                            elif side == "sell":
-                                long_position -= filled_size
-                                long_trigger_price = order_price
-                                long_take_profit_count += 1
-                                print(f"\n✅ 平多成交")
-                                print(f"💰 当前多单持仓: {long_position}")
-                                print(f"🎯 多单触发价格: {long_trigger_price}")
-                                orders = query_orders()
-                                for order in orders:
-                                    if order.get('side') == 'buy' and order.get('posSide') == 'long':
-                                        # 验证订单是否由程序创建
-                                        order_type, _, _ = get_order_info(order.get('ordId'))
-                                        if order_type is not None:  # 只取消程序创建的订单
-                                            cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                place_order("buy", buy_price, long_grid_size, "long")
-                                if long_position > 0:  # 只有在有持仓时才委托平仓单
-                                    # 如果当前持仓小于网格大小，使用当前持仓量作为平仓数量
-                                    close_size = min(long_position, long_grid_size)
-                                    place_order("sell", close_price, close_size, "long", is_close=True)
-                                trigger_price = long_trigger_price
-                                grid_size = long_grid_size
-                                send_to_feishu(grid_size, grid_size, long_position, long_max_position, trigger_price, 1,
-                                               buy_price, close_price, take_profit_count, 0, "多")
-
-                        # 处理空单
-                        elif pos_side == "short" and enable_short_grid:
-                            if side == "sell":
-                                short_position += filled_size
-                                if short_position < short_max_position:
-                                    short_trigger_price = order_price
-                                    print(f"\n✅ 开空成交")
-                                    print(f"💰 当前空单持仓: {short_position}")
-                                    print(f"🎯 空单触发价格: {short_trigger_price}")
-                                    orders = query_orders()
-                                    for order in orders:
-                                        if order.get('side') == 'buy' and order.get('posSide') == 'short':
-                                            cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                    place_order("sell", close_price, short_grid_size, "short")
-                                    place_order("buy", buy_price, short_grid_size, "short", is_close=True)
-                                    trigger_price = short_trigger_price
-                                    grid_size = short_grid_size
-                                    send_to_feishu(grid_size, grid_size, short_position, short_max_position,
-                                                   trigger_price, 0,
-                                                   close_price, buy_price, short_take_profit_count, 0, "空")
-                                else:
-                                    print('\n⚠️ 空单持仓已达到最大，停止卖出')
-                                    orders = query_orders()
-                                    for order in orders:
-                                        if order.get('side') == 'buy' and order.get('posSide') == 'short':
-                                            # 验证订单是否由程序创建
-                                            order_type, _, _ = get_order_info(order.get('ordId'))
-                                            if order_type is not None:  # 只取消程序创建的订单
-                                                cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                    place_order("buy", buy_price, short_grid_size, "short", is_close=True)
-                                    trigger_price = short_trigger_price
-                                    grid_size = short_grid_size
-                                    send_to_feishu(grid_size, grid_size, short_position, short_max_position,
-                                                   trigger_price, 0,
-                                                   close_price, buy_price, short_take_profit_count, 0, "空")
-                            elif side == "buy":
-                                short_position -= filled_size
-                                short_trigger_price = order_price
-                                short_take_profit_count += 1
-                                print(f"\n✅ 平空成交")
-                                print(f"💰 当前空单持仓: {short_position}")
-                                print(f"🎯 空单触发价格: {short_trigger_price}")
-                                orders = query_orders()
-                                for order in orders:
-                                    if order.get('side') == 'sell' and order.get('posSide') == 'short':
-                                        # 验证订单是否由程序创建
-                                        order_type, _, _ = get_order_info(order.get('ordId'))
-                                        if order_type is not None:  # 只取消程序创建的订单
-                                            cancel_order_rest_api(order.get('ordId'), order.get('instId'))
-                                place_order("sell", close_price, short_grid_size, "short")
-                                if short_position > 0:  # 只有在有持仓时才委托平仓单
-                                    # 如果当前持仓小于网格大小，使用当前持仓量作为平仓数量
-                                    close_size = min(short_position, short_grid_size)
-                                    place_order("buy", buy_price, close_size, "short", is_close=True)
-                                trigger_price = short_trigger_price
-                                grid_size = short_grid_size
-                                send_to_feishu(grid_size, grid_size, short_position, short_max_position, trigger_price,
-                                               1,
-                                               close_price, buy_price, short_take_profit_count, 0, "空")
-
-            await asyncio.sleep(0)
+# 已受理、等待 websocket 推送改单结果的订单: ordId -> 改单失败时重新委托的下单参数
+pending_amends = {}
+
+
+@timed("amend")
+async def amend_orders(amends):
+    """批量改单，amends 为 (挂单, 新下单参数) 列表
+    返回被拒绝的 (挂单, 新下单参数) 列表，由调用方撤单重挂
+    """
+    def build(order, order_data):
+        return {"instId": order["instId"], "ordId": order["ordId"], "newPx": order_data["px"],
+                "newSz": order_data["sz"]}
+
+    async def send(chunk):
+        try:
+            if len(chunk) == 1:
+                response_data = await send_trade_request("/api/v5/trade/amend-order", build(*chunk[0]))
+            else:
+                response_data = await send_trade_request("/api/v5/trade/amend-batch-orders",
+                                                         [build(*item) for item in chunk], weight=len(chunk))
+        except Exception as e:
+            log.error("amend_failed", "❌ 改单发生错误: {error}", count=len(chunk), error=e)
+            metrics.incr("amend_rejects", len(chunk))
+            return chunk
+        results = {item.get("ordId"): item for item in response_data.get("data", [])}
+        rejected = []
+        for order, order_data in chunk:
+            if results.get(order["ordId"], {}).get("sCode") == "0":
+                order_registry.update_price(order["ordId"], order_data["px"])
+                open_order_book.apply_amend(order["ordId"], order_data)
+                pending_amends[order["ordId"]] = order_data
+                metrics.incr("orders_amended")
+            else:
+                log.warning("amend_rejected", "⚠️ 改单被拒，改为撤单重挂: {response}",
+                            response=results.get(order['ordId']) or response_data)
+                metrics.incr("amend_rejects")
+                rejected.append((order, order_data))
+        return rejected
+
+    chunks = await asyncio.gather(*(send(chunk) for chunk in chunked(amends, BATCH_ORDER_LIMIT)))
+    return [item for chunk in chunks for item in chunk]
+
+
+async def handle_amend_result(event):
+    """处理改单结果推送(OrderEvent): 改单失败(-1)时撤单重挂，被系统撤销(1)时直接重挂"""
+    ord_id = event.ord_id
+    amend_result = event.amend_result
+    if ord_id not in pending_amends:
+        return
+    if amend_result == "0" or event.state in TERMINAL_ORDER_STATES:
+        pending_amends.pop(ord_id)
+        return
+    if amend_result not in ("-1", "1"):
+        return
+    order_data = pending_amends.pop(ord_id)
+    log.warning("amend_failed", "⚠️ 改单失败，改为撤单重挂: {ord_id}", ord_id=ord_id)
+    batch = OrderBatch()
+    if amend_result == "-1":
+        batch.cancel(ord_id, event.inst_id)
+    # 原挂单可能仍在(撤单前)，换一个 clOrdId 重挂
+    batch.places.append({**order_data, "clOrdId": generate_clOrdId(order_data["side"], order_data["posSide"],
+                                                                   order_data["px"], order_data["instId"])})
+    await batch.flush()
+
+
+class OrderBatch:
+    """一个网格步骤内的撤单、改单和下单
+    先收集，flush 时合并为批量请求；撤单先于下单发送，
+    避免旧的平仓单占用可平仓位导致新平仓单被拒
+    """
+
+    def __init__(self):
+        self.cancels = []  # (ordId, instId)
+        self.amends = []  # (挂单, 新下单参数)
+        self.places = []  # 下单参数
+
+    def cancel(self, ord_id, inst_id):
+        self.cancels.append((ord_id, inst_id))
+
+    def place(self, side, price, size, pos_side="long", is_close=False, inst_id=DEFAULT_INST_ID):
+        self.places.append(build_order_data(side, price, size, pos_side, is_close, inst_id))
+
+    def replace(self, orders, side, price, size, pos_side="long", is_close=False, inst_id=DEFAULT_INST_ID):
+        """把同方向的旧挂单换成新价格和数量的挂单
+        改单模式下复用一笔未成交的旧挂单改价改量，其余撤销；否则全部撤销后重新下单
+        改单与下单是两个请求(没有合并的接口)，改单模式不减少请求数，省下的是复用挂单的那次撤单
+        """
+        order_data = build_order_data(side, price, size, pos_side, is_close, inst_id)
+        reusable = None
+        if enable_amend_mode:
+            reusable = next((order for order in orders if float(order.get("accFillSz") or 0) == 0), None)
+        for order in orders:
+            if order is not reusable:
+                self.cancel(order['ordId'], order['instId'])
+        if reusable is not None:
+            self.amends.append((reusable, order_data))
+        else:
+            self.places.append(order_data)
+
+    async def flush(self):
+        """发送本批请求，返回与下单顺序对应的 ordId 列表"""
+        if self.cancels:
+            # 撤单和改单互不依赖，同时发送；下单需等待撤单释放可平仓位
+            canceled, rejected = await asyncio.gather(cancel_orders(self.cancels),
+                                                      amend_orders(self.amends) if self.amends else no_orders())
+            for ord_id in canceled:
+                log.info("order_canceled", "✅ 撤单成功: {ord_id}", ord_id=ord_id)
+            ord_ids = await place_orders(self.places) if self.places else []
+        else:
+            # 没有撤单时改单和下单可以同时发送
+            rejected, ord_ids = await asyncio.gather(amend_orders(self.amends) if self.amends else no_orders(),
+                                                     place_orders(self.places) if self.places else no_orders())
+        if rejected:
+            # 改单被拒: 撤销旧挂单后按新价格重新委托
+            await cancel_orders([(order["ordId"], order["instId"]) for order, _ in rejected])
+            await place_orders([order_data for _, order_data in rejected])
+        self.cancels, self.amends, self.places = [], [], []
+        return ord_ids
+
+
+async def no_orders():
+    return []
+
+
+def plan_ladder(batch, grid, grid_side, center, position):
+    """把多层网格的挂单移到以 center 层为中心的窗口
+    已在目标层级、方向和数量一致的挂单保留，只补挂缺少的层级并撤销离开窗口的挂单；
+    改单模式下优先把离开窗口的未成交挂单改到新层级
+    """
+    inst_id = grid.inst_id
+    pos_side = grid_side.pos_side
+    ladder = grid_side.ladder
+    desired = ladder.window(grid_side, center, position)
+    stale = []
+    for order in (open_order_book.find(grid_side.open_side, pos_side, inst_id)
+                  + open_order_book.find(grid_side.close_side, pos_side, inst_id)):
+        level = ladder.level_of(float(order["px"]))
+        target = desired.get(level)
+        if (target is not None and target[0] == order["side"]
+                and grid.to_contracts(target[1]) == Decimal(order["sz"])):
+            del desired[level]  # 同一层只保留一笔
+        else:
+            stale.append(order)
+    # 离中心近的层级先委托
+    for level in sorted(desired, key=lambda level: abs(level - center)):
+        side, size, is_close = desired[level]
+        order_data = build_order_data(side, ladder.price(level), size, pos_side, is_close, inst_id)
+        reusable = None
+        if enable_amend_mode:
+            reusable = next((order for order in stale
+                             if order["side"] == side and float(order.get("accFillSz") or 0) == 0), None)
+        if reusable is not None:
+            stale.remove(reusable)
+            batch.amends.append((reusable, order_data))
+        else:
+            batch.places.append(order_data)
+    for order in stale:
+        batch.cancel(order["ordId"], order["instId"])
+
+
+def plan_grid_step(grid, pos_side, side, order_price, filled_size, fill_time=0):
+    """根据一次成交推进网格: 更新网格状态，返回 (待发送的 OrderBatch, 通知事件)
+    未启用的方向返回 (None, None)
+    """
+    grid_side = grid.sides.get(pos_side)
+    if grid_side is None or not grid_side.enabled:
+        return None, None
+    inst_id = grid.inst_id
+    name = grid_side.name
+    open_price, close_price = grid_side.grid_prices(order_price, grid.tick_size)
+    batch = OrderBatch()
+
+    if side == grid_side.open_side:
+        position = account_state.apply_fill(inst_id, pos_side, filled_size, fill_time)
+        if position < grid_side.max_position:
+            grid_side.trigger_price = order_price
+            log.info("grid_fill", "\n✅ {inst_id} 开{name}成交\n💰 当前{name}单持仓: {position}\n"
+                     "🎯 {name}单触发价格: {trigger_price}", inst_id=inst_id, pos_side=pos_side, name=name,
+                     action="open", position=position, trigger_price=grid_side.trigger_price)
+            if grid_side.ladder is None:
+                # 旧的平仓单移到新价格(从本地挂单簿取出，无需查询 REST)，重新委托开仓单
+                batch.replace(open_order_book.find(grid_side.close_side, pos_side, inst_id), grid_side.close_side,
+                              close_price, grid_side.grid_size, pos_side, is_close=True, inst_id=inst_id)
+                batch.place(grid_side.open_side, open_price, grid_side.grid_size, pos_side, inst_id=inst_id)
+        else:
+            log.warning("max_position", "\n⚠️ {inst_id} {name}单持仓已达到最大，停止{action}", inst_id=inst_id,
+                        pos_side=pos_side, name=name, action="买入" if pos_side == "long" else "卖出",
+                        position=position)
+            if grid_side.ladder is None:
+                batch.replace(open_order_book.find(grid_side.close_side, pos_side, inst_id), grid_side.close_side,
+                              close_price, grid_side.grid_size, pos_side, is_close=True, inst_id=inst_id)
+        action_type = 0
+    else:
+        position = account_state.apply_fill(inst_id, pos_side, -filled_size, fill_time)
+        grid_side.trigger_price = order_price
+        grid_side.take_profit_count += 1
+        log.info("grid_fill", "\n✅ {inst_id} 平{name}成交\n💰 当前{name}单持仓: {position}\n"
+                 "🎯 {name}单触发价格: {trigger_price}", inst_id=inst_id, pos_side=pos_side, name=name,
+                 action="close", position=position, trigger_price=grid_side.trigger_price)
+        if grid_side.ladder is None:
+            batch.replace(open_order_book.find(grid_side.open_side, pos_side, inst_id), grid_side.open_side,
+                          open_price, grid_side.grid_size, pos_side, inst_id=inst_id)
+            if position > 0:  # 只有在有持仓时才委托平仓单
+                # 如果当前持仓小于网格大小，使用当前持仓量作为平仓数量
+                close_size = min(position, grid_side.grid_size)
+                batch.place(grid_side.close_side, close_price, close_size, pos_side, is_close=True, inst_id=inst_id)
+        action_type = 1
+
+    if grid_side.ladder is not None:
+        # 多层网格: 以成交层为中心移动挂单窗口，相邻层的价格即为通知中的开仓/平仓价
+        center = grid_side.ladder.level_of(order_price)
+        plan_ladder(batch, grid, grid_side, center, position)
+        step = -1 if pos_side == "long" else 1
+        open_price = grid_side.ladder.price(center + step)
+        close_price = grid_side.ladder.price(center - step)
+
+    event = (grid_side.grid_size, grid_side.grid_size, position, grid_side.max_position, grid_side.trigger_price,
+             action_type, open_price, close_price, grid_side.take_profit_count, 0, name)
+    return batch, event
+
+
+@timed("fill")
+async def process_fill(grid, pos_side, side, order_price, filled_size, fill_time=0):
+    """处理一次成交: 撤单和下单合并为批量请求发送，再放入飞书通知队列"""
+    metrics.incr("fills")
+    batch, event = plan_grid_step(grid, pos_side, side, order_price, filled_size, fill_time)
+    if batch is None:
+        return
+    # 先记录网格状态再发送委托，重启后按记录的触发价格补挂
+    grid_journal.record(grid.inst_id, grid.sides[pos_side], account_state.position(grid.inst_id, pos_side))
+    await batch.flush()
+    with metrics.span("notify"):
+        send_to_feishu(*event, inst_id=grid.inst_id)
+
+
+def plan_partial_fill(grid, pos_side, side, order_price, filled_size, fill_time=0):
+    """部分成交: 按新增成交量调整持仓，开启 enable_partial_rearm 时返回按成交量补挂对侧挂单的 OrderBatch
+    补挂的挂单在该订单完全成交后随网格步骤一起换成整格挂单；多层网格不补挂
+    """
+    grid_side = grid.sides.get(pos_side)
+    if grid_side is None or not grid_side.enabled:
+        return None
+    inst_id = grid.inst_id
+    opening = side == grid_side.open_side
+    position = account_state.apply_fill(inst_id, pos_side, filled_size if opening else -filled_size, fill_time)
+    log.info("partial_fill", "\n✅ {inst_id} {action}{name}部分成交 {size}，当前持仓: {position}", inst_id=inst_id,
+             pos_side=pos_side, name=grid_side.name, action='开' if opening else '平', size=filled_size,
+             position=position)
+    if not enable_partial_rearm or grid_side.ladder is not None:
+        return None
+    if grid.to_contracts(filled_size) < grid.min_size:
+        return None
+    open_price, close_price = grid_side.grid_prices(order_price, grid.tick_size)
+    batch = OrderBatch()
+    if opening:
+        batch.place(grid_side.close_side, close_price, filled_size, pos_side, is_close=True, inst_id=inst_id)
+    elif position < grid_side.max_position:
+        batch.place(grid_side.open_side, open_price, filled_size, pos_side, inst_id=inst_id)
+    return batch
+
+
+async def process_partial_fill(grid, pos_side, side, order_price, filled_size, fill_time=0):
+    """处理一次部分成交"""
+    metrics.incr("partial_fills")
+    batch = plan_partial_fill(grid, pos_side, side, order_price, filled_size, fill_time)
+    grid_journal.record(grid.inst_id, grid.sides[pos_side], account_state.position(grid.inst_id, pos_side))
+    if batch is not None and batch.places:
+        await batch.flush()
+
+
+def plan_initial_orders(batch, grid):
+    """按触发价格委托网格的初始挂单
+    本地挂单簿中已有程序挂单的开仓/平仓方向不再委托，重启和重连后只补挂缺少的挂单；
+    多层网格按触发价格所在层级补齐挂单窗口
+    """
+    for pos_side, grid_side in grid.sides.items():
+        # 根据配置决定是否委托该方向
+        if not grid_side.enabled:
+            continue
+        position = account_state.position(grid.inst_id, pos_side)
+        if grid_side.ladder is not None:
+            plan_ladder(batch, grid, grid_side, grid_side.ladder.level_of(grid_side.trigger_price), position)
+            continue
+        open_price, close_price = grid_side.grid_prices(grid_side.trigger_price, grid.tick_size)
+        if not open_order_book.find(grid_side.open_side, pos_side, grid.inst_id):
+            batch.place(grid_side.open_side, open_price, grid_side.grid_size, pos_side, inst_id=grid.inst_id)
+        # 只有在有持仓时才委托平仓单
+        if position > 0 and not open_order_book.find(grid_side.close_side, pos_side, grid.inst_id):
+            close_size = min(position, grid_side.grid_size)
+            batch.place(grid_side.close_side, close_price, close_size, pos_side, is_close=True, inst_id=grid.inst_id)
+
+
+async def settle_after_resync(vanished):
+    """校准挂单簿后补处理已不在挂单列表中的程序订单，等成交处理完再返回，返回是否全部确认"""
+    replayed, failed = await settle_orders(vanished)
+    if replayed:
+        log.warning("resync_replayed", "♻️ 补处理断线期间的成交: {count} 笔", count=replayed)
+    await event_dispatcher.wait_idle()
+    return failed == 0
+
+
+async def rearm_grids():
+    """校准挂单簿后补挂全部网格缺少的挂单，一次批量委托"""
+    batch = OrderBatch()
+    for grid in grids.values():
+        plan_initial_orders(batch, grid)
+    if batch.places or batch.amends or batch.cancels:
+        log.info("grid_rearm", "📝 补挂网格挂单: {places} 笔，改单 {amends} 笔，撤单 {cancels} 笔",
+                 places=len(batch.places), amends=len(batch.amends), cancels=len(batch.cancels))
+        await batch.flush()
+
+
+class OrderEvent:
+    """一条订单推送，数值字段在解码时转换一次
+    raw 保留原始数据，供本地挂单簿使用
+    """
+    __slots__ = ("inst_id", "ord_id", "side", "pos_side", "state", "px", "acc_fill_sz", "fill_time", "u_time",
+                 "trade_id", "amend_result", "raw")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.inst_id = raw.get("instId")
+        self.ord_id = raw.get("ordId")
+        self.side = raw.get("side")
+        self.pos_side = raw.get("posSide")
+        self.state = raw.get("state")
+        self.px = float(raw.get("px") or 0)
+        self.acc_fill_sz = float(raw.get("accFillSz") or 0)  # 累计成交张数
+        self.u_time = int(raw.get("uTime") or 0)
+        self.fill_time = int(raw.get("fillTime") or 0) or self.u_time
+        self.trade_id = raw.get("tradeId") or None  # 本条推送对应的成交 id，没有新成交时为空
+        self.amend_result = raw.get("amendResult")
+
+
+class FrameDecoder:
+    """推送解码
+    先按原始文本过滤 pong、不处理的频道和未配置网格的合约，再完整解析；
+    订单推送转换为 OrderEvent，解码失败的帧丢弃
+    """
+    CHANNEL_PATTERN = re.compile(r'"channel": ?"(orders|account|positions)"')  # 兼容紧凑和带空格的写法
+
+    def __init__(self, backend=JSON_BACKEND):
+        use_orjson = orjson is not None and backend in ("auto", "orjson")
+        self.loads = orjson.loads if use_orjson else json.loads
+        self.backend = "orjson" if use_orjson else "json"
+        self.inst_ids = None  # 只处理这些合约的订单推送，None 表示不过滤
+
+    def accepts(self, frame):
+        """按原始文本快速判断是否需要解析，频道和事件类型只在开头查找"""
+        if frame == "pong":
+            return False
+        head = frame[:96]
+        if '"event"' in head:
+            return '"error"' in head
+        match = self.CHANNEL_PATTERN.search(head)
+        if match is None:
+            return False
+        if self.inst_ids is not None and match.group(1) == "orders":
+            return any(inst_id in self.inst_ids for inst_id in frame_inst_ids(frame))
+        return True
+
+    def decode(self, frame):
+        """返回 (频道, 数据)，需要忽略的帧返回 None；订单频道的数据为 OrderEvent 列表"""
+        if not self.accepts(frame):
+            metrics.incr("frames_filtered")
+            return None
+        try:
+            message = self.loads(frame)
+            if message.get("event") == "error":
+                log.warning("push_error", "⚠️ 推送连接错误: {message}", message=message)
+                return None
+            channel = message["arg"]["channel"]
+            data = message.get("data") or []
+            if channel == "orders":
+                data = [OrderEvent(item) for item in data]
+            return channel, data
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning("push_decode_failed", "⚠️ 推送解析失败: {error}", error=e)
+            return None
+
+
+def frame_inst_ids(frame):
+    """从原始文本中取出全部 instId"""
+    inst_ids = []
+    start = frame.find('"instId":')
+    while start != -1:
+        start = frame.find('"', start + 9) + 1
+        end = frame.find('"', start)
+        inst_ids.append(frame[start:end])
+        start = frame.find('"instId":', end)
+    return inst_ids
+
+
+push_decoder = FrameDecoder()
+
+
+class FrameRecorder:
+    """推送录制
+    文件以 RECORD_MAGIC 开头，之后每条消息为 8 字节单调时钟纳秒 + 4 字节长度(小端) + UTF-8 内容；
+    重启后追加写入(同一次开机内单调时钟连续)。写入带缓冲的文件，每 RECORD_FLUSH_INTERVAL 秒 flush 一次，
+    写文件失败时停止录制，不影响推送处理
+    """
+    HEADER = struct.Struct("<QI")
+
+    def __init__(self, path=RECORD_FILE):
+        self.path = path
+        self.file = None
+        self.flushed = 0
+
+    def open(self):
+        """未配置录制文件时不录制"""
+        if not self.path or self.file is not None:
+            return
+        try:
+            self.file = open(self.path, 'ab', buffering=1 << 20)
+            if self.file.tell() == 0:
+                self.file.write(RECORD_MAGIC)
+        except OSError as e:
+            log.error("record_failed", "❌ 打开录制文件失败: {error}", error=e)
+            self.file = None
+            return
+        log.info("record_started", "🎙️ 录制推送到: {path}", path=self.path)
+
+    def record(self, frame):
+        if self.file is None:
+            return
+        now = time.monotonic_ns()
+        data = frame.encode() if isinstance(frame, str) else frame
+        try:
+            self.file.write(self.HEADER.pack(now, len(data)))
+            self.file.write(data)
+            if now - self.flushed > RECORD_FLUSH_INTERVAL * 1e9:
+                self.file.flush()
+                self.flushed = now
+        except OSError as e:
+            log.error("record_failed", "❌ 写入录制文件失败，停止录制: {error}", error=e)
+            self.close()
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+
+frame_recorder = FrameRecorder()
+
+
+async def order_listener(websocket):
+    """读取推送: 只负责接收和解码，订单事件交给处理协程，账户和持仓推送直接更新快照
+    保活由 ConnectionWatchdog 单独负责，成交处理再慢也不会耽误读取和 ping
+    """
+    subscribe_msg = {"op": "subscribe", "args": [{"channel": "orders", "instType": "SWAP"},
+                                                 {"channel": "account"},
+                                                 {"channel": "positions", "instType": "SWAP"}]}
+    await websocket.send(json.dumps(subscribe_msg))
+    log.info("subscribed", "📡 已订阅订单、账户和持仓更新")
+    push_decoder.inst_ids = set(grids)
+    # 订阅后再校准挂单簿，期间的推送会在之后按更新时间应用；
+    # 首次连接时与启动阶段的查询同时进行，合约规格和持仓都就绪后才处理成交和补挂；
+    # 断线期间结束的程序订单先查询最终状态、处理完成交，再按最新持仓补挂缺少的挂单；
+    # 校准或查询失败时不下单，避免按过时的状态重复委托
+    vanished, _ = await asyncio.gather(open_order_book.resync(), bootstrap_done.wait())
+    event_dispatcher.start()
+    if vanished is not None and await settle_after_resync(vanished):
+        await rearm_grids()
+    else:
+        log.warning("rearm_skipped", "⚠️ 挂单簿校准或订单确认失败，暂不补挂网格挂单")
+
+    watchdog = ConnectionWatchdog(websocket, "推送连接")
+    watchdog_task = asyncio.create_task(watchdog.run())
+    try:
+        await read_pushes(websocket, watchdog)
+    finally:
+        watchdog_task.cancel()
+
+
+async def read_pushes(websocket, watchdog):
+    """读取循环: 每条消息只做解码、更新快照和分发，不等待任何网络请求，只在事件队列满时等待"""
+    while True:
+        try:
+            response = await websocket.recv()
+            watchdog.touch()
+            frame_recorder.record(response)
+            with metrics.span("decode"):
+                decoded = push_decoder.decode(response)
+            if decoded is None:
+                continue
+
+            channel, data = decoded
+            if channel == "account":
+                account_state.apply_account(data)
+            elif channel == "positions":
+                account_state.apply_positions(data)
+            elif channel == "orders":
+                for event in data:
+                    # 推送延迟: 交易所更新时间到本地收到(受本地时钟偏差影响)
+                    if event.u_time:
+                        metrics.observe("recv", max(0.0, time.time() - event.u_time / 1000))
+                    # 按 LOG_SAMPLE_RATES 采样记录，不拖慢读取
+                    log.info("order_push", inst_id=event.inst_id, ord_id=event.ord_id, state=event.state,
+                             u_time=event.u_time)
+                    # 挂单簿在读取时立即更新，处理协程查询挂单时总是最新状态
+                    open_order_book.apply(event.raw)
+                    # 按 instId 分发到对应的网格，未配置网格的合约忽略；队列满时在这里等待，不丢弃事件
+                    if event.inst_id in grids:
+                        await event_dispatcher.put(event)
 
         except websockets.exceptions.ConnectionClosed:
-            print("\n❌ WebSocket 连接断开，尝试重新连接...")
+            log.error("push_closed", "\n❌ WebSocket 连接断开，尝试重新连接...")
+            metrics.incr("reconnects")
             await asyncio.sleep(5)
             return
         except Exception as e:
-            print(f"\n⚠️ 监听异常: {e}")
+            log.warning("push_failed", "\n⚠️ 监听异常: {error}", error=e)
 
 
-def get_account_balance():
-    """获取账户余额信息"""
-    endpoint = "/api/v5/account/balance"
-    url = BASE_URL + endpoint
-
-    timestamp = datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
-    sign = generate_signature(timestamp, "GET", endpoint)
-
-    headers = {
-        "OK-ACCESS-KEY": API_KEY,
-        "OK-ACCESS-SIGN": sign,
-        "OK-ACCESS-TIMESTAMP": timestamp,
-        "OK-ACCESS-PASSPHRASE": PASSPHRASE,
-        "Content-Type": "application/json",
-    }
+class FillTracker:
+    """逐笔成交跟踪
+    按订单记住已计入的累计成交张数，每条推送只计入比上次多出的部分，同一 tradeId 只计一次，
+    重复、重放或跳过了中间几条的推送都不会重复或漏计；已结束的订单保留最近 FILL_TRACKER_SIZE 笔
+    """
 
-    try:
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
+    def __init__(self, size=FILL_TRACKER_SIZE):
+        self.size = size
+        self.orders = {}  # ordId -> [已计入的累计成交张数, 已计入的 tradeId, 是否已结束]
+        self.finished = deque()
+
+    def delta(self, event):
+        """本条推送新增的成交张数(Decimal)，没有新增时为 0"""
+        state = self.orders.get(event.ord_id)
+        if state is None:
+            state = self.orders[event.ord_id] = [Decimal(0), set(), False]
+        counted, trade_ids = state[0], state[1]
+        delta = Decimal(0)
+        if not (event.trade_id and event.trade_id in trade_ids):
+            acc_fill_sz = event.raw.get("accFillSz")
+            delta = Decimal(acc_fill_sz) - counted if acc_fill_sz else Decimal(event.raw.get("fillSz") or 0)
+        if delta > 0:
+            state[0] = counted + delta
+            if event.trade_id:
+                trade_ids.add(event.trade_id)
+        if event.state in TERMINAL_ORDER_STATES and not state[2]:
+            state[2] = True
+            self.finished.append(event.ord_id)
+            while len(self.finished) > self.size:
+                self.orders.pop(self.finished.popleft(), None)
+        return max(delta, Decimal(0))
+
+
+fill_tracker = FillTracker()
+
+
+async def handle_order_event(event):
+    """处理一条订单推送: 记录状态变化，按新增成交量推进网格
+    完全成交时走网格步骤，部分成交只调整持仓(开启 enable_partial_rearm 时按成交量补挂对侧挂单)
+    """
+    lookup_start = time.perf_counter()
+    grid = grids.get(event.inst_id)
+    # 记录程序订单的状态变化，终态订单到期后从索引中清理
+    order_registry.update_state(event.ord_id, event.state)
+    if event.ord_id in pending_amends:
+        await handle_amend_result(event)
+    if not event.ord_id or event.px == 0:
+        return
+
+    # 验证订单是否由程序创建
+    order_type, _, _ = get_order_info(event.ord_id)
+    if order_type is None:  # 如果订单不在记录中，说明不是程序创建的
+        return
+    contracts = fill_tracker.delta(event)
+    if not contracts:
+        return
+    filled_size = grid.to_coins(contracts)
+
+    metrics.observe("lookup", time.perf_counter() - lookup_start)
+    if event.state == "filled":
+        await process_fill(grid, event.pos_side, event.side, event.px, filled_size, event.fill_time)
+    else:
+        await process_partial_fill(grid, event.pos_side, event.side, event.px, filled_size, event.fill_time)
 
-        if response_data.get("code") == "0":
-            data = response_data.get("data", [])
-            if data:
-                return float(data[0].get("totalEq", "0"))
-        return 0
 
-    except Exception as e:
-        print(f"❌ 获取账户信息发生错误: {e}")
+class EventDispatcher:
+    """订单事件分发
+    按 (instId, posSide) 把事件分片到固定的处理协程，每个协程一个有界队列:
+    不同合约、不同方向并行处理，同一方向的事件保持顺序；
+    订单事件决定持仓和网格，任何情况下都不丢弃: 队列满时读取协程等待(背压到推送连接)，其他调用方的事件由后台任务排队放入
+    """
+
+    def __init__(self, workers=EVENT_WORKERS, maxsize=EVENT_QUEUE_SIZE):
+        self.queues = [asyncio.Queue(maxsize) for _ in range(workers)]
+        self.shards = {}  # (instId, posSide) -> 队列
+        self.tasks = []
+        self.active = 0  # 正在处理的事件数
+        self.waiting = 0  # 等待队列腾出空间的事件数
+        self.backlog = set()  # 代为放入事件的后台任务
+
+    def start(self):
+        """启动处理协程，已启动时忽略"""
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self.worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    @property
+    def idle(self):
+        """没有排队和正在处理的事件"""
+        return self.active == 0 and self.depth == 0 and self.waiting == 0
+
+    async def wait_idle(self):
+        """等待排队和正在处理的事件全部处理完"""
+        while not self.idle:
+            await asyncio.sleep(0.01)
+
+    def shard(self, inst_id, pos_side):
+        """(instId, posSide) 对应的队列
+        按 crc32 分片而不是 hash(): 字符串哈希每个进程不同，同一份录制每次回放的分片和请求顺序都会变
+        """
+        queue = self.shards.get((inst_id, pos_side))
+        if queue is None:
+            index = zlib.crc32(f"{inst_id}:{pos_side}".encode()) % len(self.queues)
+            queue = self.shards[(inst_id, pos_side)] = self.queues[index]
+        return queue
+
+    async def put(self, event):
+        """放入对应分片的队列，队列满时等待腾出空间"""
+        queue = self.shard(event.inst_id, event.pos_side)
+        if queue.full():
+            metrics.incr("queue_full_waits")
+        self.waiting += 1
+        try:
+            await queue.put((time.perf_counter(), event))
+        finally:
+            self.waiting -= 1
+        metrics.set_gauge("queue_depth", self.depth)
+
+    def dispatch(self, event):
+        """放入对应分片的队列，不等待
+        确认委托、对账补处理成交时调用，可能在处理协程内，不能等待自己的队列: 队列满时交给后台任务放入
+        """
+        queue = self.shard(event.inst_id, event.pos_side)
+        if queue.full() or self.waiting:
+            task = asyncio.ensure_future(self.put(event))
+            self.backlog.add(task)
+            task.add_done_callback(self.backlog.discard)
+            return
+        queue.put_nowait((time.perf_counter(), event))
+        metrics.set_gauge("queue_depth", self.depth)
+
+    async def worker(self, queue):
+        while True:
+            enqueued, event = await queue.get()
+            waited = time.perf_counter() - enqueued
+            metrics.observe("queue_wait", waited)
+            if waited > EVENT_LATE_THRESHOLD:
+                metrics.incr("events_late")
+            self.active += 1
+            try:
+                await handle_order_event(event)
+            except Exception as e:
+                log.error("event_failed", "\n⚠️ 处理订单事件异常: {error}", ord_id=event.ord_id, error=e)
+            finally:
+                self.active -= 1
+
+
+event_dispatcher = EventDispatcher()
+
+
+class Reconciler:
+    """后台对账
+    低频对比交易所的挂单和持仓快照与本地挂单簿、持仓和网格应有的挂单，发现漏掉的推送后修正:
+    - 交易所有、本地没有的程序挂单加入挂单簿
+    - 本地有、交易所已没有的挂单查询最终状态，有成交的(含部分成交后撤销)按普通订单事件分发，推进网格
+    - 持仓不一致时以交易所为准，网格缺少的挂单通过 OrderBatch 补挂
+    只在事件处理空闲时运行，查询走 query 通道，排在撤单和下单之后；差异需在相隔 RECONCILE_CONFIRM_DELAY
+    的两次快照中都存在才修正，避免把推送途中的正常状态当作差异；每轮修正的订单数有上限
+    """
+
+    async def snapshot(self):
+        """查询交易所挂单和持仓，返回 (ordId -> 程序挂单, (instId, posSide) -> 持仓币数量)，失败返回 None"""
+        try:
+            orders, positions = await asyncio.gather(fetch_pending_orders(),
+                                                     rest_client.get("/api/v5/account/positions"))
+        except Exception as e:
+            log.error("reconcile_query_failed", "❌ 对账查询失败: {error}", error=e)
+            return None
+        if orders.get("code") != "0" or positions.get("code") != "0":
+            log.error("reconcile_query_failed", "❌ 对账查询失败: {error}", error=orders.get('msg') or positions.get('msg'))
+            return None
+        exchange_orders = {order["ordId"]: order for order in orders.get("data", [])
+                           if order.get("instId") in grids and order_registry.get(order.get("ordId")) is not None}
+        exchange_positions = {}
+        for item in positions.get("data", []):
+            key = (item.get("instId"), item.get("posSide"))
+            exchange_positions[key] = abs(to_coins(item.get("instId"), item.get("pos")))
+        return exchange_orders, exchange_positions
+
+    def diff(self, exchange_orders, exchange_positions):
+        """本地与交易所快照的差异: 差异键 -> 交易所的值"""
+        drift = {}
+        local_orders = {ord_id: order for ord_id, order in open_order_book.orders.items()
+                        if order.get("instId") in grids and order_registry.get(ord_id) is not None}
+        for ord_id, order in exchange_orders.items():
+            if ord_id not in local_orders:
+                drift[("unknown_order", ord_id)] = order
+        for ord_id, order in local_orders.items():
+            if ord_id not in exchange_orders:
+                drift[("vanished_order", ord_id)] = order
+        for inst_id, grid in grids.items():
+            for pos_side, grid_side in grid.sides.items():
+                if not grid_side.enabled:
+                    continue
+                position = exchange_positions.get((inst_id, pos_side), 0.0)
+                if abs(account_state.position(inst_id, pos_side) - position) > 1e-9:
+                    drift[("position", inst_id, pos_side)] = position
+            # 按本地状态网格应有但缺少的挂单
+            batch = OrderBatch()
+            plan_initial_orders(batch, grid)
+            if batch.places or batch.amends or batch.cancels:
+                drift[("grid", inst_id)] = None
+        return drift
+
+    async def reconcile(self, confirm_delay=RECONCILE_CONFIRM_DELAY):
+        """对账一次，返回修正的差异数"""
+        if not event_dispatcher.idle:
+            metrics.incr("reconcile_deferred")
+            return 0
+        metrics.incr("reconcile_passes")
+        with metrics.span("reconcile"):
+            first = await self.snapshot()
+            if first is None:
+                return 0
+            drift = self.diff(*first)
+        if not drift:
+            return 0
+        await asyncio.sleep(confirm_delay)
+        if not event_dispatcher.idle:
+            metrics.incr("reconcile_deferred")
+            return 0
+        with metrics.span("reconcile"):
+            second = await self.snapshot()
+            if second is None:
+                return 0
+            confirmed = {key: value for key, value in self.diff(*second).items()
+                         if key in drift and (key[0] != "position" or drift[key] == value)}
+        if confirmed:
+            log.warning("reconcile_drift", "🔍 对账发现差异: {kinds}", kinds=dict(Counter(key[0] for key in confirmed)))
+            metrics.incr("reconcile_drift", len(confirmed))
+            await self.correct(confirmed)
+        return len(confirmed)
+
+    async def correct(self, drift):
+        budget = RECONCILE_MAX_ORDERS
+        for key, order in drift.items():
+            if key[0] == "unknown_order":
+                open_order_book.apply(order)
+        # 先补处理漏掉的成交，持仓和挂单在成交处理完后的下一轮再对比
+        vanished = [order for key, order in drift.items() if key[0] == "vanished_order"][:budget]
+        budget -= len(vanished)
+        replayed, _ = await settle_orders(vanished)
+        if replayed:
+            log.warning("reconcile_replayed", "♻️ 补处理漏掉的成交: {count} 笔", count=replayed)
+            return
+        for key, position in drift.items():
+            if key[0] == "position":
+                _, inst_id, pos_side = key
+                log.warning("reconcile_position", "♻️ {inst_id} {pos_side} 持仓以交易所为准: {local} -> {position}",
+                            inst_id=inst_id, pos_side=pos_side, local=account_state.position(inst_id, pos_side),
+                            position=position)
+                account_state.set_position(inst_id, pos_side, position)
+        batch = OrderBatch()
+        for grid in grids.values():
+            plan_initial_orders(batch, grid)
+        # 超出本轮上限的挂单留到下一轮
+        batch.cancels = batch.cancels[:budget]
+        budget -= len(batch.cancels)
+        batch.amends = batch.amends[:max(budget, 0)]
+        budget -= len(batch.amends)
+        batch.places = batch.places[:max(budget, 0)]
+        if batch.places or batch.amends or batch.cancels:
+            log.info("reconcile_rearm", "📝 对账补挂: 下单 {places} 笔，改单 {amends} 笔，撤单 {cancels} 笔",
+                     places=len(batch.places), amends=len(batch.amends), cancels=len(batch.cancels))
+            await batch.flush()
+
+    async def run(self, interval=RECONCILE_INTERVAL):
+        """后台对账任务，间隔加入随机抖动"""
+        while True:
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+            try:
+                await self.reconcile()
+            except Exception as e:
+                log.error("reconcile_failed", "⚠️ 对账异常: {error}", error=e)
+
+
+reconciler = Reconciler()
+
+
+class AccountState:
+    """账户和持仓快照
+    由 websocket account / positions 频道推送维护，启动时用 REST 初始化一次；
+    成交推送先于持仓推送到达时按成交量临时调整，收到持仓推送后以交易所数据为准
+    """
+
+    def __init__(self):
+        self.total_eq = 0.0  # 账户总权益(USDT)
+        self.equity_time = 0  # 交易所更新时间(毫秒)
+        self.positions = {}  # (instId, posSide) -> {"pos": 持仓量, "liq_px": 预估爆仓价, "u_time": 更新时间(毫秒)}
+        self.updated = 0  # 最近一次更新的本地时间
+
+    def apply_account(self, data):
+        """应用账户推送或 REST 余额数据"""
+        for item in data:
+            u_time = int(item.get("uTime") or 0)
+            if u_time and u_time < self.equity_time:
+                continue
+            self.total_eq = float(item.get("totalEq") or 0)
+            self.equity_time = u_time
+            self.updated = time.time()
+
+    def apply_positions(self, data):
+        """应用持仓推送或 REST 持仓数据"""
+        for item in data:
+            key = (item.get("instId"), item.get("posSide"))
+            u_time = int(item.get("uTime") or 0)
+            current = self.positions.get(key)
+            if current and u_time < current["u_time"]:
+                continue
+            self.positions[key] = {
+                "pos": abs(to_coins(item.get("instId"), item.get("pos"))),  # 张数转换为币数量
+                "liq_px": float(item.get("liqPx") or 0),
+                "u_time": u_time,
+            }
+            self.updated = time.time()
+
+    def apply_fill(self, inst_id, pos_side, delta, fill_time=0):
+        """按成交临时调整持仓，持仓推送已包含该成交(推送时间不早于成交时间)时忽略
+        返回调整后的持仓
+        """
+        position = self.positions.setdefault((inst_id, pos_side), {"pos": 0.0, "liq_px": 0.0, "u_time": 0})
+        if not fill_time or int(fill_time) > position["u_time"]:
+            # 按十进制相加，多次部分成交累加后不产生浮点误差
+            position["pos"] = max(float(Decimal(str(position["pos"])) + Decimal(str(delta))), 0.0)
+        return position["pos"]
+
+    def set_position(self, inst_id, pos_side, pos):
+        """无法从交易所获取时使用配置的持仓"""
+        self.positions[(inst_id, pos_side)] = {"pos": pos, "liq_px": 0.0, "u_time": 0}
+
+    def position(self, inst_id, pos_side):
+        """当前持仓(币数量)"""
+        return self.positions.get((inst_id, pos_side), {}).get("pos", 0.0)
+
+    def liquidation_price(self, inst_id):
+        """预估爆仓价，取该合约第一笔有爆仓价的持仓"""
+        for (position_inst_id, _), position in self.positions.items():
+            if position_inst_id == inst_id and position["liq_px"]:
+                return position["liq_px"]
         return 0
 
+    async def bootstrap(self):
+        """启动时用 REST 获取账户和持仓，之后只依赖推送"""
+        snapshot = await self.fetch()
+        if snapshot is None:
+            return False
+        self.apply_snapshot(*snapshot)
+        return True
 
-def get_liquidation_price():
-    """获取预估爆仓价"""
-    endpoint = "/api/v5/account/positions"
-    url = BASE_URL + endpoint
+    async def fetch(self):
+        """用 REST 同时获取余额和持仓，返回 (余额数据, 持仓数据)，失败返回 None"""
+        try:
+            balance, positions = await asyncio.gather(rest_client.get("/api/v5/account/balance"),
+                                                      rest_client.get("/api/v5/account/positions"))
+        except Exception as e:
+            log.error("account_bootstrap_failed", "❌ 获取账户信息发生错误: {error}", error=e)
+            return None
+        if balance.get("code") != "0" or positions.get("code") != "0":
+            log.error("account_bootstrap_failed", "❌ 获取账户信息失败: {error}",
+                      error=balance.get('msg') or positions.get('msg'))
+            return None
+        return balance.get("data", []), positions.get("data", [])
 
-    timestamp = datetime.now(UTC).strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:23] + 'Z'
-    sign = generate_signature(timestamp, "GET", endpoint)
+    def apply_snapshot(self, balance, positions):
+        self.apply_account(balance)
+        self.apply_positions(positions)
 
-    headers = {
-        "OK-ACCESS-KEY": API_KEY,
-        "OK-ACCESS-SIGN": sign,
-        "OK-ACCESS-TIMESTAMP": timestamp,
-        "OK-ACCESS-PASSPHRASE": PASSPHRASE,
-        "Content-Type": "application/json",
-    }
 
-    try:
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
+account_state = AccountState()
 
-        if response_data.get("code") == "0":
-            positions = response_data.get("data", [])
-            for position in positions:
-                if position.get("instId") == "BTC-USDT-SWAP":
-                    return float(position.get("liqPx", "0"))
-        return 0
 
-    except Exception as e:
-        print(f"❌ 获取预估爆仓价失败: {e}")
-        return 0
+def get_account_balance():
+    """获取账户余额信息(取自账户快照)"""
+    return account_state.total_eq
 
 
-def send_to_feishu(grid_size, take_profit_size, current_position, max_position, trigger_price, action_type, buy_price,
-                   close_long_price, take_profit_count, balance, pos_type):
-    """发送消息到飞书"""
-    url = f"https://open.feishu.cn/open-apis/bot/v2/hook/{feishu_token}"
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    headers = {
-        "Content-Type": "application/json"
-    }
+def get_liquidation_price(inst_id=DEFAULT_INST_ID):
+    """获取预估爆仓价(取自持仓快照)"""
+    return account_state.liquidation_price(inst_id)
+
 
-    # 获取账户总价值、预估爆仓价和对应方向的止盈次数
-    total_balance = get_account_balance()
-    liquidation_price = get_liquidation_price()
-    display_take_profit_count = long_take_profit_count if pos_type == "多" else short_take_profit_count
+def send_to_feishu(grid_size, take_profit_size, current_position, max_position, trigger_price, action_type, buy_price,
+                   close_long_price, take_profit_count, balance, pos_type, inst_id=DEFAULT_INST_ID):
+    """发送消息到飞书
+    只把事件放入通知队列后立即返回，由后台任务合并发送，不影响交易延迟
+    """
+    feishu_notifier.notify({
+        "grid_size": grid_size,
+        "take_profit_size": take_profit_size,
+        "current_position": current_position,
+        "max_position": max_position,
+        "trigger_price": trigger_price,
+        "action_type": action_type,
+        "buy_price": buy_price,
+        "close_long_price": close_long_price,
+        "take_profit_count": take_profit_count,
+        "pos_type": pos_type,
+        "inst_id": inst_id,
+        "liquidation_price": get_liquidation_price(inst_id),
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+
+def build_feishu_card(events, dropped, total_balance):
+    """把一批通知事件合并为一张飞书卡片
+    每个合约的每个方向展示最新一次成交，并汇总本批的加仓/止盈次数
+    """
+    latest = {}
+    counts = {}
+    for event in events:
+        key = (event["inst_id"], event["pos_type"])
+        latest[key] = event
+        count = counts.setdefault(key, [0, 0])
+        count[event["action_type"] == 1] += 1
 
     # Determine action and template color based on action_type
-    if action_type == 1:
+    if any(event["action_type"] == 1 for event in events):
         action = "止盈"  # Take profit
         template_color = "green"
-    elif action_type == 0:
+    elif all(event["action_type"] == 0 for event in events):
         action = "加仓"  # Increase position
         template_color = "orange"
     else:
         action = "未知"  # Unknown action
         template_color = "wathet"  # Default color
 
-    data = {
+    elements = []
+    for (inst_id, pos_type), event in latest.items():
+        event_action = {1: "止盈", 0: "加仓"}.get(event["action_type"], "未知")
+        content = (
+            f"**·交易对:** <font color='orange'>**{inst_id}-{pos_type}**</font>  \n"
+            f"**·触发价格:** <font color='blue'>**{event['trigger_price']}**</font> **行为:** <font color='green'>**{event_action}**</font>  \n"
+            f"**·挂买单价格:** <font color='green'>**{event['buy_price']}**</font> **数量:** <font color='green'>**{event['grid_size']}**</font>  \n"
+            f"**·挂卖单价格:** <font color='red'>**{event['close_long_price']}**</font> **数量:** <font color='red'>**{event['take_profit_size']}**</font>  \n"
+            f"**·当前持仓量:** <font color='orange'>**{event['current_position']:.3f}**</font>  \n"
+            f"**·最大持仓量:** <font color='orange'>**{event['max_position']}**</font>  \n"
+            f"**·预估爆仓价:** <font color='red'>**{event['liquidation_price']:.2f}**</font>  \n"
+            f"**·{pos_type}单止盈次数:** <font color='orange'>**{event['take_profit_count']}**</font> **账户总价值:** <font color='orange'>**{total_balance:.2f} USDT**</font>  \n"
+        )
+        add_count, take_profit_count = counts[(inst_id, pos_type)]
+        if add_count + take_profit_count > 1:
+            content += (f"**·本次合并:** <font color='orange'>**{add_count + take_profit_count}**</font> 次成交"
+                        f" (加仓 {add_count} / 止盈 {take_profit_count})  \n")
+        content += f"**·时间:** <font color='green'>**{event['time']}**</font>"
+        if elements:
+            elements.append({"tag": "hr"})
+        elements.append({"tag": "div", "text": {"tag": "lark_md", "content": content}})
+    if dropped:
+        elements.append({"tag": "div", "text": {"tag": "lark_md",
+                                                "content": f"⚠️ 通知队列已满，已丢弃 **{dropped}** 条通知"}})
+
+    return {
         "msg_type": "interactive",
         "card": {
             "config": {
@@ -523,104 +2917,181 @@ def send_to_feishu(grid_size, take_profit_size, current_position, max_position,
                 },
                 "template": template_color
             },
-            "elements": [
-                {
-                    "tag": "div",
-                    "text": {
-                        "tag": "lark_md",
-                        "content": (
-                            f"**·交易对:** <font color='orange'>**BTC-U本位-{pos_type}平**</font>  \n"
-                            f"**·触发价格:** <font color='blue'>**{trigger_price}**</font> **行为:** <font color='green'>**{action}**</font>  \n"
-                            f"**·挂买单价格:** <font color='green'>**{buy_price}**</font> **数量:** <font color='green'>**{grid_size}**</font>  \n"
-                            f"**·挂卖单价格:** <font color='red'>**{close_long_price}**</font> **数量:** <font color='red'>**{take_profit_size}**</font>  \n"
-                            f"**·当前持仓量:** <font color='orange'>**{current_position:.3f}**</font>  \n"
-                            f"**·最大持仓量:** <font color='orange'>**{max_position}**</font>  \n"
-                            f"**·预估爆仓价:** <font color='red'>**{liquidation_price:.2f}**</font>  \n"
-                            f"**·{pos_type}单止盈次数:** <font color='orange'>**{display_take_profit_count}**</font> **账户总价值:** <font color='orange'>**{total_balance:.2f} USDT**</font>  \n"
-                            f"**·时间:** <font color='green'>**{current_time}**</font>"
-                        )
-                    }
-                }
-            ]
+            "elements": elements
         }
     }
 
-    response = requests.post(url, json=data, headers=headers)
-    print(response.json())
+
+class FeishuNotifier:
+    """飞书通知队列
+    成交处理只把事件放入有界队列，后台任务把一段时间内的多次成交合并为一张卡片发送；
+    账户总价值和爆仓价取自账户快照；队列满时丢弃事件并在下一张卡片中汇总
+    """
+
+    def __init__(self, token, maxsize=FEISHU_QUEUE_SIZE):
+        self.token = token
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def notify(self, event):
+        """放入通知事件，不等待"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.incr("notify_dropped")
+
+    async def collect(self):
+        """等待第一条事件，再收集合并窗口内的后续事件"""
+        events = [await self.queue.get()]
+        deadline = time.monotonic() + FEISHU_COALESCE_WINDOW
+        while len(events) < self.queue.maxsize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return events
+
+    async def run(self):
+        """后台发送任务"""
+        while True:
+            events = await self.collect()
+            dropped, self.dropped = self.dropped, 0
+            if not self.token:
+                continue
+            try:
+                card = build_feishu_card(events, dropped, get_account_balance())
+                with metrics.span("notify_send"):
+                    response = await rest_client.post_webhook(FEISHU_WEBHOOK_URL + self.token, card)
+                if response.get("StatusCode", response.get("code")) != 0:
+                    log.error("feishu_failed", "❌ 发送飞书消息失败: {response}", response=response)
+            except Exception as e:
+                log.error("feishu_failed", "❌ 发送飞书消息失败: {error}", error=e)
+
+
+feishu_notifier = FeishuNotifier(feishu_token)
 
 
 async def connect_websocket():
     """WebSocket 连接管理"""
-    global buy_ordId, close_long_ordId
-    is_order_placed = False
     while True:
         try:
-            async with websockets.connect("wss://ws.okx.com:8443/ws/v5/private") as websocket:
+            async with websockets.connect(WS_PRIVATE_URL) as websocket:
                 # 认证
-                timestamp = str(int(time.time()))
-                message = timestamp + 'GET' + '/users/self/verify'
-                signature = base64.b64encode(hmac.new(
-                    SECRET_KEY.encode(), message.encode(), hashlib.sha256
-                ).digest()).decode()
-
-                auth_data = {
-                    "op": "login",
-                    "args": [
-                        {
-                            "apiKey": API_KEY,
-                            "passphrase": PASSPHRASE,
-                            "timestamp": timestamp,
-                            "sign": signature
-                        }
-                    ]
-                }
-                await websocket.send(json.dumps(auth_data))
+                await websocket.send(json.dumps(signer.ws_login()))
                 response = await websocket.recv()
-                print("✅ 认证结果:", response)
-
-                if not is_order_placed:
-                    # 根据配置决定是否委托多单
-                    if enable_long_grid:
-                        buy_price, close_long_price = calculate_grid_prices(long_trigger_price, "long")
-                        buy_ordId = place_order("buy", buy_price, long_grid_size, "long")
-                        # 只有在有持仓时才委托平仓单
-                        if long_position > 0:
-                            close_size = min(long_position, long_grid_size)
-                            close_long_ordId = place_order("sell", close_long_price, close_size, "long", is_close=True)
-
-                    # 根据配置决定是否委托空单
-                    if enable_short_grid:
-                        short_buy_price, short_close_price = calculate_grid_prices(short_trigger_price, "short")
-                        place_order("sell", short_close_price, short_grid_size, "short")
-                        # 只有在有持仓时才委托平仓单
-                        if short_position > 0:
-                            close_size = min(short_position, short_grid_size)
-                            place_order("buy", short_buy_price, close_size, "short", is_close=True)
-
-                    is_order_placed = True
-
+                frame_recorder.record(response)
+                log.info("ws_login", "✅ 认证结果: {response}", response=response)
                 await order_listener(websocket)
         except Exception as e:
-            print(f"⚠️ 连接错误: {e}，5秒后重试...")
+            log.warning("ws_closed", "⚠️ 连接错误: {error}，5秒后重试...", error=e)
+            metrics.incr("reconnects")
             await asyncio.sleep(5)
-            is_order_placed = False
+
+
+bootstrap_done = asyncio.Event()  # 启动阶段的查询完成后置位，推送连接等它完成后才处理成交和补挂
+bootstrap_done.set()  # 不经过 main 启动(压测、回放)时无需等待
+
+
+async def bootstrap():
+    """启动阶段: 同时查询服务器时间、合约规格、账户余额和持仓，全部返回后再应用
+    (持仓按合约面值换算，需在合约规格之后)；推送连接的登录、订阅和挂单查询与之同时进行，
+    并发请求同时建立 REST 连接池的连接，之后的挂单查询和首批委托直接复用
+    """
+    started = time.perf_counter()
+    try:
+        _, specs, snapshot = await asyncio.gather(rest_client.sync_clock(), instrument_specs.fetch_all(list(grids)),
+                                                  account_state.fetch())
+        # 签名时间戳在时钟校正前生成，本地时钟偏差过大时会被拒绝，校正后重试一次
+        if snapshot is None and abs(signer.clock_offset) > CLOCK_SKEW_TOLERANCE:
+            snapshot = await account_state.fetch()
+        instrument_specs.apply(grids, specs)
+        # 账户和持仓只在启动时用 REST 初始化，之后由推送维护；获取失败时沿用上次记录或配置的持仓
+        if snapshot is not None:
+            account_state.apply_snapshot(*snapshot)
+        else:
+            for grid in grids.values():
+                for pos_side, grid_side in grid.sides.items():
+                    account_state.set_position(grid.inst_id, pos_side, grid_side.position)
+        elapsed = time.perf_counter() - started
+        metrics.observe("bootstrap", elapsed)
+        log.info("bootstrap_done", "✅ 启动查询完成: {elapsed_ms:.0f}ms", elapsed_ms=elapsed * 1000)
+    finally:
+        bootstrap_done.set()
+
+
+def health():
+    """运行状态摘要，供 supervisor.py 汇总"""
+    return {
+        "bootstrapped": bootstrap_done.is_set(),
+        "ws_gateway": ws_order_gateway.available,
+        "grids": len(grids),
+        "open_orders": len(open_order_book.orders),
+        "queue_depth": event_dispatcher.depth,
+        "total_eq": account_state.total_eq,
+        "account_updated": account_state.updated,
+    }
+
+
+async def main():
+    """运行机器人，退出时关闭连接池并写出剩余日志"""
+    log.start()
+    if loaded_config:
+        log.info("config_loaded", "✅ 已加载配置: {count} 项", count=len(loaded_config))
+    order_registry.load()
+    cl_ord_id_sequence.load()
+    frame_recorder.open()
+    grid_journal.load()
+    grid_journal.restore(grids)
+    # 启动查询、websocket 交易通道和推送连接同时开始，首批委托在它们都就绪后一次批量发出
+    bootstrap_done.clear()
+    bootstrap_task = asyncio.create_task(bootstrap())
+    gateway_task = asyncio.create_task(ws_order_gateway.run()) if enable_ws_order_entry else None
+    notifier_task = asyncio.create_task(feishu_notifier.run())
+    reconcile_task = asyncio.create_task(reconciler.run()) if RECONCILE_INTERVAL else None
+    metrics_tasks = [asyncio.create_task(metrics.monitor_loop_lag())]
+    if METRICS_SUMMARY_INTERVAL:
+        metrics_tasks.append(asyncio.create_task(metrics.report()))
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await metrics.serve()
+        except OSError as e:
+            log.error("metrics_serve_failed", "⚠️ 监控接口启动失败: {error}", error=e)
+    try:
+        await connect_websocket()
+    finally:
+        await event_dispatcher.stop()
+        notifier_task.cancel()
+        for task in (bootstrap_task, gateway_task, reconcile_task):
+            if task is not None:
+                task.cancel()
+        for task in metrics_tasks:
+            task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await rest_client.close()
+        order_registry.compact()
+        order_registry.store.close()
+        grid_journal.compact()
+        grid_journal.store.close()
+        frame_recorder.close()
+        log.stop()
 
 
 if __name__ == "__main__":
     print("\n🚀 启动OKX网格交易机器人...\n")
-    if enable_long_grid:
-        print("📈 多单交易配置:")
-        print(f"  • 当前持仓: {long_position}")
-        print(f"  • 触发价格: {long_trigger_price}")
-        print(f"  • 网格间距: {long_grid_percentage * 100}%")
-        print(f"  • 交易数量: {long_grid_size}")
-        print(f"  • 最大持仓: {long_max_position}\n")
-
-    if enable_short_grid:
-        print("📉 空单交易配置:")
-        print(f"  • 当前持仓: {short_position}")
-        print(f"  • 触发价格: {short_trigger_price}")
-        print(f"  • 网格间距: {short_grid_percentage * 100}%")
-        print(f"  • 交易数量: {short_grid_size}")
-        print(f"  • 最大持仓: {short_max_position}\n")
-    asyncio.run(connect_websocket())
+    for grid in grids.values():
+        for grid_side in grid.sides.values():
+            if not grid_side.enabled:
+                continue
+            print(f"{'📈' if grid_side.pos_side == 'long' else '📉'} {grid.inst_id} {grid_side.name}单交易配置:")
+            print(f"  • 当前持仓: {grid_side.position}")
+            print(f"  • 触发价格: {grid_side.trigger_price}")
+            print(f"  • 网格间距: {grid_side.grid_percentage * 100}%")
+            print(f"  • 交易数量: {grid_side.grid_size}")
+            print(f"  • 最大持仓: {grid_side.max_position}\n")
+    asyncio.run(main())
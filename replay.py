@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_listener import build_bench_grids
+from bench_rest import percentile
+from bot_loader import load_bot
+from mock_okx import MockOKX, batch_code, page_orders
+
+bot = load_bot()
+
+
+def read_frames(path):
+    """按顺序读取录制文件，返回 (单调时钟纳秒, 消息) 迭代器；末尾写了一半的消息忽略"""
+    header = bot.FrameRecorder.HEADER
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(bot.RECORD_MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(bot.RECORD_MAGIC)] != bot.RECORD_MAGIC:
+                raise ValueError(f"不是录制文件: {path}")
+            offset, end = len(bot.RECORD_MAGIC), len(data)
+            while offset + header.size <= end:
+                timestamp, length = header.unpack_from(data, offset)
+                offset += header.size
+                if offset + length > end:
+                    return
+                yield timestamp, data[offset:offset + length].decode()
+                offset += length
+
+
+class LocalExchange:
+    """回放时代替交易所: 交易请求和挂单查询在进程内回报，不发网络请求
+    录制中的订单按已回放到的推送维护状态(即录制时交易所的状态)，撤单和改单只按该状态回报成败，
+    订单状态以之后的推送为准；回放中新下的订单由 MockOKX 登记(没有行情，不会成交)
+    交易请求按顺序记录在 requests 中，用于比较两次回放是否一致
+    """
+
+    def __init__(self):
+        self.mock = MockOKX()
+        self.recorded = {}  # ordId -> 录制中最近一次推送的订单
+        self.updates = {}  # 消息序号 -> 该条消息中录制订单的推送
+        self.requests = []  # (接口, 请求体)
+        self.handlers = {
+            "/api/v5/trade/order": self.mock.place_item,
+            "/api/v5/trade/batch-orders": self.mock.place_item,
+            "/api/v5/trade/cancel-order": self.cancel_item,
+            "/api/v5/trade/cancel-batch-orders": self.cancel_item,
+            "/api/v5/trade/amend-order": self.amend_item,
+            "/api/v5/trade/amend-batch-orders": self.amend_item,
+        }
+
+    def advance(self, index):
+        """第 index 条消息交给机器人前，按其中的订单推送更新录制订单的状态"""
+        for order in self.updates.get(index, ()):
+            self.recorded[order["ordId"]] = order
+
+    def live(self, ord_id):
+        order = self.recorded.get(ord_id)
+        return order is not None and order.get("state") in bot.LIVE_ORDER_STATES
+
+    def cancel_item(self, args):
+        if args.get("ordId") not in self.recorded:
+            return self.mock.cancel_item(args)
+        if not self.live(args["ordId"]):
+            return {"ordId": args["ordId"], "sCode": "51400", "sMsg": "Order does not exist"}
+        return {"ordId": args["ordId"], "sCode": "0", "sMsg": ""}
+
+    def amend_item(self, args):
+        if args.get("ordId") not in self.recorded:
+            return self.mock.amend_item(args)
+        if not self.live(args["ordId"]):
+            return {"ordId": args["ordId"], "sCode": "51503", "sMsg": "Order does not exist"}
+        return {"ordId": args["ordId"], "sCode": "0", "sMsg": ""}
+
+    async def send_trade_request(self, endpoint, body, weight=1):
+        self.mock.request_counts[endpoint] += 1
+        self.requests.append((endpoint, bot.encode_body(body)))
+        handler = self.handlers[endpoint]
+        data = [handler(item) for item in body] if isinstance(body, list) else [handler(body)]
+        return {"code": batch_code(data), "msg": "", "data": data}
+
+    async def get(self, endpoint, params=None):
+        self.mock.request_counts[endpoint] += 1
+        if endpoint == "/api/v5/trade/orders-pending":
+            live = [order for ord_id, order in self.recorded.items() if self.live(ord_id)]
+            return {"code": "0", "msg": "", "data": page_orders([*self.mock.orders.values(), *live], params or {})}
+        if endpoint == "/api/v5/trade/order":
+            params = params or {}
+            for order in (*self.recorded.values(), *self.mock.orders.values(), *self.mock.finished.values()):
+                if order["ordId"] == params.get("ordId") or order.get("clOrdId") == params.get("clOrdId"):
+                    return {"code": "0", "msg": "", "data": [order]}
+            return {"code": bot.ORDER_NOT_FOUND_CODE, "msg": "Order does not exist", "data": []}
+        return {"code": "0", "msg": "", "data": []}
+
+
+def register_orders(path, exchange):
+    """录制中出现的已配置合约的订单都视为程序订单，回放时成交会推进网格；
+    各条消息中的订单推送预先解析好，回放到该条消息时更新交易所状态，不计入回放耗时；
+    回放中新下的订单从录制中最大的 clOrdId 序号之后编号，不与录制的订单重复
+    """
+    count = 0
+    last_seq = -1
+    for index, (_, frame) in enumerate(read_frames(path)):
+        if '"channel":"orders"' not in frame.replace(" ", ""):
+            continue
+        orders = [order for order in json.loads(frame).get("data") or []
+                  if order.get("instId") in bot.grids and order.get("ordId")]
+        if orders:
+            exchange.updates[index] = orders
+        for order in orders:
+            seq = order.get("clOrdId", "").rpartition("n")[2]
+            if seq.isdigit():
+                last_seq = max(last_seq, int(seq))
+            if bot.order_registry.get(order["ordId"]):
+                continue
+            bot.order_registry.add(order["ordId"], order.get("side"), order.get("px") or 0, order.get("posSide"),
+                                   order.get("clOrdId"), order["instId"])
+            count += 1
+    bot.cl_ord_id_sequence.next = last_seq + 1
+    return count
+
+
+class ReplaySocket:
+    """按录制时的间隔返回消息的 websocket
+    speed 为回放倍速，0 表示不等待、尽快回放；消息读完后 recv 一直等待，由调用方结束
+    """
+
+    def __init__(self, frames, speed, exchange):
+        self.frames = frames
+        self.speed = speed
+        self.exchange = exchange
+        self.start = None  # (第一条消息的录制时间, 回放开始时间)
+        self.count = 0
+        self.size = 0
+        self.lateness = []  # 每条消息比录制间隔晚了多久交给机器人(秒)
+        self.done = asyncio.Event()
+
+    async def recv(self):
+        try:
+            timestamp, frame = next(self.frames)
+        except StopIteration:
+            self.done.set()
+            await asyncio.Future()
+        if self.start is None:
+            self.start = (timestamp, time.perf_counter())
+        if self.speed:
+            due = self.start[1] + max(0, timestamp - self.start[0]) / 1e9 / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.lateness.append(-delay)
+                await asyncio.sleep(0)
+        else:
+            # 让出事件循环，处理协程与读取交替运行(与收取网络消息时相同)
+            await asyncio.sleep(0)
+        self.exchange.advance(self.count)
+        self.count += 1
+        self.size += len(frame)
+        return frame
+
+
+async def main(args):
+    if args.bench_instruments:
+        # bench_listener.py --record 录制的推送，使用与压测相同的网格
+        bot.grids = build_bench_grids(args.bench_instruments, args.price)
+    exchange = LocalExchange()
+    bot.send_trade_request = exchange.send_trade_request
+    bot.rest_client.get = exchange.get
+    # 订单记录和网格状态写到临时目录，不污染实盘文件
+    tmp_dir = tempfile.mkdtemp()
+    bot.order_registry.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "order_records.json"),
+                                                 os.path.join(tmp_dir, "order_records.log"))
+    bot.grid_journal.store = bot.AppendOnlyLog(os.path.join(tmp_dir, "grid_state.json"),
+                                                os.path.join(tmp_dir, "grid_state.log"))
+    bot.log = bot.EventLog(path="", console=args.verbose)
+    bot.log.start()
+    registered = register_orders(args.file, exchange)
+    bot.push_decoder.inst_ids = set(bot.grids)
+    bot.event_dispatcher = bot.EventDispatcher(workers=args.workers)
+    bot.event_dispatcher.start()
+    bot.metrics = bot.Metrics()
+
+    socket = ReplaySocket(read_frames(args.file), args.speed, exchange)
+    watchdog = bot.ConnectionWatchdog(socket, "回放")
+    started = time.perf_counter()
+    reader = asyncio.create_task(bot.read_pushes(socket, watchdog))
+    try:
+        await socket.done.wait()
+        while not bot.event_dispatcher.idle:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        await bot.event_dispatcher.stop()
+        bot.log.stop()
+    if args.log:
+        with open(args.log, "w") as f:
+            f.writelines(f"{endpoint} {body}\n" for endpoint, body in exchange.requests)
+    report(args, socket, exchange, registered, elapsed)
+
+
+def check(args):
+    """同一份录制最快速度回放两次(字符串哈希种子不同)，比较两次发出的交易请求是否完全一致"""
+    tmp_dir = tempfile.mkdtemp()
+    logs = []
+    for seed in ("1", "2"):
+        path = os.path.join(tmp_dir, f"requests-{seed}.log")
+        command = [sys.executable, __file__, args.file, "--speed", "0", "--workers", str(args.workers),
+                   "--bench-instruments", str(args.bench_instruments), "--price", str(args.price), "--log", path]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, env={**os.environ, "PYTHONHASHSEED": seed})
+        with open(path) as f:
+            logs.append(f.read().splitlines())
+    first, second = logs
+    if first == second:
+        print(f"✅ 两次回放的交易请求一致，共 {len(first)} 个")
+        return 0
+    index = next((i for i, (a, b) in enumerate(zip(first, second)) if a != b), min(len(first), len(second)))
+    print(f"❌ 两次回放的交易请求不一致: 请求数 {len(first)} / {len(second)}，第 {index + 1} 个请求开始不同")
+    for lines in logs:
+        print(f"  {lines[index] if index < len(lines) else '(无)'}")
+    return 1
+
+
+def report(args, socket, exchange, registered, elapsed):
+    speed = f"{args.speed:g} 倍速" if args.speed else "最快速度"
+    print(f"🧪 回放 {args.file}，{speed}，{args.workers} 个处理协程，登记录制中的订单 {registered} 笔\n")
+    print(f"  • 消息 {socket.count} 条 / {socket.size / 1e6:.1f}MB，耗时 {elapsed:.2f}s，"
+          f"{socket.count / elapsed if elapsed else 0:,.0f} 条/秒")
+    if socket.lateness:
+        print(f"  • 落后录制节奏 {len(socket.lateness)} 条，p50 {percentile(socket.lateness, 50) * 1000:.2f}ms  "
+              f"p99 {percentile(socket.lateness, 99) * 1000:.2f}ms  最大 {max(socket.lateness) * 1000:.2f}ms")
+    print(f"  • 交易请求: {dict(exchange.mock.request_counts)}\n")
+    # 推送延迟按交易所更新时间计算，回放时没有意义
+    bot.metrics.histograms.pop("recv", None)
+    print(bot.metrics.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推送回放: 把录制的推送按原始节奏、加速或最快速度交给机器人处理，"
+                                                 "交易请求由进程内的模拟交易所回报")
+    parser.add_argument("file", help="录制文件(okx-bot.py 的 RECORD_FILE)")
+    parser.add_argument("--speed", type=float, default=1, help="回放倍速，0 表示尽快回放")
+    parser.add_argument("--workers", type=int, default=bot.EVENT_WORKERS, help="订单事件处理协程数")
+    parser.add_argument("--bench-instruments", type=int, default=0,
+                        help="回放 bench_listener.py 的录制时填写其合约数量，使用压测的网格；默认使用机器人配置的网格")
+    parser.add_argument("--price", type=float, default=85000, help="压测网格的初始价格")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的日志")
+    parser.add_argument("--log", help="把交易请求(接口和请求体)按发出顺序写入该文件")
+    parser.add_argument("--check", action="store_true", help="最快速度回放两次，检查两次的交易请求是否一致")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(check(args))
+    asyncio.run(main(args))
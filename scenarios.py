@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from bot_loader import load_bot
+from mock_okx import MockOKX, start_mock_server
+
+
+async def wait_until(condition, timeout=10.0):
+    """等待条件成立，超时返回 False"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+def find_orders(mock, side, pos_side):
+    return [order for order in mock.orders.values() if order["side"] == side and order["posSide"] == pos_side]
+
+
+async def ws_timeout_filled(bot, mock):
+    """websocket 下单的回报丢失，委托在超时前已经成交: 应按 clOrdId 确认，不能重发导致重复开仓"""
+    gateway_task = asyncio.create_task(bot.ws_order_gateway.run())
+    try:
+        assert await wait_until(lambda: bot.ws_order_gateway.available), "websocket 交易通道未连接"
+        mock.set_price(bot.DEFAULT_INST_ID, 84000)
+        mock.lost_responses = 1
+        order_data = bot.build_order_data("buy", 85000, bot.long_grid_size, "long")
+        ord_id = await bot.submit_order(order_data)
+    finally:
+        gateway_task.cancel()
+    placed = mock.item_counts["ws:order"] + mock.item_counts["/api/v5/trade/order"]
+    assert placed == 1, f"下单 {placed} 次"
+    assert mock.positions[(bot.DEFAULT_INST_ID, "long")] == float(order_data["sz"]), mock.positions
+    assert ord_id is not None and bot.order_registry.get(ord_id), "成交的委托没有登记"
+
+
+async def ws_closed_cancel(bot, mock):
+    """websocket 交易通道正在断开(发送时 ConnectionClosed): 撤单应改用 REST 完成，不能丢失"""
+
+    class ClosingSocket:
+        async def send(self, message):
+            raise bot.websockets.exceptions.ConnectionClosed(None, None)
+
+    order_data = bot.build_order_data("sell", 90000, bot.long_grid_size, "long", is_close=True)
+    ord_id = mock.create_order(order_data)
+    bot.record_placed_order(order_data, ord_id)
+    bot.ws_order_gateway.websocket = ClosingSocket()
+    response = await bot.cancel_order_rest_api(ord_id, order_data["instId"])
+    assert response.get("code") == "0", f"撤单回报 {response}"
+    assert ord_id not in mock.orders, "挂单没有被撤销"
+
+
+async def reconnect_missed_fill(bot, mock):
+    """推送连接断开期间多单买单成交(推送丢失)，重连后应按成交推进网格，不能当作已撤销而在原价重新买入"""
+    inst_id = bot.DEFAULT_INST_ID
+    grid_side = bot.grids[inst_id].sides["long"]
+    task = asyncio.create_task(bot.main())
+    try:
+        assert await wait_until(lambda: find_orders(mock, "buy", "long")), "启动后没有挂出多单买单"
+        buy = find_orders(mock, "buy", "long")[0]
+        mock.mute_pushes = True
+        mock.set_price(inst_id, float(buy["px"]))
+        for websocket in list(mock.subscribers):
+            await websocket.close()
+        mock.mute_pushes = False
+        assert await wait_until(lambda: find_orders(mock, "sell", "long"), timeout=15), "重连后没有挂出多单平仓单"
+        await asyncio.sleep(0.5)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    position = mock.positions[(inst_id, "long")]
+    assert position == float(buy["sz"]), f"多单持仓 {position} 张，应为 {buy['sz']} 张"
+    assert grid_side.trigger_price == float(buy["px"]), f"触发价 {grid_side.trigger_price}，应为成交价 {buy['px']}"
+    assert bot.order_registry.get(buy["ordId"])["state"] == "filled", bot.order_registry.get(buy["ordId"])
+
+
+async def queue_full(bot, mock):
+    """订单事件处理跟不上、队列已满: 事件应排队等待，全部按顺序处理，不能丢弃"""
+    handled = []
+
+    async def handle_order_event(event):
+        await asyncio.sleep(0.001)
+        handled.append(event.ord_id)
+
+    bot.handle_order_event = handle_order_event
+    dispatcher = bot.EventDispatcher(workers=1, maxsize=5)
+    dispatcher.start()
+    try:
+        events = [bot.OrderEvent({"instId": bot.DEFAULT_INST_ID, "ordId": str(i), "posSide": "long"})
+                  for i in range(50)]
+        for event in events[:40]:
+            await dispatcher.put(event)
+        for event in events[40:]:
+            dispatcher.dispatch(event)
+        assert await wait_until(lambda: dispatcher.idle), "事件没有处理完"
+    finally:
+        await dispatcher.stop()
+    assert handled == [event.ord_id for event in events], f"处理了 {len(handled)} / {len(events)} 个事件"
+
+
+async def pending_pages(bot, mock):
+    """挂单超过一页(100 笔): 校准挂单簿应翻页取全，不能把后面几页的挂单当作已消失的订单去逐笔查询"""
+    for i in range(250):
+        order_data = bot.build_order_data("buy", 80000 - i * 10, bot.long_grid_size, "long")
+        bot.record_placed_order(order_data, mock.create_order(order_data))
+    vanished = await bot.open_order_book.resync()
+    assert vanished == [], f"{len(vanished)} 笔挂单被当作已消失"
+    assert len(bot.open_order_book.orders) == 250, f"挂单簿 {len(bot.open_order_book.orders)} 笔"
+    assert len(await bot.query_orders()) == 250, "查询委托单没有翻页"
+    exchange_orders, _ = await bot.reconciler.snapshot()
+    assert len(exchange_orders) == 250, f"对账快照 {len(exchange_orders)} 笔挂单"
+
+
+async def restart_ladder(bot, mock):
+    """多层网格成交后重启: 恢复的网格应与重启前是同一组价格，不能以恢复的触发价格为基准重新划分"""
+    config = {"inst_id": bot.DEFAULT_INST_ID,
+              "long": {"trigger_price": 85000, "grid_percentage": 0.006, "grid_size": 0.002, "max_position": 0.01,
+                       "ladder_levels": 3}}
+    grid = bot.GridState.from_config(config)
+    grid_side = grid.sides["long"]
+    before = [grid_side.ladder.price(level) for level in range(-5, 6)]
+    # 买入两层后记录网格状态，再按同样的配置重新创建网格、恢复状态并设置合约规格
+    grid_side.trigger_price = grid_side.ladder.price(-2)
+    bot.grid_journal.record(grid.inst_id, grid_side, 0.004)
+    restarted = bot.GridState.from_config(config)
+    journal = bot.GridJournal(bot.GRID_STATE_FILE, bot.GRID_STATE_LOG_FILE)
+    journal.load()
+    journal.restore({restarted.inst_id: restarted})
+    restarted.set_spec(grid.tick_size, grid.ct_val, grid.lot_size, grid.min_size)
+    ladder = restarted.sides["long"].ladder
+    after = [ladder.price(level) for level in range(-5, 6)]
+    assert after == before, f"重启后网格价格 {after[3:8]}，重启前 {before[3:8]}"
+    assert ladder.level_of(restarted.sides["long"].trigger_price) == -2, "恢复的触发价格不在原来的层级上"
+
+
+async def legacy_order_records(bot, mock):
+    """升级后首次启动，订单记录是旧版本写的(没有状态和 instId): 不能当作挂单逐笔查询，把早已处理过的成交再推进一次网格"""
+    inst_id = bot.DEFAULT_INST_ID
+    grid_side = bot.grids[inst_id].sides["long"]
+    trigger_price = grid_side.trigger_price
+    orders = {}
+    for price in (84000, 83000, 79000):
+        order_data = bot.build_order_data("buy", price, bot.long_grid_size, "long")
+        ord_id = mock.create_order(order_data)
+        mock.fill_order(ord_id)
+        orders[ord_id] = {"side": "buy", "price": float(price), "pos_side": "long"}
+    mock.positions.clear()
+    with open(bot.ORDER_RECORDS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"orders": orders}, f)
+    task = asyncio.create_task(bot.main())
+    try:
+        assert await wait_until(lambda: find_orders(mock, "buy", "long")), "启动后没有挂出多单买单"
+        await asyncio.sleep(0.5)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    queried = mock.request_counts["/api/v5/trade/order"] - mock.item_counts["/api/v5/trade/order"]
+    assert queried == 0, f"查询了 {queried} 次旧订单"
+    assert bot.metrics.counters["fills"] == 0, f"重放了 {bot.metrics.counters['fills']} 笔成交"
+    assert grid_side.trigger_price == trigger_price, f"触发价 {grid_side.trigger_price}，应为 {trigger_price}"
+    assert grid_side.take_profit_count == 0, f"止盈次数 {grid_side.take_profit_count}"
+    assert mock.positions.get((inst_id, "long"), 0) == 0, f"多单持仓 {mock.positions[(inst_id, 'long')]} 张"
+
+
+SCENARIOS = {
+    "ws_timeout_filled": ws_timeout_filled,
+    "ws_closed_cancel": ws_closed_cancel,
+    "reconnect_missed_fill": reconnect_missed_fill,
+    "queue_full": queue_full,
+    "pending_pages": pending_pages,
+    "restart_ladder": restart_ladder,
+    "legacy_order_records": legacy_order_records,
+}
+
+
+async def run(name, verbose):
+    """每个场景使用独立的模拟交易所和一份新加载的机器人模块，本地文件写到临时目录"""
+    mock = MockOKX()
+    runner, base_url = await start_mock_server(mock)
+    ws_url = base_url.replace("http", "ws") + "/ws/v5/private"
+    bot = load_bot(f"okx_bot_{name}", {"DATA_DIR": tempfile.mkdtemp(), "BASE_URL": base_url,
+                                       "WS_PRIVATE_URL": ws_url, "METRICS_PORT": 0, "RECONCILE_INTERVAL": 0,
+                                       "LOG_CONSOLE": verbose})
+    bot.ws_order_gateway = bot.WsOrderGateway(bot.API_KEY, bot.SECRET_KEY, bot.PASSPHRASE, url=ws_url)
+    bot.log.start()
+    try:
+        await SCENARIOS[name](bot, mock)
+    finally:
+        await bot.rest_client.close()
+        bot.log.stop()
+        await runner.cleanup()
+
+
+async def main(args):
+    failed = 0
+    for name in args.scenarios or SCENARIOS:
+        try:
+            await run(name, args.verbose)
+            print(f"  ✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ {name}: {e}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="故障场景检查: 在模拟交易所上重现回报丢失、断线等情况，检查不会重复下单或漏处理成交")
+    parser.add_argument("scenarios", nargs="*", help=f"要运行的场景，默认全部: {', '.join(SCENARIOS)}")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的日志")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}，可用场景: {', '.join(SCENARIOS)}")
+    raise SystemExit(1 if asyncio.run(main(args)) else 0)
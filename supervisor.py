@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import signal
+import time
+from multiprocessing.connection import wait
+
+import aiohttp.web
+
+from bot_loader import load_bot
+
+HEALTH_INTERVAL = 5  # 工作进程上报状态的间隔(秒)
+HEALTH_TIMEOUT = 30  # 工作进程超过该时间(秒)没有上报视为卡死，结束后重启
+RESTART_DELAY = 1  # 工作进程退出后重启前的等待时间(秒)，连续崩溃时逐次加倍
+RESTART_DELAY_MAX = 60  # 重启等待时间上限(秒)
+STABLE_SECONDS = 60  # 工作进程运行超过该时间(秒)后退出，重启等待时间恢复为 RESTART_DELAY
+ACCOUNT_RESTART_DELAY = 5  # 单个账户异常退出后在工作进程内重启前的等待时间(秒)
+STOP_TIMEOUT = 10  # 退出时等待工作进程收尾(写出订单记录和日志)的时间(秒)
+
+
+def load_accounts(path):
+    """读取账户列表，例如
+    {"accounts": [{"name": "sub1", "config": {"API_KEY": "...", "SECRET_KEY": "...", "PASSPHRASE": "...",
+                                              "long_trigger_price": 85000, "EXTRA_GRIDS": [...]}},
+                  {"name": "sub2", "config": "sub2.json"}]}
+    config 为 okx-bot.py 的参数覆盖(与其配置文件格式相同)，或配置文件路径(相对账户列表文件)
+    """
+    with open(path, encoding="utf-8") as f:
+        accounts = json.load(f)["accounts"]
+    base = os.path.dirname(os.path.abspath(path))
+    names = set()
+    for account in accounts:
+        name = account["name"]
+        if not re.fullmatch(r"\w+", name) or name in names:
+            raise ValueError(f"账户名只能包含字母、数字和下划线，且不能重复: {name}")
+        names.add(name)
+        if isinstance(account.get("config"), str):
+            with open(os.path.join(base, account["config"]), encoding="utf-8") as f:
+                account["config"] = json.load(f)
+        account.setdefault("config", {})
+    return accounts
+
+
+def grid_count(account):
+    """账户的网格数: 默认合约一个，加上 EXTRA_GRIDS"""
+    return 1 + len(account["config"].get("EXTRA_GRIDS", []))
+
+
+def shard(accounts, workers):
+    """按网格数把账户分配到工作进程: 网格多的账户先分配，每次分给当前网格最少的进程"""
+    shards = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for account in sorted(accounts, key=grid_count, reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(account)
+        loads[index] += grid_count(account)
+    return [accounts for accounts in shards if accounts]
+
+
+def account_config(account, data_root):
+    """账户的参数覆盖: 本地文件放在各自的目录，不单独启动监控接口(由 supervisor 汇总)，日志默认只写文件"""
+    config = dict(account["config"])
+    config.setdefault("DATA_DIR", os.path.join(data_root, account["name"]))
+    config.setdefault("LOG_CONSOLE", False)
+    config["METRICS_PORT"] = 0
+    return config
+
+
+class AccountRunner:
+    """工作进程内的一个账户
+    各自加载一份 okx-bot.py 模块(凭证、网格和全部状态互不共享)，共用进程的事件循环；
+    异常退出后等待 ACCOUNT_RESTART_DELAY 秒重新运行，不影响同一进程的其他账户
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.bot = None
+        self.running = False
+        self.restarts = 0
+        self.error = None
+        try:
+            self.bot = load_bot(f"okx_bot_{name}", config)
+        except Exception as e:
+            self.error = f"加载失败: {e!r}"
+
+    async def run(self):
+        while True:
+            self.running = True
+            try:
+                await self.bot.main()
+                self.error = "已退出"
+            except Exception as e:
+                self.error = repr(e)
+            self.running = False
+            self.restarts += 1
+            await asyncio.sleep(ACCOUNT_RESTART_DELAY)
+
+    def report(self):
+        report = {"running": self.running, "restarts": self.restarts, "error": self.error}
+        if self.bot is not None:
+            report.update(self.bot.health(), metrics=self.bot.metrics.snapshot(),
+                          prometheus=self.bot.metrics.render({"account": self.name}))
+        return report
+
+
+def worker_main(index, accounts, conn, data_root):
+    """工作进程入口: 在一个事件循环中运行分配到的全部账户"""
+    # Ctrl+C 由 supervisor 处理，再统一通知工作进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, accounts, conn, data_root))
+
+
+async def run_worker(index, accounts, conn, data_root):
+    """每 HEALTH_INTERVAL 秒通过管道上报一次各账户的状态和监控指标；收到 SIGTERM 后结束全部账户
+    supervisor 已退出(管道断开)时上报失败，工作进程随之退出
+    """
+    runners = [AccountRunner(account["name"], account_config(account, data_root)) for account in accounts]
+    tasks = [asyncio.create_task(runner.run()) for runner in runners if runner.bot is not None]
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    try:
+        while not stopping.is_set():
+            conn.send({"pid": os.getpid(), "time": time.time(),
+                       "accounts": {runner.name: runner.report() for runner in runners}})
+            try:
+                await asyncio.wait_for(stopping.wait(), HEALTH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class Worker:
+    """supervisor 中的一个工作进程: 进程句柄、上报管道、最近一次上报和重启计时"""
+
+    def __init__(self, index, accounts):
+        self.index = index
+        self.accounts = accounts
+        self.process = None
+        self.conn = None
+        self.report = None
+        self.last_report = 0
+        self.started = 0
+        self.restarts = 0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = 0
+
+    def start(self, context, data_root):
+        reader, writer = context.Pipe(duplex=False)
+        self.process = context.Process(target=worker_main, args=(self.index, self.accounts, writer, data_root),
+                                       name=f"okx-worker-{self.index}", daemon=True)
+        self.process.start()
+        writer.close()
+        self.conn = reader
+        self.started = self.last_report = time.monotonic()
+        print(f"🚀 工作进程 {self.index} 已启动: pid {self.process.pid}，账户 "
+              f"{', '.join(account['name'] for account in self.accounts)}", flush=True)
+
+    def receive(self):
+        """读取管道中的全部上报，管道断开(进程退出)时关闭"""
+        try:
+            while self.conn.poll():
+                self.report = self.conn.recv()
+                self.last_report = time.monotonic()
+        except (EOFError, OSError):
+            self.conn.close()
+            self.conn = None
+
+    def exited(self):
+        """进程已退出: 计算下次重启时间，连续崩溃时重启等待时间加倍"""
+        now = time.monotonic()
+        self.process.join()
+        print(f"⚠️ 工作进程 {self.index} 已退出: 退出码 {self.process.exitcode}", flush=True)
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if now - self.started > STABLE_SECONDS:
+            self.restart_delay = RESTART_DELAY
+        self.restart_at = now + self.restart_delay
+        self.restart_delay = min(self.restart_delay * 2, RESTART_DELAY_MAX)
+        self.restarts += 1
+        self.process = None
+        self.report = None
+
+    @property
+    def healthy(self):
+        if self.process is None or self.report is None:
+            return False
+        return all(account["running"] for account in self.report["accounts"].values())
+
+    def status(self):
+        return {
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.process is not None,
+            "restarts": self.restarts,
+            "report_age": time.monotonic() - self.last_report if self.process is not None else None,
+            "accounts": {name: {key: value for key, value in account.items() if key not in ("metrics", "prometheus")}
+                         for name, account in (self.report or {}).get("accounts", {}).items()},
+        }
+
+
+class Supervisor:
+    """多账户运行: 把账户分配到多个工作进程，监控上报、重启崩溃或卡死的进程，汇总健康状态和监控指标"""
+
+    def __init__(self, shards, data_root):
+        self.context = multiprocessing.get_context("spawn")
+        self.data_root = data_root
+        self.workers = [Worker(index, accounts) for index, accounts in enumerate(shards)]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            worker.start(self.context, self.data_root)
+        while True:
+            waitables = {}
+            for worker in self.workers:
+                if worker.conn is not None:
+                    waitables[worker.conn] = worker
+                if worker.process is not None:
+                    waitables[worker.process.sentinel] = worker
+            # 在线程中等待管道和进程退出，事件循环继续处理监控接口的请求
+            ready = await loop.run_in_executor(None, wait, list(waitables), 1.0)
+            for worker in {waitables[item] for item in ready}:
+                if worker.conn is not None:
+                    worker.receive()
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.process is not None and not worker.process.is_alive():
+                    worker.exited()
+                elif worker.process is not None and now - worker.last_report > HEALTH_TIMEOUT:
+                    print(f"❌ 工作进程 {worker.index} {HEALTH_TIMEOUT}秒未上报，结束后重启", flush=True)
+                    worker.process.kill()
+                    await loop.run_in_executor(None, worker.process.join)
+                    worker.exited()
+                elif worker.process is None and now >= worker.restart_at:
+                    worker.start(self.context, self.data_root)
+
+    async def stop(self):
+        """通知全部工作进程退出(SIGTERM)，超时未退出的强制结束"""
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in self.workers:
+            if worker.process is not None:
+                await loop.run_in_executor(None, worker.process.join, max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+    def health(self):
+        return {"healthy": all(worker.healthy for worker in self.workers),
+                "workers": {worker.index: worker.status() for worker in self.workers}}
+
+    def render(self):
+        """全部账户的 Prometheus 指标(带 account 标签)，加上各工作进程的重启次数"""
+        lines = []
+        for worker in self.workers:
+            lines.append(f'okx_supervisor_worker_restarts_total{{worker="{worker.index}"}} {worker.restarts}')
+            lines.append(f'okx_supervisor_worker_up{{worker="{worker.index}"}} {int(worker.healthy)}')
+            for name, account in (worker.report or {}).get("accounts", {}).items():
+                lines.append(f'okx_supervisor_account_restarts_total{{account="{name}"}} {account["restarts"]}')
+                lines.append(account.get("prometheus", "").rstrip("\n"))
+        return "\n".join(line for line in lines if line) + "\n"
+
+    def snapshot(self):
+        return {name: account.get("metrics") for worker in self.workers
+                for name, account in (worker.report or {}).get("accounts", {}).items()}
+
+    async def serve(self, host, port):
+        """监控接口: /health (全部账户运行中返回 200，否则 503)、/metrics 和 /metrics.json"""
+        async def handle_health(request):
+            health = self.health()
+            return aiohttp.web.json_response(health, status=200 if health["healthy"] else 503)
+
+        async def handle_metrics(request):
+            return aiohttp.web.Response(text=self.render())
+
+        async def handle_metrics_json(request):
+            return aiohttp.web.json_response(self.snapshot())
+
+        app = aiohttp.web.Application()
+        app.router.add_get("/health", handle_health)
+        app.router.add_get("/metrics", handle_metrics)
+        app.router.add_get("/metrics.json", handle_metrics_json)
+        runner = aiohttp.web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await aiohttp.web.TCPSite(runner, host, port).start()
+        print(f"📊 监控接口: http://{host}:{port}/health", flush=True)
+        return runner
+
+
+async def main(args):
+    accounts = load_accounts(args.accounts)
+    workers = args.workers or min(len(accounts), os.cpu_count() or 1)
+    shards = shard(accounts, workers)
+    print(f"\n🚀 启动多账户网格: {len(accounts)} 个账户 / {sum(map(grid_count, accounts))} 个网格，"
+          f"{len(shards)} 个工作进程\n", flush=True)
+    supervisor = Supervisor(shards, args.data_dir)
+    runner = await supervisor.serve(args.host, args.port) if args.port else None
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        await supervisor.run()
+    except asyncio.CancelledError:
+        print("\n🛑 正在停止工作进程...", flush=True)
+    finally:
+        await supervisor.stop()
+        if runner is not None:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多账户运行: 按账户列表启动多个工作进程，每个进程在一个事件循环中运行多个账户")
+    parser.add_argument("accounts", help="账户列表文件(JSON)")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数，默认取 CPU 核数(不超过账户数)")
+    parser.add_argument("--data-dir", default="accounts", help="各账户本地文件的根目录，每个账户一个子目录")
+    parser.add_argument("--host", default="127.0.0.1", help="监控接口地址")
+    parser.add_argument("--port", type=int, default=9100, help="监控接口端口，0 表示不启动")
+    asyncio.run(main(parser.parse_args()))